@@ -0,0 +1,74 @@
+"""
+Benchmark: query embedding latency and throughput with and without micro-batching.
+
+Every request embeds a distinct question (the embedding cache is bypassed), issued
+by N concurrent clients. Reports p50/p99 latency and questions/sec per concurrency level.
+Run from the backend directory:  python bench_query_batching.py [requests_per_level]
+"""
+import sys
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from embedding_registry import get_embeddings
+from query_batcher import MicroBatcher
+
+CONCURRENCY_LEVELS = [1, 4, 16, 64]
+QUESTIONS = [
+    "What is the invoice number?",
+    "Who is the customer on invoice {n}?",
+    "What is the due date for order {n}?",
+    "What is the total amount including tax for bill {n}?",
+    "Which email address is listed for vendor {n}?",
+]
+
+
+def percentile(samples, q):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * q))]
+
+
+async def run_level(embed_one, concurrency, total):
+    latencies = []
+    counter = iter(range(total))
+
+    async def client():
+        for n in counter:
+            question = QUESTIONS[n % len(QUESTIONS)].format(n=n)
+            start = time.perf_counter()
+            await embed_one(question)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[client() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - start
+    return {
+        "p50_ms": percentile(latencies, 0.50),
+        "p99_ms": percentile(latencies, 0.99),
+        "qps": total / elapsed,
+    }
+
+
+async def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 256
+    embeddings = get_embeddings()
+    embeddings.embed_query("warm up")
+    executor = ThreadPoolExecutor(max_workers=2)
+    loop = asyncio.get_running_loop()
+
+    async def unbatched(question):
+        return await loop.run_in_executor(executor, embeddings.embed_query, question)
+
+    batcher = MicroBatcher(embeddings.embed_documents, executor=executor)
+
+    print(f"--- [BENCH] {total} distinct questions per level ---")
+    print(f"{'clients':>8} | {'mode':>9} | {'p50 ms':>8} | {'p99 ms':>8} | {'q/s':>8}")
+    for concurrency in CONCURRENCY_LEVELS:
+        for mode, embed_one in (("single", unbatched), ("batched", batcher.submit)):
+            r = await run_level(embed_one, concurrency, total)
+            print(f"{concurrency:>8} | {mode:>9} | {r['p50_ms']:>8.2f} | {r['p99_ms']:>8.2f} | {r['qps']:>8.1f}")
+    print(f"--- [BENCH] Batcher: {batcher.stats()} ---")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
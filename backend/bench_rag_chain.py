@@ -0,0 +1,49 @@
+"""
+Microbenchmark: per-query setup cost of rebuilding the retriever + LCEL chain
+versus reusing the prepared objects from rag.get_rag_chain.
+
+Only the setup is timed; no embedding, Qdrant search or LLM call is made.
+Run from the backend directory:  python bench_rag_chain.py [iterations]
+"""
+import sys
+import time
+import statistics
+
+import rag
+
+FOLDERS = ["All", "default", "invoice"]
+
+
+def bench(fn, iterations):
+    samples = []
+    for i in range(iterations):
+        folder = FOLDERS[i % len(FOLDERS)]
+        start = time.perf_counter()
+        fn(folder)
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        "mean_ms": statistics.mean(samples),
+        "p50_ms": samples[len(samples) // 2],
+        "p99_ms": samples[min(len(samples) - 1, int(len(samples) * 0.99))],
+    }
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+    # Warm up: load the embedding model and open the Qdrant client once
+    rag.build_rag_chain("All")
+    rag.get_rag_chain("All")
+
+    rebuilt = bench(rag.build_rag_chain, iterations)
+    prepared = bench(rag.get_rag_chain, iterations)
+
+    print(f"--- [BENCH] {iterations} iterations over folders {FOLDERS} ---")
+    print(f"Rebuild per query : mean {rebuilt['mean_ms']:.3f} ms | p50 {rebuilt['p50_ms']:.3f} ms | p99 {rebuilt['p99_ms']:.3f} ms")
+    print(f"Prepared (cached) : mean {prepared['mean_ms']:.3f} ms | p50 {prepared['p50_ms']:.3f} ms | p99 {prepared['p99_ms']:.3f} ms")
+    print(f"Saved per query   : {rebuilt['mean_ms'] - prepared['mean_ms']:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
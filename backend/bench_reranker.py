@@ -0,0 +1,127 @@
+"""
+Benchmark: retrieval quality vs latency, dense top-k alone and dense candidates + cross-encoder rerank.
+
+Pages of the bundled synthetic PDFs are split with the ingestion splitter and embedded
+into an in-memory index (no Qdrant, no LLM). Each sampled page yields a question built
+from two of its "Key: Value" fields; a hit means a chunk of that page made the final
+context. Unrelated questions check how often the score threshold would skip the LLM.
+Run from the backend directory:  python bench_reranker.py [questions]
+"""
+import re
+import sys
+import time
+import random
+import statistics
+
+import numpy as np
+
+from ingestion import load_document, get_text_splitter
+from embedding_registry import get_embeddings
+from reranker import Reranker, RERANK_CANDIDATES, RERANK_MIN_SCORE
+from context import count_tokens
+
+PDFS = ["synthetic_data_1000.pdf", "synthetic_mixed_data_1000.pdf"]
+TOP_K = 3
+FIELD_RE = re.compile(r"^([A-Za-z][A-Za-z ]{1,30}):\s*(\S.{1,60})$")
+SKIP_KEYS = {"document id", "page", "date"}
+UNRELATED = [
+    "What is the capital of France?",
+    "How do I bake sourdough bread?",
+    "Who won the 1998 football world cup?",
+    "Explain the theory of relativity.",
+    "What is the boiling point of water on Mars?",
+]
+
+
+def build_questions(chunks, n, seed=7):
+    by_page = {}
+    for i, doc in enumerate(chunks):
+        by_page.setdefault((doc.metadata.get("source"), doc.metadata.get("page")), []).append(i)
+    rng = random.Random(seed)
+    questions = []
+    pages = list(by_page.items())
+    rng.shuffle(pages)
+    for page_key, idxs in pages:
+        fields = []
+        for i in idxs:
+            for line in chunks[i].page_content.splitlines():
+                m = FIELD_RE.match(line.strip())
+                if m and m.group(1).strip().lower() not in SKIP_KEYS:
+                    fields.append((m.group(1).strip(), m.group(2).strip()))
+        if len(fields) < 2:
+            continue
+        (k1, _), (_, v2) = rng.sample(fields, 2)
+        questions.append((f"What is the {k1} for {v2}?", set(idxs)))
+        if len(questions) >= n:
+            break
+    return questions
+
+
+def percentile(samples, q):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * q))]
+
+
+def summarize(name, latencies, ranks, tokens):
+    hits = sum(1 for r in ranks if r is not None)
+    mrr = statistics.mean(1.0 / r if r else 0.0 for r in ranks)
+    print(
+        f"{name:>16} | {hits / len(ranks):>6.1%} | {mrr:>5.3f} | {percentile(latencies, 0.5):>7.1f} | "
+        f"{percentile(latencies, 0.99):>7.1f} | {statistics.mean(tokens):>7.0f}"
+    )
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    chunks = []
+    splitter = get_text_splitter()
+    for pdf in PDFS:
+        chunks.extend(splitter.split_documents(load_document(pdf)))
+    print(f"--- [BENCH] {len(chunks)} chunks from {len(PDFS)} PDFs ---")
+
+    embeddings = get_embeddings()
+    matrix = np.asarray(embeddings.embed_documents([c.page_content for c in chunks]), dtype=np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    # Benchmarked whether or not RERANK_ENABLED turns it on for the app
+    reranker = Reranker()
+    reranker.score("warm up", ["warm up"])
+
+    def dense(question, k):
+        q = np.asarray(embeddings.embed_query(question), dtype=np.float32)
+        scores = matrix @ (q / np.linalg.norm(q))
+        return list(np.argsort(-scores)[:k])
+
+    questions = build_questions(chunks, n)
+    print(f"--- [BENCH] {len(questions)} questions, top {TOP_K}, {RERANK_CANDIDATES} rerank candidates ---")
+    print(f"{'mode':>16} | {'hit@3':>6} | {'MRR':>5} | {'p50 ms':>7} | {'p99 ms':>7} | {'tokens':>7}")
+
+    results = {"dense": ([], [], []), "dense+rerank": ([], [], [])}
+    for question, relevant in questions:
+        start = time.perf_counter()
+        top = dense(question, TOP_K)
+        latency = (time.perf_counter() - start) * 1000
+        lat, ranks, tokens = results["dense"]
+        lat.append(latency)
+        ranks.append(next((r + 1 for r, i in enumerate(top) if i in relevant), None))
+        tokens.append(sum(count_tokens(chunks[i].page_content) for i in top))
+
+        start = time.perf_counter()
+        candidates = dense(question, RERANK_CANDIDATES)
+        kept = reranker.rerank(question, [chunks[i] for i in candidates], top_k=TOP_K)
+        latency = (time.perf_counter() - start) * 1000
+        kept_ids = [next(i for i in candidates if chunks[i] is doc) for doc in kept]
+        lat, ranks, tokens = results["dense+rerank"]
+        lat.append(latency)
+        ranks.append(next((r + 1 for r, i in enumerate(kept_ids) if i in relevant), None))
+        tokens.append(sum(count_tokens(chunks[i].page_content) for i in kept_ids))
+
+    for name, (lat, ranks, tokens) in results.items():
+        summarize(name, lat, ranks, tokens)
+
+    skipped = sum(1 for q in UNRELATED if not reranker.rerank(q, [chunks[i] for i in dense(q, RERANK_CANDIDATES)], top_k=TOP_K))
+    print(f"--- [BENCH] Unrelated questions skipped by threshold {RERANK_MIN_SCORE}: {skipped}/{len(UNRELATED)} ---")
+    print(f"--- [BENCH] Reranker: {reranker.stats()} ---")
+
+
+if __name__ == "__main__":
+    main()
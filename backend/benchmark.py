@@ -0,0 +1,388 @@
+"""
+Benchmark suite: ingestion and query throughput, written to JSON so runs can be compared.
+
+Runs over the bundled synthetic PDFs plus a scanned PDF generated from their text
+(pages rendered to images, no text layer). Everything happens in a throwaway directory:
+an embedded Qdrant, keyword index and manifest of its own, the OCR cache switched off
+so OCR is really measured, and the local fake Ollama standing in for the LLM.
+
+    text_extract  text-layer pages/sec (pdfplumber)
+    ocr           scanned pages/sec through the OCR pool
+    split         chunks/sec through the ingestion splitter
+    embed         chunks/sec through the embedding engine
+    upsert        points/sec into Qdrant via BulkWriter (last batch waits for indexing)
+    retrieve      aretrieve latency p50/p99 (hybrid search + rerank, cold caches)
+    query         end-to-end aquery_rag latency p50/p99 with the fake LLM
+
+Run from the backend directory:
+    python benchmark.py --output bench.json
+    python benchmark.py --output new.json --compare bench.json   # exit 1 on regression
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import platform
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime, timezone
+
+from fake_ollama import serve_fake_ollama
+
+PDFS = ["synthetic_data_1000.pdf", "synthetic_mixed_data_1000.pdf"]
+FOLDER = "bench"
+VECTOR_SIZE = 384  # all-MiniLM-L6-v2
+# A4 at 150 dpi: the resolution a typical office scanner produces
+SCAN_SIZE = (1240, 1754)
+SCAN_DPI = 150
+SCAN_FONT_SIZE = 28
+
+# (result path, direction) checked by --compare
+COMPARED = [
+    ("text_extract.pages_per_sec", "higher"),
+    ("ocr.pages_per_sec", "higher"),
+    ("split.chunks_per_sec", "higher"),
+    ("embed.chunks_per_sec", "higher"),
+    ("upsert.points_per_sec", "higher"),
+    ("retrieve.p50_ms", "lower"),
+    ("retrieve.p99_ms", "lower"),
+    ("query.p50_ms", "lower"),
+    ("query.p99_ms", "lower"),
+]
+
+
+def isolate(workdir, ollama_url):
+    """Point every store at workdir before the backend modules read their config."""
+    os.environ["QDRANT_BACKEND"] = "local"
+    os.environ.pop("QDRANT_URL", None)
+    os.environ["QDRANT_PATH"] = os.path.join(workdir, "qdrant_db")
+    os.environ["KEYWORD_INDEX_PATH"] = os.path.join(workdir, "keyword_index.db")
+    os.environ["MANIFEST_PATH"] = os.path.join(workdir, "manifest.db")
+    os.environ["OCR_CACHE_ENABLED"] = "0"
+    os.environ["OLLAMA_BASE_URL"] = ollama_url
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+
+def rate(count, seconds):
+    return round(count / seconds, 2) if seconds > 0 else None
+
+
+def latency_summary(samples_ms):
+    from bench_reranker import percentile
+    return {
+        "count": len(samples_ms),
+        "p50_ms": round(percentile(samples_ms, 0.50), 2),
+        "p99_ms": round(percentile(samples_ms, 0.99), 2),
+        "mean_ms": round(sum(samples_ms) / len(samples_ms), 2),
+    }
+
+
+def git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5)
+        return out.stdout.strip() or None
+    except Exception:
+        return None
+
+
+def load_font():
+    from PIL import ImageFont
+    try:
+        return ImageFont.load_default(size=SCAN_FONT_SIZE)
+    except TypeError:
+        # Pillow < 10.1 only has the small bitmap font
+        return ImageFont.load_default()
+
+
+def make_scanned_pdf(pages, path):
+    """Render page texts to greyscale images and save them as an image-only PDF."""
+    from PIL import Image, ImageDraw
+
+    font = load_font()
+    line_height = SCAN_FONT_SIZE + 10
+    images = []
+    for text in pages:
+        image = Image.new("L", SCAN_SIZE, 255)
+        draw = ImageDraw.Draw(image)
+        y = 80
+        for line in text.splitlines():
+            if y > SCAN_SIZE[1] - 80:
+                break
+            draw.text((80, y), line, fill=0, font=font)
+            y += line_height
+        images.append(image)
+    images[0].save(path, "PDF", resolution=SCAN_DPI, save_all=True, append_images=images[1:])
+    return path
+
+
+def word_recall(expected, actual):
+    """Share of the source words the OCR output got back (a cheap accuracy guard)."""
+    want = expected.split()
+    if not want:
+        return None
+    got = set(actual.split())
+    return round(sum(1 for w in want if w in got) / len(want), 4)
+
+
+def bench_text_extract():
+    from ingestion import iter_pdf_text_pages
+
+    docs = []
+    start = time.perf_counter()
+    for pdf in PDFS:
+        docs.extend(iter_pdf_text_pages(pdf))
+    elapsed = time.perf_counter() - start
+    return docs, {"pages": len(docs), "seconds": round(elapsed, 3), "pages_per_sec": rate(len(docs), elapsed)}
+
+
+def bench_ocr(docs, num_pages, workdir):
+    from ocr_pool import iter_ocr_pages, get_ocr_pool, OCR_WORKERS, OCR_CHUNK_SIZE
+
+    sources = [doc.page_content for doc in docs if doc.page_content.strip()][:num_pages]
+    path = make_scanned_pdf(sources, os.path.join(workdir, "scanned.pdf"))
+
+    # Start the pool and load an OCR engine in every worker outside the timed region
+    if OCR_WORKERS > 1 and len(sources) > OCR_CHUNK_SIZE:
+        pool = get_ocr_pool(OCR_WORKERS)
+        for future in [pool.submit(os.getpid) for _ in range(OCR_WORKERS)]:
+            future.result()
+    else:
+        for _ in iter_ocr_pages(path, 1, workers=1):
+            pass
+
+    texts = {}
+    start = time.perf_counter()
+    for i, text in iter_ocr_pages(path, len(sources), workers=OCR_WORKERS):
+        texts[i] = text
+    elapsed = time.perf_counter() - start
+    recalls = [r for r in (word_recall(src, texts.get(i, "")) for i, src in enumerate(sources)) if r is not None]
+    return {
+        "pages": len(sources),
+        "workers": OCR_WORKERS,
+        "seconds": round(elapsed, 3),
+        "pages_per_sec": rate(len(sources), elapsed),
+        "word_recall": round(sum(recalls) / len(recalls), 4) if recalls else None,
+    }
+
+
+def bench_split(docs):
+    from ingestion import get_text_splitter
+
+    splitter = get_text_splitter()
+    start = time.perf_counter()
+    chunks = splitter.split_documents(docs)
+    elapsed = time.perf_counter() - start
+    return chunks, {"chunks": len(chunks), "seconds": round(elapsed, 3), "chunks_per_sec": rate(len(chunks), elapsed)}
+
+
+def bench_embed(chunks):
+    from embedding_engine import get_embedding_engine
+    from ingestion import INGEST_BATCH_SIZE
+
+    engine = get_embedding_engine()
+    engine.embed(["warm up"])
+    texts = [chunk.page_content for chunk in chunks]
+    parts = []
+    start = time.perf_counter()
+    for i in range(0, len(texts), INGEST_BATCH_SIZE):
+        parts.append(engine.embed(texts[i:i + INGEST_BATCH_SIZE]))
+    elapsed = time.perf_counter() - start
+    vectors = [vec for part in parts for vec in part]
+    return vectors, {"chunks": len(texts), "seconds": round(elapsed, 3), "chunks_per_sec": rate(len(texts), elapsed)}
+
+
+def bench_upsert(chunks, vectors):
+    from qdrant_client.http import models
+    from database import get_qdrant_client, get_bulk_qdrant_client, collection_config, BulkWriter
+    from ingestion import COLLECTION_NAME, assign_chunk_ids, chunk_to_point
+    from keyword_index import get_keyword_index
+
+    client = get_qdrant_client()
+    client.create_collection(collection_name=COLLECTION_NAME, **collection_config(VECTOR_SIZE))
+    for field in ("metadata.folder", "metadata.source"):
+        client.create_payload_index(
+            collection_name=COLLECTION_NAME, field_name=field, field_schema=models.PayloadSchemaType.KEYWORD
+        )
+
+    points = []
+    keyword_rows = {}
+    seen = set()
+    for chunk, vector in zip(chunks, vectors):
+        chunk.metadata["folder"] = FOLDER
+        source = chunk.metadata.get("source")
+        for point_id, doc in assign_chunk_ids([chunk], FOLDER, source, seen):
+            points.append(chunk_to_point(point_id, doc, vector))
+            keyword_rows.setdefault(source, []).append((point_id, doc.page_content))
+
+    writer = BulkWriter(get_bulk_qdrant_client(), COLLECTION_NAME)
+    start = time.perf_counter()
+    try:
+        writer.add(points)
+        written = writer.flush()
+    finally:
+        writer.close()
+    elapsed = time.perf_counter() - start
+
+    keyword_index = get_keyword_index()
+    if keyword_index is not None:
+        for source, rows in keyword_rows.items():
+            keyword_index.add(FOLDER, source, rows)
+
+    return {
+        "points": written,
+        "batch_size": writer.batch_size,
+        "parallel": writer.parallel,
+        "seconds": round(elapsed, 3),
+        "points_per_sec": rate(written, elapsed),
+    }
+
+
+async def run_queries(fn, questions, concurrency):
+    latencies = []
+    pending = iter(questions)
+
+    async def client():
+        for question in pending:
+            start = time.perf_counter()
+            await fn(question, FOLDER)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[client() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - start
+    return dict(latency_summary(latencies), concurrency=concurrency, qps=rate(len(latencies), elapsed))
+
+
+def bench_queries(chunks, num_queries, concurrency):
+    import rag
+    from bench_reranker import build_questions
+
+    questions = [q for q, _ in build_questions(chunks, num_queries * 2)]
+    # Separate question sets so the query pass starts with a cold embedding cache too
+    retrieve_questions, query_questions = questions[0::2], questions[1::2]
+
+    async def run():
+        await rag.aretrieve("warm up", FOLDER)
+        retrieved = await run_queries(rag.aretrieve, retrieve_questions, concurrency)
+        answered = await run_queries(rag.aquery_rag, query_questions, concurrency)
+        return retrieved, answered
+
+    return asyncio.run(run())
+
+
+def lookup(results, path):
+    value = results.get("stages", {})
+    for key in path.split("."):
+        if not isinstance(value, dict) or key not in value:
+            return None
+        value = value[key]
+    return value
+
+
+def compare(results, baseline, tolerance):
+    """Print old vs new for the headline numbers; return the regressions beyond tolerance."""
+    regressions = []
+    print(f"{'metric':>28} | {'baseline':>10} | {'current':>10} | {'change':>8}")
+    for path, direction in COMPARED:
+        old, new = lookup(baseline, path), lookup(results, path)
+        if not old or new is None:
+            continue
+        change = (new - old) / old
+        worse = change < -tolerance if direction == "higher" else change > tolerance
+        if worse:
+            regressions.append(path)
+        print(f"{path:>28} | {old:>10.2f} | {new:>10.2f} | {change:>+7.1%}{'  REGRESSION' if worse else ''}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingestion and query benchmark")
+    parser.add_argument("--output", default="benchmark_results.json", help="where to write the JSON results")
+    parser.add_argument("--compare", help="baseline JSON from an earlier run")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed relative slowdown before failing")
+    parser.add_argument("--scanned-pages", type=int, default=20, help="pages in the generated scanned PDF (0 skips OCR)")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--ttft-ms", type=float, default=50, help="fake LLM time to first token")
+    parser.add_argument("--token-ms", type=float, default=5, help="fake LLM time per token")
+    parser.add_argument("--tokens", type=int, default=24, help="fake LLM tokens per answer")
+    parser.add_argument("--keep", action="store_true", help="keep the scratch directory")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="ocr_bench_")
+    server, _ = serve_fake_ollama(0, ttft_ms=args.ttft_ms, token_ms=args.token_ms, tokens=args.tokens, parallel=4)
+    isolate(workdir, f"http://127.0.0.1:{server.server_address[1]}")
+
+    from ocr_pool import OCR_WORKERS
+    from embedding_engine import EMBED_BATCH_SIZE
+    from ingestion import INGEST_BATCH_SIZE
+    from database import QDRANT_UPSERT_BATCH, QDRANT_UPSERT_PARALLEL, QDRANT_QUANTIZATION
+    from rag import HYBRID_SEARCH, RETRIEVAL_K
+    from reranker import RERANK_ENABLED
+    from context import CONTEXT_TOKEN_BUDGET
+
+    results = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "config": {
+            "ocr_workers": OCR_WORKERS,
+            "embed_batch_size": EMBED_BATCH_SIZE,
+            "ingest_batch_size": INGEST_BATCH_SIZE,
+            "upsert_batch": QDRANT_UPSERT_BATCH,
+            "upsert_parallel": QDRANT_UPSERT_PARALLEL,
+            "quantization": QDRANT_QUANTIZATION,
+            "hybrid_search": HYBRID_SEARCH,
+            "rerank": RERANK_ENABLED,
+            "retrieval_k": RETRIEVAL_K,
+            "context_token_budget": CONTEXT_TOKEN_BUDGET,
+            "fake_llm": {"ttft_ms": args.ttft_ms, "token_ms": args.token_ms, "tokens": args.tokens},
+        },
+        "stages": {},
+    }
+    stages = results["stages"]
+
+    try:
+        print(f"--- [BENCH] Scratch directory {workdir} ---")
+        docs, stages["text_extract"] = bench_text_extract()
+        print(f"--- [BENCH] text_extract: {stages['text_extract']} ---")
+        if args.scanned_pages > 0:
+            stages["ocr"] = bench_ocr(docs, args.scanned_pages, workdir)
+            print(f"--- [BENCH] ocr: {stages['ocr']} ---")
+        chunks, stages["split"] = bench_split(docs)
+        print(f"--- [BENCH] split: {stages['split']} ---")
+        vectors, stages["embed"] = bench_embed(chunks)
+        print(f"--- [BENCH] embed: {stages['embed']} ---")
+        stages["upsert"] = bench_upsert(chunks, vectors)
+        print(f"--- [BENCH] upsert: {stages['upsert']} ---")
+        stages["retrieve"], stages["query"] = bench_queries(chunks, args.queries, args.concurrency)
+        print(f"--- [BENCH] retrieve: {stages['retrieve']} ---")
+        print(f"--- [BENCH] query: {stages['query']} ---")
+    finally:
+        server.shutdown()
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"--- [BENCH] Results written to {args.output} ---")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"--- [BENCH] {len(regressions)} regression(s) beyond {args.tolerance:.0%}: {', '.join(regressions)} ---")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,49 @@
+"""
+Check which questions take the identifier fast path in rag.retrieve (keyword hits only,
+no query embedding). Lookups of codes, emails and dates must; prose, including short
+numeric questions, must not.
+
+Run from the backend directory:  python check_identifier_query.py
+"""
+import sys
+
+from keyword_index import is_identifier_query
+
+IDENTIFIER = [
+    "INV-2024-001",
+    "invoice inv-2024-001",
+    "INV2024?",
+    "info@company.com",
+    "02-17-2025",
+    "due 2024/01/05",
+    "order_id 42",
+    "A1B2C3",
+]
+PROSE = [
+    "what is 2+2",
+    "what is 2+2?",
+    "2 + 2",
+    "500",
+    "total is 500",
+    "pi is 3.14",
+    "my 2nd invoice",
+    "weighs 5kg",
+    "a well-known fact",
+    "what is the total amount due on the invoice",
+    "",
+]
+
+
+def main():
+    failures = [q for q in IDENTIFIER if not is_identifier_query(q)]
+    failures += [q for q in PROSE if is_identifier_query(q)]
+    print(f"--- [CHECK] {len(IDENTIFIER)} identifier and {len(PROSE)} prose questions ---")
+    for q in failures:
+        expected = "identifier" if q in IDENTIFIER else "prose"
+        print(f"FAILURE: {q!r} should be treated as {expected}")
+    print("SUCCESS: only identifier lookups take the keyword fast path." if not failures else "FAILURE")
+    return not failures
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
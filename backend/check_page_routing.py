@@ -0,0 +1,117 @@
+"""
+Check per-page OCR routing on a generated mixed PDF.
+
+Interleaves text-layer pages from synthetic_data_1000.pdf with image-only copies of
+the same pages (benchmark.make_scanned_pdf) and runs them through iter_page_documents.
+Text pages must come straight from the text layer, scanned pages must be OCR'd, and
+progress must climb to the full page count without going backwards.
+
+Run from the backend directory:
+    python check_page_routing.py
+"""
+import os
+import sys
+import shutil
+import tempfile
+
+# Really OCR the scanned pages rather than reading a previous run's cache
+os.environ["OCR_CACHE_ENABLED"] = "0"
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from pypdf import PdfReader, PdfWriter
+from benchmark import make_scanned_pdf, word_recall
+from ingestion import iter_pdf_pages, iter_page_documents, page_needs_ocr, PAGE_SCAN_MIN_TEXT_CHARS
+
+SOURCE_PDF = "synthetic_data_1000.pdf"
+# "t" = text-layer page, "s" = scanned (image-only) page
+LAYOUT = "tsttsst"
+# Long lines are clipped at the edge of the rendered scan, so this is only a sanity floor
+MIN_RECALL = 0.3
+
+
+def make_mixed_pdf(workdir):
+    """Build the LAYOUT document; returns (path, expected text per page)."""
+    source = PdfReader(SOURCE_PDF)
+    texts = [source.pages[i].extract_text() or "" for i in range(len(LAYOUT))]
+    scanned = PdfReader(make_scanned_pdf(texts, os.path.join(workdir, "scanned.pdf")))
+
+    writer = PdfWriter()
+    for i, kind in enumerate(LAYOUT):
+        writer.add_page(source.pages[i] if kind == "t" else scanned.pages[i])
+    path = os.path.join(workdir, "mixed.pdf")
+    with open(path, "wb") as f:
+        writer.write(f)
+    return path, texts
+
+
+def check_rules():
+    """page_needs_ocr on its own: images are the trigger, text-layer length the veto."""
+    failures = []
+    cases = [
+        (("x" * 500, False, 0.0), False),  # plain text page
+        (("", False, 0.0), False),  # blank page, nothing to OCR
+        (("", True, 1.0), True),  # full-page scan
+        (("Page 3", True, 0.1), True),  # small image, next to no text
+        (("x" * 150, True, 0.1), False),  # logo on a text page
+        (("x" * 150, True, 0.9), PAGE_SCAN_MIN_TEXT_CHARS > 150),  # scan with a thin OCR'd layer
+    ]
+    for args, expected in cases:
+        if page_needs_ocr(*args) != expected:
+            failures.append(f"page_needs_ocr(len={len(args[0])}, images={args[1]}, coverage={args[2]}) != {expected}")
+    return failures
+
+
+def check_document(path, texts):
+    failures = []
+    scanned = [i for i, kind in enumerate(LAYOUT) if kind == "s"]
+
+    routed = [i for i, (_, needs_ocr) in enumerate(iter_pdf_pages(path)) if needs_ocr]
+    print(f"--- [CHECK] Routed to OCR: {routed} (scanned pages {scanned}) ---")
+    if routed != scanned:
+        failures.append(f"iter_pdf_pages routed {routed}, expected {scanned}")
+
+    progress = []
+    state = {}
+    docs = list(iter_page_documents(path, progress_callback=lambda done, total: progress.append((done, total)), state=state))
+    by_page = {doc.metadata["page"]: doc for doc in docs}
+    print(f"--- [CHECK] state={state}, progress={progress} ---")
+
+    if state.get("ocr_pages") != len(scanned):
+        failures.append(f"state['ocr_pages'] = {state.get('ocr_pages')}, expected {len(scanned)}")
+    if sorted(by_page) != list(range(len(LAYOUT))):
+        failures.append(f"pages yielded {sorted(by_page)}, expected every page")
+    for i, kind in enumerate(LAYOUT):
+        doc = by_page.get(i)
+        if doc is None:
+            continue
+        if doc.metadata.get("ocr_processed") != (kind == "s"):
+            failures.append(f"page {i} ({kind}): ocr_processed={doc.metadata.get('ocr_processed')}")
+        if kind == "s":
+            recall = word_recall(texts[i], doc.page_content)
+            print(f"--- [CHECK] Page {i} OCR word recall: {recall} ---")
+            if recall is not None and recall < MIN_RECALL:
+                failures.append(f"page {i}: OCR word recall {recall} < {MIN_RECALL}")
+
+    if [done for done, _ in progress] != sorted(done for done, _ in progress):
+        failures.append("progress went backwards")
+    if not progress or progress[-1] != (len(LAYOUT), len(LAYOUT)) or {total for _, total in progress} != {len(LAYOUT)}:
+        failures.append(f"progress should finish at {len(LAYOUT)}/{len(LAYOUT)} against one total")
+    return failures
+
+
+def main():
+    workdir = tempfile.mkdtemp(prefix="check_routing_")
+    try:
+        path, texts = make_mixed_pdf(workdir)
+        failures = check_rules() + check_document(path, texts)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    for failure in failures:
+        print(f"FAILURE: {failure}")
+    print("SUCCESS: text pages skipped OCR and scanned pages were OCR'd." if not failures else "FAILURE")
+    return not failures
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
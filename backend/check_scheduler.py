@@ -0,0 +1,61 @@
+"""
+Exercise the generation scheduler against the local fake Ollama server.
+
+Fires a burst of prompts from several folders (with duplicates) through a real
+langchain Ollama client and checks that the model server never sees more than
+LLM_MAX_INFLIGHT concurrent generations and that duplicates were shared.
+"""
+import sys
+import time
+import asyncio
+import urllib.request
+import json
+
+from langchain_community.llms import Ollama
+from fake_ollama import serve_fake_ollama
+from generation_scheduler import GenerationScheduler
+
+PORT = 11436
+MAX_INFLIGHT = 2
+
+
+async def main():
+    server, config = serve_fake_ollama(PORT, ttft_ms=50, token_ms=5, tokens=8, parallel=8)
+    llm = Ollama(model=config.model, base_url=f"http://127.0.0.1:{PORT}")
+    scheduler = GenerationScheduler(max_inflight=MAX_INFLIGHT)
+
+    async def ask(folder, n, priority=1):
+        prompt = f"[{folder}] question {n}"
+        start = time.perf_counter()
+        await scheduler.submit(prompt, lambda: llm.ainvoke(prompt), tenant=folder, priority=priority)
+        return folder, (time.perf_counter() - start) * 1000
+
+    jobs = []
+    jobs += [ask("invoice", n) for n in range(12)]
+    jobs += [ask("hotel", n) for n in range(3)]
+    jobs += [ask("invoice", n) for n in range(4)]  # duplicates of in-flight prompts
+    jobs += [ask("files", 0, priority=0)]
+    results = await asyncio.gather(*jobs)
+
+    server_stats = json.loads(urllib.request.urlopen(f"http://127.0.0.1:{PORT}/stats").read())
+    server.shutdown()
+
+    for folder in ("invoice", "hotel", "files"):
+        latencies = [ms for f, ms in results if f == folder]
+        print(f"--- [CHECK] {folder:8s} {len(latencies):3d} requests, mean latency {sum(latencies) / len(latencies):.0f} ms ---")
+    print(f"--- [CHECK] Scheduler: {scheduler.stats()} ---")
+    print(f"--- [CHECK] Fake server: {server_stats} ---")
+
+    ok = True
+    if server_stats["peak_active"] > MAX_INFLIGHT:
+        print(f"FAILURE: model server saw {server_stats['peak_active']} concurrent generations (cap {MAX_INFLIGHT})")
+        ok = False
+    if server_stats["requests"] != 16:
+        print(f"FAILURE: expected 16 generations after dedup, server saw {server_stats['requests']}")
+        ok = False
+    print("SUCCESS: scheduler respected the cap and shared duplicate prompts." if ok else "FAILURE")
+    return ok
+
+
+if __name__ == "__main__":
+    sys.exit(0 if asyncio.run(main()) else 1)
@@ -0,0 +1,164 @@
+import os
+import re
+import threading
+from collections import deque
+
+# Configuration
+# Token budget for the CONTEXT section of the prompt (the rules block is extra)
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", 600))
+# Longest overlap looked for between chunks of the same source (the splitter overlaps by up to 100 chars)
+CONTEXT_MAX_OVERLAP = 200
+# Shorter matches are treated as coincidence, not splitter overlap
+CONTEXT_MIN_OVERLAP = 20
+# Don't bother appending a truncated chunk with less room than this
+CONTEXT_MIN_TAIL_TOKENS = 32
+# Recent per-request prompt sizes kept for /debug/context/
+PROMPT_SAMPLES = 1000
+
+# OCR noise: runs of punctuation/box-drawing debris, stray single symbols, control chars
+_NOISE_RUN_RE = re.compile(r"[^\w\s$€£%@.,:;/()#&+\-]{2,}|[._\-=~*]{4,}")
+_STRAY_SYMBOL_RE = re.compile(r"(?<!\S)[^\w\s$€£%@#&:\-](?!\S)")
+_CONTROL_RE = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f\x7f]")
+_SPACES_RE = re.compile(r"[ \t]{2,}")
+_ROUGH_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+try:
+    import tiktoken
+    # BPE close to the Llama 3 tokenizer (both ~100k+ vocab byte-level BPE)
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    _encoding = None
+
+
+def count_tokens(text):
+    """Token count for the LLM prompt (tiktoken if installed, otherwise a word/punctuation estimate)."""
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    # Long words split into several BPE pieces; ~1.3 tokens per word/punctuation mark
+    return max(1, int(len(_ROUGH_TOKEN_RE.findall(text)) * 1.3))
+
+
+def clean_ocr_text(text):
+    """Drop OCR debris (symbol runs, stray glyphs, empty lines) while keeping values like $1,200.00 or 02-17-2025."""
+    text = _CONTROL_RE.sub("", text)
+    lines = []
+    for line in text.splitlines():
+        line = _NOISE_RUN_RE.sub(" ", line)
+        line = _STRAY_SYMBOL_RE.sub(" ", line)
+        line = _SPACES_RE.sub(" ", line).strip()
+        if any(ch.isalnum() for ch in line):
+            lines.append(line)
+    return "\n".join(lines)
+
+
+def _overlap(a, b):
+    """Length of the longest suffix of a that is also a prefix of b."""
+    longest = min(len(a), len(b), CONTEXT_MAX_OVERLAP)
+    for size in range(longest, CONTEXT_MIN_OVERLAP - 1, -1):
+        if a.endswith(b[:size]):
+            return size
+    return 0
+
+
+def _truncate(text, max_tokens):
+    """Cut text to roughly max_tokens, preferring a line, then a word boundary."""
+    if count_tokens(text) <= max_tokens:
+        return text
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if count_tokens(text[:mid]) <= max_tokens:
+            lo = mid
+        else:
+            hi = mid - 1
+    cut = text[:lo]
+    boundary = max(cut.rfind("\n"), cut.rfind(" "))
+    return cut[:boundary] if boundary > len(cut) // 2 else cut
+
+
+def assemble_context(docs, token_budget=CONTEXT_TOKEN_BUDGET):
+    """
+    Build the CONTEXT string from ranked chunks: strip OCR noise, remove text repeated
+    between overlapping chunks of the same source, and stop at token_budget.
+    Returns (context_str, stats).
+    """
+    kept = []  # (source, text)
+    used = 0
+    overlap_chars = 0
+    truncated = False
+    for doc in docs:
+        source = doc.metadata.get("source")
+        text = clean_ocr_text(doc.page_content)
+        for other_source, other in kept:
+            if other_source != source or not text:
+                continue
+            if text in other:
+                text = ""
+                break
+            head = _overlap(other, text)
+            if head:
+                text = text[head:].lstrip()
+                overlap_chars += head
+            tail = _overlap(text, other)
+            if tail:
+                text = text[:-tail].rstrip()
+                overlap_chars += tail
+        if not text:
+            continue
+
+        tokens = count_tokens(text)
+        if used + tokens > token_budget:
+            room = token_budget - used
+            if room >= CONTEXT_MIN_TAIL_TOKENS or not kept:
+                text = _truncate(text, max(room, 1))
+                kept.append((source, text))
+                used += count_tokens(text)
+            truncated = True
+            break
+        kept.append((source, text))
+        used += tokens
+
+    context_str = "\n\n".join(text for _, text in kept)
+    return context_str, {
+        "chunks_in": len(docs),
+        "chunks_used": len(kept),
+        "context_tokens": count_tokens(context_str),
+        "overlap_chars_removed": overlap_chars,
+        "truncated": truncated,
+    }
+
+
+class PromptStats:
+    """Rolling record of prompt sizes (prefill cost) per request."""
+
+    def __init__(self, maxlen=PROMPT_SAMPLES):
+        self._samples = deque(maxlen=maxlen)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.truncated = 0
+
+    def record(self, prompt_tokens, truncated=False):
+        with self._lock:
+            self._samples.append(prompt_tokens)
+            self.requests += 1
+            self.truncated += int(truncated)
+
+    def stats(self):
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return {"requests": self.requests, "tokenizer": "tiktoken" if _encoding else "estimate"}
+        return {
+            "requests": self.requests,
+            "truncated": self.truncated,
+            "tokenizer": "tiktoken" if _encoding else "estimate",
+            "context_budget": CONTEXT_TOKEN_BUDGET,
+            "prompt_tokens_mean": round(sum(samples) / len(samples), 1),
+            "prompt_tokens_p50": samples[len(samples) // 2],
+            "prompt_tokens_p99": samples[min(len(samples) - 1, int(len(samples) * 0.99))],
+        }
+
+
+prompt_stats = PromptStats()
@@ -1,15 +1,272 @@
 from qdrant_client import QdrantClient
+from qdrant_client.http import models
+from concurrent.futures import ThreadPoolExecutor
+from metrics import INGEST_STAGE_SECONDS, VECTORS_WRITTEN
 import os
+import time
+import threading
+from log_config import get_logger
 
+logger = get_logger("db")
+
+
+# Vector store backend:
+#   local - embedded storage at QDRANT_PATH (single process only: the storage is locked)
+#   http  - Qdrant server at QDRANT_URL over REST
+#   grpc  - Qdrant server at QDRANT_URL over gRPC
+# Defaults to "http" when QDRANT_URL is set, otherwise the local-first embedded mode.
+QDRANT_PATH = os.environ.get("QDRANT_PATH", "qdrant_db")
+QDRANT_URL = os.environ.get("QDRANT_URL")
+QDRANT_BACKEND = os.environ.get("QDRANT_BACKEND", "http" if QDRANT_URL else "local").lower()
+QDRANT_API_KEY = os.environ.get("QDRANT_API_KEY")
+QDRANT_GRPC_PORT = int(os.environ.get("QDRANT_GRPC_PORT", 6334))
+# Per-request timeout in seconds
+QDRANT_TIMEOUT = int(os.environ.get("QDRANT_TIMEOUT", 10))
+# Clients per process in server mode; requests are spread across them round-robin
+QDRANT_POOL_SIZE = int(os.environ.get("QDRANT_POOL_SIZE", 4))
+# Send ingestion upserts over gRPC even when queries use REST (needs the gRPC port reachable)
+QDRANT_BULK_GRPC = os.environ.get("QDRANT_BULK_GRPC", "0") == "1"
+
+# Collection layout (applied when the collection is created)
+# "int8" keeps a 4x smaller quantized copy of every vector in RAM for search and
+# rescores the top hits with the originals; "none" keeps plain float32.
+QDRANT_QUANTIZATION = os.environ.get("QDRANT_QUANTIZATION", "none").lower()
+# Keep original vectors (and the HNSW graph) on disk, memory-mapped
+QDRANT_ON_DISK = os.environ.get("QDRANT_ON_DISK", "0") == "1"
+QDRANT_HNSW_M = int(os.environ.get("QDRANT_HNSW_M", 16))
+QDRANT_HNSW_EF_CONSTRUCT = int(os.environ.get("QDRANT_HNSW_EF_CONSTRUCT", 100))
+
+# Bulk writes: points per upsert request and requests in flight at once
+QDRANT_UPSERT_BATCH = int(os.environ.get("QDRANT_UPSERT_BATCH", 256))
+QDRANT_UPSERT_PARALLEL = int(os.environ.get("QDRANT_UPSERT_PARALLEL", 4))
+
+BACKENDS = ("local", "http", "grpc")
+if QDRANT_BACKEND not in BACKENDS:
+    raise ValueError(f"QDRANT_BACKEND must be one of {BACKENDS}, got {QDRANT_BACKEND!r}")
+if QDRANT_BACKEND != "local" and not QDRANT_URL:
+    raise ValueError(f"QDRANT_BACKEND={QDRANT_BACKEND} requires QDRANT_URL")
+if QDRANT_QUANTIZATION not in ("none", "int8"):
+    raise ValueError(f"QDRANT_QUANTIZATION must be 'none' or 'int8', got {QDRANT_QUANTIZATION!r}")
+
+
+def _server_kwargs(prefer_grpc):
+    return {
+        "url": QDRANT_URL,
+        "api_key": QDRANT_API_KEY,
+        "timeout": QDRANT_TIMEOUT,
+        "prefer_grpc": prefer_grpc,
+        "grpc_port": QDRANT_GRPC_PORT,
+    }
+
+
+def create_client(prefer_grpc=None):
+    """New synchronous client for the configured backend."""
+    if QDRANT_BACKEND == "local":
+        logger.info("Initializing QdrantClient with local path: %s", QDRANT_PATH)
+        return QdrantClient(path=QDRANT_PATH)
+    if prefer_grpc is None:
+        prefer_grpc = QDRANT_BACKEND == "grpc"
+    logger.info("Initializing QdrantClient for server: %s (%s)", QDRANT_URL, "grpc" if prefer_grpc else "http")
+    return QdrantClient(**_server_kwargs(prefer_grpc))
+
+
+def check_health(client):
+    """Cheap round trip to the vector store. Returns (ok, latency_ms, error)."""
+    start = time.perf_counter()
+    try:
+        client.get_collections()
+        return True, (time.perf_counter() - start) * 1000, None
+    except Exception as e:
+        return False, (time.perf_counter() - start) * 1000, str(e)
+
+
+class QdrantClientPool:
+    """
+    Fixed set of clients handed out round-robin. Each client is thread-safe and keeps
+    its own connection pool, so spreading requests over several of them avoids all
+    API threads queueing on one set of connections. Clients are created lazily and
+    replaced when a health check fails.
+    """
+
+    def __init__(self, size, prefer_grpc=None):
+        self.size = max(1, size)
+        self.prefer_grpc = prefer_grpc
+        self._clients = [None] * self.size
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def get(self):
+        with self._lock:
+            i = self._next
+            self._next = (self._next + 1) % self.size
+            if self._clients[i] is None:
+                self._clients[i] = create_client(self.prefer_grpc)
+            return self._clients[i]
+
+    def health_check(self):
+        results = []
+        for i in range(self.size):
+            with self._lock:
+                client = self._clients[i]
+            if client is None:
+                continue
+            ok, latency_ms, error = check_health(client)
+            if not ok:
+                logger.warning("Client %d failed health check (%s); reconnecting", i, error)
+                with self._lock:
+                    if self._clients[i] is client:
+                        self._clients[i] = None
+                try:
+                    client.close()
+                except Exception:
+                    pass
+            results.append({"client": i, "ok": ok, "latency_ms": round(latency_ms, 2), "error": error})
+        return results
 
-# Using local persistent storage for a truly local-first setup
-QDRANT_PATH = "qdrant_db"
 
 _client_instance = None
+_client_pool = None
+_bulk_pool = None
+_async_client_instance = None
+_init_lock = threading.Lock()
 
 def get_qdrant_client():
-    global _client_instance
-    if _client_instance is None:
-        print(f"--- [DB] Initializing QdrantClient with local path: {QDRANT_PATH} ---")
-        _client_instance = QdrantClient(path=QDRANT_PATH)
-    return _client_instance
+    """Shared client for queries and admin calls (from the pool in server mode)."""
+    global _client_instance, _client_pool
+    if QDRANT_BACKEND == "local":
+        # One embedded client per process: it owns the storage lock
+        if _client_instance is None:
+            with _init_lock:
+                if _client_instance is None:
+                    _client_instance = create_client()
+        return _client_instance
+    if _client_pool is None:
+        with _init_lock:
+            if _client_pool is None:
+                _client_pool = QdrantClientPool(QDRANT_POOL_SIZE)
+    return _client_pool.get()
+
+def get_bulk_qdrant_client():
+    """Client for ingestion upserts; uses gRPC when QDRANT_BULK_GRPC is set."""
+    global _bulk_pool
+    if QDRANT_BACKEND != "http" or not QDRANT_BULK_GRPC:
+        return get_qdrant_client()
+    if _bulk_pool is None:
+        with _init_lock:
+            if _bulk_pool is None:
+                _bulk_pool = QdrantClientPool(QDRANT_POOL_SIZE, prefer_grpc=True)
+    return _bulk_pool.get()
+
+def get_async_qdrant_client():
+    """
+    AsyncQdrantClient for the configured server, or None in embedded mode
+    (the local storage is locked by the synchronous client).
+    """
+    global _async_client_instance
+    if QDRANT_BACKEND == "local":
+        return None
+    if _async_client_instance is None:
+        from qdrant_client import AsyncQdrantClient
+        logger.info("Initializing AsyncQdrantClient for server: %s", QDRANT_URL)
+        _async_client_instance = AsyncQdrantClient(**_server_kwargs(QDRANT_BACKEND == "grpc"))
+    return _async_client_instance
+
+def vector_store_health():
+    """Health of every client this process has opened, for /health."""
+    if QDRANT_BACKEND == "local":
+        clients = [] if _client_instance is None else [_client_instance]
+        results = []
+        for i, client in enumerate(clients):
+            ok, latency_ms, error = check_health(client)
+            results.append({"client": i, "ok": ok, "latency_ms": round(latency_ms, 2), "error": error})
+    else:
+        results = []
+        for pool in (_client_pool, _bulk_pool):
+            if pool is not None:
+                results.extend(pool.health_check())
+    if not results:
+        ok, latency_ms, error = check_health(get_qdrant_client())
+        results.append({"client": 0, "ok": ok, "latency_ms": round(latency_ms, 2), "error": error})
+    return {
+        "backend": QDRANT_BACKEND,
+        "ok": all(r["ok"] for r in results),
+        "clients": results,
+    }
+
+
+def collection_config(vector_size):
+    """create_collection kwargs for the configured vector layout, HNSW and quantization."""
+    config = {
+        "vectors_config": models.VectorParams(
+            size=vector_size, distance=models.Distance.COSINE, on_disk=QDRANT_ON_DISK
+        ),
+        "hnsw_config": models.HnswConfigDiff(
+            m=QDRANT_HNSW_M, ef_construct=QDRANT_HNSW_EF_CONSTRUCT, on_disk=QDRANT_ON_DISK
+        ),
+    }
+    if QDRANT_QUANTIZATION == "int8":
+        config["quantization_config"] = models.ScalarQuantization(
+            scalar=models.ScalarQuantizationConfig(
+                type=models.ScalarType.INT8, quantile=0.99, always_ram=True
+            )
+        )
+    return config
+
+
+class BulkWriter:
+    """
+    Pipelined upserts. Each batch is sent with wait=False (acknowledged once it is in
+    the write-ahead log, before indexing) and up to `parallel` requests are in flight.
+    The most recent batch is held back; flush() waits for everything outstanding and
+    then sends it with wait=True, so when flush() returns all points are searchable.
+    """
+
+    def __init__(self, client, collection_name, batch_size=QDRANT_UPSERT_BATCH, parallel=None):
+        self.client = client
+        self.collection_name = collection_name
+        self.batch_size = batch_size
+        # The embedded client is not safe to write from several threads
+        self.parallel = 1 if QDRANT_BACKEND == "local" else (parallel or QDRANT_UPSERT_PARALLEL)
+        self.written = 0
+        self._held = None
+        self._inflight = []
+        self._executor = None
+
+    def add(self, points):
+        for i in range(0, len(points), self.batch_size):
+            if self._held is not None:
+                self._send_async(self._held)
+            self._held = points[i:i + self.batch_size]
+
+    def _send(self, points, wait):
+        with INGEST_STAGE_SECONDS.time(stage="upsert"):
+            self.client.upsert(collection_name=self.collection_name, points=points, wait=wait)
+        VECTORS_WRITTEN.inc(len(points))
+        return len(points)
+
+    def _send_async(self, points):
+        if self.parallel <= 1:
+            self.written += self._send(points, wait=False)
+            return
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.parallel, thread_name_prefix="qdrant-bulk")
+        if len(self._inflight) >= self.parallel:
+            self.written += self._inflight.pop(0).result()
+        self._inflight.append(self._executor.submit(self._send, points, False))
+
+    def flush(self):
+        """Send the held batch with wait=True once every earlier batch is acknowledged."""
+        try:
+            while self._inflight:
+                self.written += self._inflight.pop(0).result()
+            if self._held is not None:
+                held, self._held = self._held, None
+                self.written += self._send(held, wait=True)
+        finally:
+            self.close()
+        return self.written
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
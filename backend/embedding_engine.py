@@ -0,0 +1,108 @@
+import os
+import time
+import numpy as np
+from embedding_registry import get_embeddings
+from log_config import get_logger
+
+logger = get_logger("embed")
+
+# Configuration
+# Chunks per forward pass. Larger batches amortise overhead but pad to the longest member.
+EMBED_BATCH_SIZE = int(os.environ.get("EMBED_BATCH_SIZE", 32))
+# Pre-normalise vectors so the COSINE collection reduces to a dot product
+EMBED_NORMALIZE = os.environ.get("EMBED_NORMALIZE", "1") == "1"
+
+
+class EmbeddingEngine:
+    """
+    Batched document embedding for the ingestion path.
+
+    Texts are sorted by token length and packed into batches of similar length so
+    little compute is wasted on padding. Results come back in input order as one
+    contiguous float32 array of shape (len(texts), dim).
+    """
+
+    def __init__(self, embeddings=None, batch_size=EMBED_BATCH_SIZE, normalize=EMBED_NORMALIZE):
+        self.embeddings = embeddings or get_embeddings()
+        self.batch_size = batch_size
+        self.normalize = normalize
+        self.last_stats = []
+
+    @property
+    def _model(self):
+        # HuggingFaceEmbeddings.client is the SentenceTransformer doing the work
+        return getattr(self.embeddings, "client", None)
+
+    def token_lengths(self, texts):
+        tokenizer = getattr(self._model, "tokenizer", None)
+        if tokenizer is not None:
+            try:
+                encoded = tokenizer(texts, add_special_tokens=True, truncation=True)
+                return [len(ids) for ids in encoded["input_ids"]]
+            except Exception:
+                pass
+        # Rough fallback: whitespace tokens
+        return [len(t.split()) for t in texts]
+
+    def _encode(self, batch):
+        model = self._model
+        if model is not None and hasattr(model, "encode"):
+            vectors = model.encode(
+                batch,
+                batch_size=len(batch),
+                convert_to_numpy=True,
+                normalize_embeddings=self.normalize,
+                show_progress_bar=False,
+            )
+            return np.asarray(vectors, dtype=np.float32)
+        vectors = np.asarray(self.embeddings.embed_documents(batch), dtype=np.float32)
+        if self.normalize:
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors /= np.maximum(norms, 1e-12)
+        return vectors
+
+    def embed(self, texts):
+        """Embed texts, returning a C-contiguous float32 array in input order."""
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+
+        lengths = self.token_lengths(texts)
+        order = np.argsort(lengths, kind="stable")
+        out = None
+        self.last_stats = []
+
+        for start in range(0, len(texts), self.batch_size):
+            idx = order[start:start + self.batch_size]
+            batch = [texts[i] for i in idx]
+            t0 = time.perf_counter()
+            vectors = self._encode(batch)
+            elapsed = time.perf_counter() - t0
+            if out is None:
+                out = np.empty((len(texts), vectors.shape[1]), dtype=np.float32)
+            out[idx] = vectors
+
+            max_len = max(lengths[i] for i in idx)
+            padding = 1 - sum(lengths[i] for i in idx) / (max_len * len(idx)) if max_len else 0.0
+            rate = len(batch) / elapsed if elapsed > 0 else float("inf")
+            self.last_stats.append({
+                "size": len(batch),
+                "max_tokens": max_len,
+                "padding_ratio": round(padding, 3),
+                "seconds": round(elapsed, 4),
+                "chunks_per_sec": round(rate, 1),
+            })
+            logger.debug(
+                "Batch of %d (max %d tokens, %.0f%% padding): %.1f chunks/s", len(batch), max_len, padding * 100, rate
+            )
+
+        return np.ascontiguousarray(out)
+
+
+_engine = None
+
+
+def get_embedding_engine():
+    global _engine
+    if _engine is None:
+        _engine = EmbeddingEngine()
+    return _engine
@@ -0,0 +1,77 @@
+import os
+import time
+import threading
+from langchain_community.embeddings import HuggingFaceEmbeddings
+from log_config import get_logger
+
+logger = get_logger("embed")
+
+# Configuration
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+EMBEDDING_DEVICE = os.environ.get("EMBEDDING_DEVICE", "cpu")
+
+# Process-wide registry: (model_name, device) -> HuggingFaceEmbeddings
+_models = {}
+_stats = {}
+_lock = threading.Lock()
+
+
+def _rss_bytes():
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except Exception:
+        return None
+
+
+def _param_bytes(model):
+    # HuggingFaceEmbeddings.client is the underlying SentenceTransformer (torch module)
+    try:
+        return sum(p.numel() * p.element_size() for p in model.client.parameters())
+    except Exception:
+        return None
+
+
+def get_embeddings(model_name: str = EMBEDDING_MODEL, device: str = None):
+    """
+    Return the shared embedding model for (model_name, device).
+    The model is loaded lazily on first use and then reused for the lifetime of the process.
+    """
+    device = device or EMBEDDING_DEVICE
+    key = (model_name, device)
+    model = _models.get(key)
+    if model is not None:
+        _stats[key]["hits"] += 1
+        return model
+
+    with _lock:
+        # Another thread may have finished loading while we waited
+        model = _models.get(key)
+        if model is not None:
+            _stats[key]["hits"] += 1
+            return model
+
+        logger.info("Loading embedding model '%s' on %s", model_name, device)
+        rss_before = _rss_bytes()
+        start = time.perf_counter()
+        model = HuggingFaceEmbeddings(model_name=model_name, model_kwargs={"device": device})
+        load_time = time.perf_counter() - start
+        rss_after = _rss_bytes()
+
+        _stats[key] = {
+            "model_name": model_name,
+            "device": device,
+            "load_time_s": round(load_time, 3),
+            "param_bytes": _param_bytes(model),
+            "rss_delta_bytes": rss_after - rss_before if rss_before is not None and rss_after is not None else None,
+            "loaded_at": time.time(),
+            "hits": 0,
+        }
+        _models[key] = model
+        logger.info("Model '%s' ready in %.2fs", model_name, load_time)
+        return model
+
+
+def get_embedding_stats():
+    """Load time, memory footprint and reuse count for every loaded model."""
+    return [dict(s) for s in _stats.values()]
@@ -0,0 +1,143 @@
+"""
+Minimal fake Ollama server for offline testing and load generation.
+
+Implements GET /api/tags and POST /api/generate (streaming NDJSON or a single JSON
+body) with configurable time-to-first-token, per-token latency and a cap on
+concurrent generations (requests beyond it wait, like a saturated model server).
+
+    python fake_ollama.py --port 11435 --ttft-ms 200 --token-ms 20 --tokens 24 --parallel 2
+
+Point the API at it with OLLAMA_BASE_URL=http://127.0.0.1:11435
+"""
+import json
+import time
+import argparse
+import threading
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_PORT = 11435
+
+
+class FakeOllamaConfig:
+    def __init__(self, ttft_ms=200, token_ms=20, tokens=24, parallel=2, model="llama3.2:1b"):
+        self.ttft_ms = ttft_ms
+        self.token_ms = token_ms
+        self.tokens = tokens
+        self.parallel = parallel
+        self.model = model
+        self.slots = threading.BoundedSemaphore(parallel)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.active = 0
+        self.peak_active = 0
+        self.cancelled = 0
+
+
+def _make_handler(config):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _json(self, status, body):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == "/api/tags":
+                self._json(200, {"models": [{"name": config.model}]})
+            elif self.path == "/stats":
+                self._json(200, {
+                    "requests": config.requests,
+                    "active": config.active,
+                    "peak_active": config.peak_active,
+                    "cancelled": config.cancelled,
+                })
+            else:
+                self._json(404, {"error": "not found"})
+
+        def do_POST(self):
+            if self.path != "/api/generate":
+                self._json(404, {"error": "not found"})
+                return
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+            stream = body.get("stream", True)
+            words = [f"tok{i}" for i in range(config.tokens)]
+
+            with config.slots:
+                with config.lock:
+                    config.requests += 1
+                    config.active += 1
+                    config.peak_active = max(config.peak_active, config.active)
+                try:
+                    time.sleep(config.ttft_ms / 1000)
+                    if not stream:
+                        time.sleep(config.token_ms * len(words) / 1000)
+                        self._json(200, self._chunk(" ".join(words), done=True))
+                        return
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/x-ndjson")
+                    self.send_header("Transfer-Encoding", "chunked")
+                    self.end_headers()
+                    for i, word in enumerate(words):
+                        self._write_chunk(self._chunk(word + (" " if i < len(words) - 1 else ""), done=False))
+                        time.sleep(config.token_ms / 1000)
+                    self._write_chunk(self._chunk("", done=True))
+                    self.wfile.write(b"0\r\n\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    # Client went away mid-generation: a real server would stop decoding here
+                    with config.lock:
+                        config.cancelled += 1
+                finally:
+                    with config.lock:
+                        config.active -= 1
+
+        def _chunk(self, text, done):
+            return {
+                "model": config.model,
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "response": text,
+                "done": done,
+            }
+
+        def _write_chunk(self, obj):
+            data = (json.dumps(obj) + "\n").encode("utf-8")
+            self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+
+    return Handler
+
+
+def serve_fake_ollama(port=DEFAULT_PORT, **kwargs):
+    """Start the fake server on a background thread. Returns (server, config)."""
+    config = FakeOllamaConfig(**kwargs)
+    server = ThreadingHTTPServer(("127.0.0.1", port), _make_handler(config))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-ollama", daemon=True).start()
+    return server, config
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Ollama server")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--ttft-ms", type=float, default=200)
+    parser.add_argument("--token-ms", type=float, default=20)
+    parser.add_argument("--tokens", type=int, default=24)
+    parser.add_argument("--parallel", type=int, default=2)
+    args = parser.parse_args()
+
+    server, _ = serve_fake_ollama(
+        args.port, ttft_ms=args.ttft_ms, token_ms=args.token_ms, tokens=args.tokens, parallel=args.parallel
+    )
+    print(f"--- [FAKE OLLAMA] Listening on http://127.0.0.1:{args.port} ---")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,185 @@
+import os
+import time
+import asyncio
+import contextlib
+from collections import OrderedDict, deque
+
+# Configuration
+# Generations allowed in flight at once; match this to what the model server can
+# actually run in parallel (e.g. OLLAMA_NUM_PARALLEL).
+LLM_MAX_INFLIGHT = int(os.environ.get("LLM_MAX_INFLIGHT", os.environ.get("LLM_CONCURRENCY", 2)))
+# Default priority for queries; lower numbers are served first
+DEFAULT_PRIORITY = 1
+# Clients may ask for DEFAULT_PRIORITY..LOWEST_PRIORITY (i.e. only to wait longer);
+# anything below DEFAULT_PRIORITY is reserved for the server itself
+LOWEST_PRIORITY = 9
+# Number of recent queue-wait samples kept for percentiles
+WAIT_SAMPLES = 1000
+
+
+class _Request:
+    __slots__ = ("key", "make_coro", "tenant", "priority", "enqueued_at", "future", "task", "waiters")
+
+    def __init__(self, key, make_coro, tenant, priority, future):
+        self.key = key
+        self.make_coro = make_coro
+        self.tenant = tenant
+        self.priority = priority
+        self.enqueued_at = time.perf_counter()
+        self.future = future
+        self.task = None
+        self.waiters = 1
+
+
+class GenerationScheduler:
+    """
+    Admission control in front of the LLM.
+
+    - At most max_inflight generations run at once; the rest wait in queues.
+    - Lower priority numbers are always dispatched first.
+    - Within a priority, tenants (folders) are served round-robin so one busy
+      folder cannot starve the others.
+    - Requests with the same key that are queued or running share a single
+      generation. A generation is cancelled once nobody is waiting for it.
+    """
+
+    def __init__(self, max_inflight=LLM_MAX_INFLIGHT):
+        self.max_inflight = max_inflight
+        self._queues = {}  # priority -> OrderedDict(tenant -> deque[_Request])
+        self._by_key = {}
+        self._inflight = 0
+        self._waits = deque(maxlen=WAIT_SAMPLES)
+        self.submitted = 0
+        self.deduplicated = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+
+    async def submit(self, key, make_coro, tenant="default", priority=DEFAULT_PRIORITY):
+        """Run make_coro() under the scheduler and return its result."""
+        self.submitted += 1
+        req = self._by_key.get(key) if key is not None else None
+        if req is not None:
+            self.deduplicated += 1
+            req.waiters += 1
+        else:
+            req = _Request(key, make_coro, tenant, priority, asyncio.get_running_loop().create_future())
+            if key is not None:
+                self._by_key[key] = req
+            self._enqueue(req)
+            self._dispatch()
+
+        try:
+            return await asyncio.shield(req.future)
+        except asyncio.CancelledError:
+            req.waiters -= 1
+            if req.waiters <= 0:
+                self._abandon(req)
+            raise
+
+    @contextlib.asynccontextmanager
+    async def slot(self, tenant="default", priority=DEFAULT_PRIORITY):
+        """Hold one in-flight slot for the duration of the block (used for streaming)."""
+        released = asyncio.Event()
+        granted = asyncio.get_running_loop().create_future()
+
+        async def hold():
+            granted.set_result(True)
+            await released.wait()
+
+        task = asyncio.ensure_future(self.submit(None, hold, tenant=tenant, priority=priority))
+        try:
+            await asyncio.wait({task, granted}, return_when=asyncio.FIRST_COMPLETED)
+            if task.done():
+                task.result()
+            yield
+        finally:
+            released.set()
+            if not granted.done():
+                task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+
+    def _enqueue(self, req):
+        tenants = self._queues.setdefault(req.priority, OrderedDict())
+        tenants.setdefault(req.tenant, deque()).append(req)
+
+    def _next(self):
+        for priority in sorted(self._queues):
+            tenants = self._queues[priority]
+            if not tenants:
+                continue
+            # Round-robin: take from the first tenant, then move it to the back
+            tenant, queue = next(iter(tenants.items()))
+            req = queue.popleft()
+            del tenants[tenant]
+            if queue:
+                tenants[tenant] = queue
+            return req
+        return None
+
+    def _dispatch(self):
+        while self._inflight < self.max_inflight:
+            req = self._next()
+            if req is None:
+                return
+            self._inflight += 1
+            self._waits.append(time.perf_counter() - req.enqueued_at)
+            req.task = asyncio.ensure_future(self._run(req))
+
+    async def _run(self, req):
+        try:
+            result = await req.make_coro()
+            if not req.future.done():
+                req.future.set_result(result)
+            self.completed += 1
+        except asyncio.CancelledError:
+            if not req.future.done():
+                req.future.cancel()
+            self.cancelled += 1
+        except Exception as e:
+            if not req.future.done():
+                req.future.set_exception(e)
+            self.failed += 1
+        finally:
+            self._inflight -= 1
+            if self._by_key.get(req.key) is req:
+                del self._by_key[req.key]
+            self._dispatch()
+
+    def _abandon(self, req):
+        if self._by_key.get(req.key) is req:
+            del self._by_key[req.key]
+        if req.task is not None:
+            # Running: cancelling the task aborts the HTTP call to the model server
+            req.task.cancel()
+            return
+        tenants = self._queues.get(req.priority, {})
+        queue = tenants.get(req.tenant)
+        if queue and req in queue:
+            queue.remove(req)
+            if not queue:
+                del tenants[req.tenant]
+            self.cancelled += 1
+
+    def queue_depth(self):
+        return sum(len(q) for tenants in self._queues.values() for q in tenants.values())
+
+    def stats(self):
+        waits = sorted(self._waits)
+
+        def pct(q):
+            return round(waits[min(len(waits) - 1, int(len(waits) * q))] * 1000, 2) if waits else 0.0
+
+        return {
+            "max_inflight": self.max_inflight,
+            "inflight": self._inflight,
+            "queued": self.queue_depth(),
+            "submitted": self.submitted,
+            "deduplicated": self.deduplicated,
+            "completed": self.completed,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+            "queue_wait_p50_ms": pct(0.50),
+            "queue_wait_p99_ms": pct(0.99),
+        }
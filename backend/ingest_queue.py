@@ -0,0 +1,243 @@
+import os
+import time
+import queue
+import shutil
+import threading
+from ingestion import ingest_file, IngestionCancelled
+from job_store import get_job_store
+from log_config import get_logger
+
+logger = get_logger("queue")
+
+# Configuration
+# Number of files ingested concurrently. OCR inside a job already fans out to the
+# OCR process pool, so a small number of job workers is enough to keep it busy.
+INGEST_WORKERS = int(os.environ.get("INGEST_WORKERS", 2))
+# Jobs allowed to wait for a worker before /upload/ starts rejecting requests
+INGEST_QUEUE_SIZE = int(os.environ.get("INGEST_QUEUE_SIZE", 32))
+# Uploaded files are stored under UPLOAD_DIR/<job_id>/ so concurrent jobs never share a path
+UPLOAD_DIR = os.environ.get("UPLOAD_DIR", "uploads")
+# Hard cap on the bytes uploaded in a single job
+MAX_JOB_BYTES = int(os.environ.get("MAX_JOB_BYTES", 512 * 1024 * 1024))
+# Growth of this process's RSS tolerated while a job runs before it is aborted (needs
+# psutil). RSS is per process, not per job: with INGEST_WORKERS > 1 the jobs running
+# side by side share it, so whichever one checks first is aborted.
+MAX_JOB_MEMORY_BYTES = int(os.environ.get("MAX_JOB_MEMORY_BYTES", 2 * 1024 * 1024 * 1024))
+# How often a running job re-reads its cancel flag and memory usage
+STATUS_CHECK_INTERVAL = float(os.environ.get("STATUS_CHECK_INTERVAL", 0.5))
+
+
+class QueueFull(Exception):
+    pass
+
+
+class JobTooLarge(Exception):
+    pass
+
+
+class JobMemoryExceeded(IngestionCancelled):
+    pass
+
+
+def job_upload_dir(job_id):
+    return os.path.join(UPLOAD_DIR, job_id)
+
+
+def upload_source(filename):
+    """Name chunks are indexed under: stable across jobs, so a re-upload replaces the old version."""
+    return os.path.join(UPLOAD_DIR, filename)
+
+
+def _rss_bytes():
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except Exception:
+        return None
+
+
+class IngestionQueue:
+    """
+    Bounded queue of upload jobs processed by a fixed pool of background threads.
+    A job is a list of already-saved files that are ingested one after another.
+    Job state lives in the shared job store, so any API worker can report or cancel it.
+    """
+
+    def __init__(self, workers=INGEST_WORKERS, max_queued=INGEST_QUEUE_SIZE, max_job_memory=MAX_JOB_MEMORY_BYTES, store=None):
+        self.workers = workers
+        self.max_job_memory = max_job_memory
+        self._store = store
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._threads = []
+
+    @property
+    def store(self):
+        if self._store is None:
+            self._store = get_job_store()
+        return self._store
+
+    def start(self):
+        if self._threads:
+            return
+        logger.info("Starting %d ingestion workers (queue size %d)", self.workers, self._queue.maxsize)
+        if self.max_job_memory and _rss_bytes() is None:
+            logger.warning("psutil is not installed; the ingestion memory cap (MAX_JOB_MEMORY_BYTES) is disabled")
+        for n in range(self.workers):
+            t = threading.Thread(target=self._worker, name=f"ingest-worker-{n}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def stop(self):
+        for _ in self._threads:
+            self._queue.put(None)
+        self._threads = []
+
+    def is_full(self):
+        return self._queue.full()
+
+    def submit(self, job_id, folder, files):
+        """
+        Queue a job. files is a list of {"filename", "path"} dicts.
+        Raises QueueFull when no more jobs can be accepted.
+        """
+        self.store.create(job_id, folder, files)
+        try:
+            self._queue.put_nowait(job_id)
+        except queue.Full:
+            self.store.delete(job_id)
+            raise QueueFull(f"Ingestion queue is full ({self._queue.maxsize} jobs waiting)")
+        logger.info("Job %s queued with %d files (depth %d)", job_id, len(files), self._queue.qsize())
+        return self.get_status(job_id)
+
+    def cancel(self, job_id):
+        status = self.store.request_cancel(job_id)
+        if status is None:
+            return False
+        if status == "queued":
+            # Never picked up: settle it now, the worker will skip it
+            self._finish_cancelled(job_id)
+        logger.info("Cancellation requested for job %s", job_id)
+        return True
+
+    def get_status(self, job_id):
+        job = self.store.get(job_id)
+        if job is None:
+            return None
+        for f in job["files"]:
+            f.pop("path", None)
+        return job
+
+    def depth(self):
+        return self._queue.qsize()
+
+    def _finish_cancelled(self, job_id):
+        job = self.store.get(job_id)
+        if job is None:
+            return
+        for i, f in enumerate(job["files"]):
+            if f["status"] in ("queued", "processing"):
+                self.store.update_file(job_id, i, status="cancelled")
+        self.store.update(job_id, status="cancelled", finished_at=time.time())
+
+    def _worker(self):
+        while True:
+            job_id = self._queue.get()
+            if job_id is None:
+                return
+            try:
+                self._run_job(job_id)
+            except Exception as e:
+                logger.error("Job %s crashed: %s", job_id, e, exc_info=True)
+                self.store.update(job_id, status="failed", finished_at=time.time())
+            finally:
+                self._queue.task_done()
+
+    def _run_job(self, job_id):
+        try:
+            self._process_job(job_id)
+        finally:
+            # The uploaded copies are only needed while the job runs, whatever its outcome
+            shutil.rmtree(job_upload_dir(job_id), ignore_errors=True)
+
+    def _process_job(self, job_id):
+        store = self.store
+        job = store.get(job_id)
+        # Conditional queued -> processing, so a cancel that lands after the get() is not
+        # overwritten; cancel() settles jobs it caught while still queued
+        if job is None or not store.start(job_id):
+            return
+        logger.info("Job %s started", job_id)
+
+        rss_start = _rss_bytes()
+        cancelled = False
+        last_check = 0.0
+        last_progress = -1
+
+        def check_limits():
+            nonlocal cancelled, last_check
+            now = time.monotonic()
+            if now - last_check < STATUS_CHECK_INTERVAL:
+                return
+            last_check = now
+            if store.is_cancel_requested(job_id):
+                cancelled = True
+                raise IngestionCancelled(f"Job {job_id} was cancelled")
+            if rss_start is not None and self.max_job_memory:
+                rss = _rss_bytes()
+                if rss is not None and rss - rss_start > self.max_job_memory:
+                    raise JobMemoryExceeded(
+                        f"Process memory grew by more than {self.max_job_memory // (1024 * 1024)} MB during this job"
+                    )
+
+        def progress_callback(current, total):
+            nonlocal last_progress
+            # Only hit the store when the visible percentage actually moves
+            percent = int((current / total) * 100)
+            if percent != last_progress or current == total:
+                last_progress = percent
+                store.set_progress(job_id, current, total)
+            check_limits()
+
+        for i, entry in enumerate(job["files"]):
+            if cancelled or store.is_cancel_requested(job_id):
+                cancelled = True
+                break
+
+            last_progress = -1
+            store.update_file(job_id, i, status="processing")
+            try:
+                result = ingest_file(
+                    entry["path"],
+                    folder_name=job["folder"],
+                    progress_callback=progress_callback,
+                    source=upload_source(entry["filename"]),
+                )
+                store.update_file(
+                    job_id, i,
+                    status="failed" if "error" in result else "success",
+                    error=result.get("error"),
+                    details=result,
+                )
+            except JobMemoryExceeded as e:
+                logger.warning("%s: %s", entry["filename"], e)
+                store.update_file(job_id, i, status="error", error=str(e))
+            except IngestionCancelled:
+                cancelled = True
+                break
+            except Exception as e:
+                logger.error("Exception processing %s: %s", entry["filename"], e, exc_info=True)
+                store.update_file(job_id, i, status="error", error=str(e))
+
+        if cancelled:
+            self._finish_cancelled(job_id)
+        else:
+            store.update(job_id, status="completed", progress=100, finished_at=time.time())
+
+        job = store.get(job_id) or job
+        logger.info("Job %s %s", job_id, job["status"])
+        for f in job["files"]:
+            logger.info("  - %s: %s%s", f["filename"], f["status"], f" ({f['error']})" if f["error"] else "")
+
+
+# Process-wide queue used by the API
+ingestion_queue = IngestionQueue()
@@ -1,24 +1,57 @@
 import os
+import uuid
+import queue
+import hashlib
+import threading
 import warnings
 from langchain_community.document_loaders import PyPDFLoader, TextLoader, Docx2txtLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_qdrant import QdrantVectorStore
-from database import get_qdrant_client
+from database import get_qdrant_client, get_bulk_qdrant_client, BulkWriter
+from embedding_engine import get_embedding_engine
 from langchain_core.documents import Document
+from qdrant_client.http import models
+from manifest import get_manifest
+from query_cache import invalidate_folder
+from keyword_index import get_keyword_index
+from log_config import get_logger
+from metrics import INGEST_STAGE_SECONDS, INGEST_FILES
 
 # Suppress warnings
 warnings.filterwarnings("ignore")
 
 # Configuration
+logger = get_logger("ingestion")
+
 COLLECTION_NAME = "local_documents"
+# Namespace for deterministic point IDs: uuid5(folder | source | chunk hash)
+POINT_ID_NAMESPACE = uuid.UUID("3b0f8a52-7c1e-4d59-9a43-6f2e8d1c5b07")
+CHUNK_SIZE = 500
+CHUNK_OVERLAP = 100
+# Streaming mode: load -> split -> embed -> upsert runs as a pipeline over pages
+STREAMING_INGEST = os.environ.get("STREAMING_INGEST", "1") == "1"
+# Chunks per embed/upsert batch in streaming mode (the embedding engine
+# length-sorts each batch into EMBED_BATCH_SIZE forward passes)
+INGEST_BATCH_SIZE = int(os.environ.get("INGEST_BATCH_SIZE", 256))
+# Batches allowed to wait between pipeline stages; bounds peak memory
+INGEST_PIPELINE_DEPTH = int(os.environ.get("INGEST_PIPELINE_DEPTH", 4))
+# Per-page PDF routing: a page is OCR'd only if it has images and its text layer is
+# thinner than PAGE_MIN_TEXT_CHARS. Pages mostly covered by images (scans) must carry
+# PAGE_SCAN_MIN_TEXT_CHARS before their text layer is trusted on its own.
+PAGE_MIN_TEXT_CHARS = int(os.environ.get("PAGE_MIN_TEXT_CHARS", 50))
+PAGE_SCAN_COVERAGE = float(os.environ.get("PAGE_SCAN_COVERAGE", 0.5))
+PAGE_SCAN_MIN_TEXT_CHARS = int(os.environ.get("PAGE_SCAN_MIN_TEXT_CHARS", 200))
 
 from langchain_community.document_loaders import PDFPlumberLoader, TextLoader, Docx2txtLoader
 
+
+class IngestionCancelled(Exception):
+    """Raised from a progress_callback to abort an in-flight ingestion."""
+
+
 def load_document(file_path):
     ext = os.path.splitext(file_path)[1].lower()
     if ext == ".pdf":
-        print(f"--- [INGEST] Using PDFPlumberLoader for Layout Preservation on {file_path} ---")
+        logger.debug("Using PDFPlumberLoader for layout preservation on %s", file_path)
         loader = PDFPlumberLoader(file_path)
     elif ext == ".docx":
         loader = Docx2txtLoader(file_path)
@@ -28,89 +61,525 @@ def load_document(file_path):
         raise ValueError(f"Unsupported file type: {ext}")
     return loader.load()
 
-def extract_text_with_ocr(file_path, progress_callback=None):
+def iter_ocr_documents(file_path, progress_callback=None, workers=None, pages=None):
+    """Yield one Document per OCR'd page with text (all pages, or only `pages`), in page order."""
+    from pypdf import PdfReader
+    from ocr_pool import iter_ocr_pages, OCR_WORKERS
+
+    workers = workers or OCR_WORKERS
+    num_pages = len(PdfReader(file_path).pages)
+    logger.info("OCR: %d of %d pages, using %d worker(s)", len(pages) if pages is not None else num_pages, num_pages, workers)
+    for i, page_text in iter_ocr_pages(
+        file_path, num_pages, workers=workers, progress_callback=progress_callback, pages=pages
+    ):
+        if page_text.strip():
+            yield Document(
+                page_content=page_text,
+                metadata={"source": file_path, "file_path": file_path, "page": i, "total_pages": num_pages},
+            )
+
+def extract_text_with_ocr(file_path, progress_callback=None, workers=None):
     """
     Fallback method to extract text from scanned PDFs using RapidOCR (No external binaries needed).
+    Pages are OCR'd in parallel by the shared worker pool (see ocr_pool.OCR_WORKERS);
+    pass workers=1 to force the serial path.
     """
-    import sys
-    print(f"--- [OCR] Starting RapidOCR fallback for: {file_path} ---")
+    logger.info("Starting RapidOCR fallback for %s", file_path)
     try:
-        from rapidocr_onnxruntime import RapidOCR
-        from pypdf import PdfReader
-        
-        ocr = RapidOCR()
-        reader = PdfReader(file_path)
-        num_pages = len(reader.pages)
-        print(f"--- [OCR] PDF has {num_pages} pages. ---")
-        documents = []
-        
-        for i, page in enumerate(reader.pages):
-            if progress_callback:
-                progress_callback(i + 1, num_pages)
-            page_text = ""
-            try:
-                # Extract images from the page
-                images = page.images
-                if images:
-                    print(f"--- [OCR] Processing page {i+1} ({len(images)} images) ---")
-                    for img in images:
-                        try:
-                            result, _ = ocr(img.data)
-                            if result:
-                                for line in result:
-                                    if line and len(line) >= 2:
-                                        text_content = line[1]
-                                        # Add a newline after each extracted block to prevent too much squishing
-                                        page_text += text_content + "\n"
-                        except Exception as img_e:
-                            print(f"--- [OCR] Warning: Failed to process an image on page {i+1}: {img_e} ---")
-            except Exception as page_e:
-                print(f"--- [OCR] Warning: Failed to extract images from page {i+1}: {page_e} ---")
-
-            if page_text.strip():
-                documents.append(Document(page_content=page_text, metadata={"source": file_path, "page": i}))
+        documents = list(iter_ocr_documents(file_path, progress_callback=progress_callback, workers=workers))
         
         if documents:
-            print(f"--- [OCR] TOTAL SUCCESS: Extracted text from {len(documents)} pages. ---")
+            logger.info("OCR extracted text from %d pages", len(documents))
         else:
-            print(f"--- [OCR] WARNING: Failed to extract any text even with OCR. ---")
+            logger.warning("OCR failed to extract any text from %s", file_path)
             
         return documents
 
+    except IngestionCancelled:
+        raise
     except ImportError as e:
-        print(f"--- [OCR] CRITICAL ERROR: Import failed! {e} ---")
+        logger.critical("OCR import failed: %s", e)
         return []
     except Exception as e:
-        print(f"--- [OCR] Critical Error during OCR: {e} ---")
+        logger.error("OCR failed: %s", e, exc_info=True)
         return []
 
-def ingest_file(file_path: str, folder_name: str = "default", progress_callback=None):
-    print(f"--- [INGEST] Starting ingestion for: {file_path} in folder: {folder_name} ---")
-    if not os.path.exists(file_path):
-        print(f"--- [INGEST] ERROR: File not found at {file_path} ---")
-        return {"error": "File not found"}
+def hash_file(file_path, block_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def hash_text(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def chunk_point_id(folder_name, source, chunk_hash):
+    return str(uuid.uuid5(POINT_ID_NAMESPACE, f"{folder_name}|{source}|{chunk_hash}"))
+
+def source_filter(folder_name, source):
+    return models.Filter(
+        must=[
+            models.FieldCondition(key="metadata.folder", match=models.MatchValue(value=folder_name)),
+            models.FieldCondition(key="metadata.source", match=models.MatchValue(value=source)),
+        ]
+    )
+
+def get_existing_point_ids(client, folder_name, source):
+    """All point IDs currently stored for one file in one folder."""
+    ids = set()
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=COLLECTION_NAME,
+            scroll_filter=source_filter(folder_name, source),
+            limit=1000,
+            offset=offset,
+            with_payload=False,
+            with_vectors=False,
+        )
+        ids.update(str(p.id) for p in points)
+        if offset is None:
+            return ids
+
+def assign_chunk_ids(splits, folder_name, source, seen):
+    """
+    Tag each chunk with its content hash and derive its deterministic point ID.
+    Returns [(point_id, doc)] for chunks not already in `seen` (which is updated).
+    """
+    assigned = []
+    for doc in splits:
+        chunk_hash = hash_text(doc.page_content)
+        point_id = chunk_point_id(folder_name, source, chunk_hash)
+        if point_id in seen:
+            continue
+        doc.metadata["chunk_hash"] = chunk_hash
+        seen.add(point_id)
+        assigned.append((point_id, doc))
+    return assigned
+
+def get_text_splitter():
+    return RecursiveCharacterTextSplitter(
+        chunk_size=CHUNK_SIZE,
+        chunk_overlap=CHUNK_OVERLAP
+    )
+
+def check_unchanged(client, manifest, file_path, folder_name, file_hash):
+    """Return a result dict if this exact file is already indexed in the folder, else None."""
+    previous = manifest.get(folder_name, file_path)
+    if not previous or previous["file_hash"] != file_hash:
+        return None
+    try:
+        indexed = client.count(collection_name=COLLECTION_NAME, count_filter=source_filter(folder_name, file_path)).count
+    except Exception:
+        indexed = 0
+    if not indexed:
+        return None
+    logger.info("Unchanged file (sha256 %s), skipping: %s", file_hash[:12], file_path)
+    return {
+        "num_chunks": previous["num_chunks"],
+        "status": "Unchanged",
+        "total_vectors": client.count(collection_name=COLLECTION_NAME).count,
+        "ocr_used": bool(previous["ocr_used"]),
+        "skipped": True
+    }
+
+def image_coverage(page):
+    """Fraction of a pdfplumber page covered by embedded images (overlaps not merged, capped at 1)."""
+    area = float(page.width * page.height)
+    if area <= 0:
+        return 0.0
+    covered = 0.0
+    for img in page.images:
+        width = min(img["x1"], page.width) - max(img["x0"], 0)
+        height = min(img["bottom"], page.height) - max(img["top"], 0)
+        if width > 0 and height > 0:
+            covered += width * height
+    return min(covered / area, 1.0)
 
-    docs = []
-    used_ocr = False
+def page_needs_ocr(text, has_images, coverage):
+    """Route a page to OCR when its images may hold text the text layer does not."""
+    if not has_images:
+        return False
+    min_chars = PAGE_SCAN_MIN_TEXT_CHARS if coverage >= PAGE_SCAN_COVERAGE else PAGE_MIN_TEXT_CHARS
+    return len(text.strip()) < min_chars
+
+def iter_pdf_pages(file_path, progress_callback=None):
+    """
+    Yield (Document, needs_ocr) per PDF page using pdfplumber, releasing each page's
+    layout objects as we go. needs_ocr comes from the text-layer length and image
+    coverage, both read from objects pdfplumber parses for the text anyway.
+    """
+    import pdfplumber
+
+    with pdfplumber.open(file_path) as pdf:
+        total = len(pdf.pages)
+        for i, page in enumerate(pdf.pages):
+            if progress_callback:
+                progress_callback(i + 1, total)
+            with INGEST_STAGE_SECONDS.time(stage="load"):
+                text = page.extract_text() or ""
+                images = page.images
+                needs_ocr = page_needs_ocr(text, bool(images), image_coverage(page) if images else 0.0)
+            # pdfplumber caches parsed characters per page; drop them so memory stays flat
+            page.flush_cache()
+            yield Document(
+                page_content=text,
+                metadata={"source": file_path, "file_path": file_path, "page": i, "total_pages": total}
+            ), needs_ocr
+
+def iter_pdf_text_pages(file_path, progress_callback=None):
+    """Yield one Document per PDF page from the text layer only."""
+    for doc, _ in iter_pdf_pages(file_path, progress_callback=progress_callback):
+        yield doc
+
+def iter_ocr_routed_pages(file_path, pending, progress_callback=None):
+    """
+    OCR the pages in `pending` (page index -> text-layer text, None for every page).
+    Whatever thin text layer a page had is kept in front of its OCR text.
+    """
+    pages = sorted(pending) if pending is not None else None
+    yielded = set()
+    for doc in iter_ocr_documents(file_path, progress_callback=progress_callback, pages=pages):
+        page = doc.metadata["page"]
+        layer = (pending or {}).get(page)
+        if layer and layer not in doc.page_content:
+            doc.page_content = layer + "\n" + doc.page_content
+        doc.metadata["ocr_processed"] = True
+        yielded.add(page)
+        yield doc
+    # OCR found nothing on these, but the text layer had something
+    for page, layer in sorted((pending or {}).items()):
+        if layer and page not in yielded:
+            yield Document(
+                page_content=layer,
+                metadata={"source": file_path, "file_path": file_path, "page": page, "ocr_processed": False},
+            )
+
+def iter_page_documents(file_path, progress_callback=None, state=None):
+    """
+    Yield non-empty page Documents one at a time. PDF pages are routed individually:
+    text pages stream straight from the text layer, pages that need it (see
+    page_needs_ocr) are OCR'd afterwards in the OCR pool. If the text layer cannot
+    be read at all, every page is OCR'd. state["used_ocr"] / state["ocr_pages"]
+    record how much OCR was needed.
+
+    progress_callback(done, total) counts pages against the whole document: a page
+    routed to OCR only counts once it has been OCR'd, and blank pages only once some
+    page had text (otherwise every page is OCR'd again), so progress never goes backwards.
+    """
+    state = state if state is not None else {}
+    state["used_ocr"] = False
+    state["ocr_pages"] = 0
+    is_pdf = file_path.lower().endswith(".pdf")
+    found = False
+    pending = {}  # page index -> text-layer text, for pages routed to OCR
+    total_pages = 0
+    done = 0  # pages reported as finished
+    deferred = 0  # blank pages seen before any text: finished only if no OCR fallback
+
+    if is_pdf:
+        pages = iter_pdf_pages(file_path)
+    else:
+        with INGEST_STAGE_SECONDS.time(stage="load"):
+            pages = ((doc, False) for doc in load_document(file_path))
 
-    # 1. Try Standard Load
     try:
-        docs = load_document(file_path)
-        print(f"--- [INGEST] Successfully loaded {len(docs)} segments (Standard) ---")
+        for doc, needs_ocr in pages:
+            if is_pdf:
+                total_pages = doc.metadata["total_pages"]
+            if needs_ocr:
+                pending[doc.metadata["page"]] = doc.page_content.strip()
+            elif doc.page_content and doc.page_content.strip():
+                if not found:
+                    found = True
+                    done, deferred = done + deferred, 0
+                done += 1
+                doc.metadata["ocr_processed"] = False
+                yield doc
+            elif found:
+                done += 1
+            else:
+                deferred += 1
+            if is_pdf and progress_callback:
+                progress_callback(done, total_pages)
+    except IngestionCancelled:
+        raise
     except Exception as e:
-        print(f"--- [INGEST] Standard load failed: {e}. Trying OCR... ---")
+        if found or not is_pdf:
+            raise
+        logger.warning("Standard load failed: %s. Trying OCR on every page...", e)
+        pending = None
 
-    # Filter empty pages
-    docs = [d for d in docs if d.page_content and d.page_content.strip()]
+    if not is_pdf or (found and not pending):
+        return
+    if not found and not pending:
+        # No text and no images pdfplumber could see: OCR everything, as before routing existed
+        logger.info("No text found with standard loader; attempting OCR")
+        pending = None
+    state["used_ocr"] = True
+    if pending is not None:
+        state["ocr_pages"] = len(pending)
+        logger.info("%d page(s) routed to OCR, the rest read from the text layer", len(pending))
+    ocr_callback = None
+    if progress_callback:
+        # OCR'd pages count on from the pages already finished: every non-routed page,
+        # or nothing when the whole document is OCR'd
+        offset = total_pages - len(pending) if pending is not None else done
+        ocr_callback = lambda ocr_done, ocr_total: progress_callback(offset + ocr_done, total_pages or ocr_total)
+    for doc in iter_ocr_routed_pages(file_path, pending, progress_callback=ocr_callback):
+        if pending is None:
+            state["ocr_pages"] += 1
+        yield doc
 
-    # 2. If no text, try OCR
-    if not docs and file_path.lower().endswith(".pdf"):
-        print("--- [INGEST] No text found with standard loader. Attempting OCR... ---")
-        docs = extract_text_with_ocr(file_path, progress_callback=progress_callback)
-        used_ocr = True
-        
-        # Filter again after OCR
-        docs = [d for d in docs if d.page_content and d.page_content.strip()]
+def chunk_to_point(point_id, doc, vector):
+    # Same payload layout as QdrantVectorStore so retrieval reads these points unchanged
+    return models.PointStruct(
+        id=point_id,
+        vector=vector.tolist() if hasattr(vector, "tolist") else vector,
+        payload={"page_content": doc.page_content, "metadata": doc.metadata},
+    )
+
+def rollback_points(client, point_ids):
+    """
+    Delete the points a failed or cancelled ingestion wrote, so Qdrant never keeps chunks
+    that have no keyword rows or manifest entry (a re-ingest would see their IDs and skip them).
+    """
+    if not point_ids:
+        return
+    try:
+        client.delete(
+            collection_name=COLLECTION_NAME, points_selector=models.PointIdsList(points=list(point_ids)), wait=True
+        )
+        logger.info("Rolled back %d chunks from an unfinished ingestion", len(point_ids))
+    except Exception as e:
+        logger.error("Could not roll back %d chunks: %s", len(point_ids), e, exc_info=True)
+
+_PIPELINE_DONE = object()
+
+def _put(q, item, stop):
+    """Blocking put that gives up once another stage has failed."""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def _get(q, stop):
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return _PIPELINE_DONE
+
+def ingest_file_streaming(file_path, folder_name, file_hash, progress_callback=None, source=None):
+    """
+    Streaming ingestion: pages flow through load/split -> embed -> upsert in batches of
+    INGEST_BATCH_SIZE chunks, with bounded queues between stages so OCR, embedding and
+    Qdrant writes overlap and peak memory does not grow with the page count.
+    """
+    source = source or file_path
+    client = get_qdrant_client()
+    writer = BulkWriter(get_bulk_qdrant_client(), COLLECTION_NAME)
+    keyword_index = get_keyword_index()
+    manifest = get_manifest()
+    engine = get_embedding_engine()
+    text_splitter = get_text_splitter()
+
+    existing_ids = get_existing_point_ids(client, folder_name, source)
+    current_ids = set()
+    state = {}
+    stats = {"pages": 0, "added": 0}
+    preview = []
+
+    to_embed = queue.Queue(maxsize=INGEST_PIPELINE_DEPTH)
+    to_upsert = queue.Queue(maxsize=INGEST_PIPELINE_DEPTH)
+    stop = threading.Event()
+    errors = []
+
+    def load_and_split():
+        try:
+            batch = []
+            for doc in iter_page_documents(file_path, progress_callback=progress_callback, state=state):
+                stats["pages"] += 1
+                if len(preview) < 3:
+                    preview.append(doc.page_content[:100])
+                doc.metadata["folder"] = folder_name
+                doc.metadata["source"] = doc.metadata["file_path"] = source
+                doc.metadata.setdefault("ocr_processed", False)
+                with INGEST_STAGE_SECONDS.time(stage="split"):
+                    splits = text_splitter.split_documents([doc])
+                for point_id, chunk in assign_chunk_ids(splits, folder_name, source, current_ids):
+                    if point_id in existing_ids:
+                        continue
+                    batch.append((point_id, chunk))
+                    if len(batch) >= INGEST_BATCH_SIZE:
+                        if not _put(to_embed, batch, stop):
+                            return
+                        batch = []
+            if batch:
+                _put(to_embed, batch, stop)
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            _put(to_embed, _PIPELINE_DONE, stop)
+
+    def embed():
+        try:
+            while True:
+                batch = _get(to_embed, stop)
+                if batch is _PIPELINE_DONE:
+                    break
+                with INGEST_STAGE_SECONDS.time(stage="embed"):
+                    vectors = engine.embed([chunk.page_content for _, chunk in batch])
+                if not _put(to_upsert, (batch, vectors), stop):
+                    return
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            _put(to_upsert, _PIPELINE_DONE, stop)
+
+    workers = [
+        threading.Thread(target=load_and_split, name="ingest-load", daemon=True),
+        threading.Thread(target=embed, name="ingest-embed", daemon=True),
+    ]
+    for t in workers:
+        t.start()
+
+    # Upsert stage runs on the calling thread. Keyword rows wait for writer.flush() so a
+    # failed upsert never leaves BM25 entries pointing at points that do not exist; on
+    # failure or cancel every point handed to the writer is rolled back instead.
+    keyword_rows = []
+    sent_ids = []
+    try:
+        while True:
+            item = _get(to_upsert, stop)
+            if item is _PIPELINE_DONE:
+                break
+            batch, vectors = item
+            sent_ids.extend(pid for pid, _ in batch)
+            writer.add([chunk_to_point(pid, chunk, vec) for (pid, chunk), vec in zip(batch, vectors)])
+            if keyword_index is not None:
+                keyword_rows.extend((pid, chunk.page_content) for pid, chunk in batch)
+            stats["added"] += len(batch)
+            logger.debug("Queued %d chunks for upsert (%d pages read)", stats["added"], stats["pages"])
+        if not errors:
+            # Wait until every batch is acknowledged and the last one is applied
+            writer.flush()
+            if keyword_rows:
+                keyword_index.add(folder_name, source, keyword_rows)
+    except BaseException as e:
+        errors.append(e)
+        stop.set()
+    finally:
+        writer.close()
+        for t in workers:
+            t.join()
+
+    if errors:
+        rollback_points(client, sent_ids)
+        raise errors[0]
+
+    used_ocr = state.get("used_ocr", False)
+    if not current_ids:
+        if used_ocr:
+             msg = "No text extracted even with OCR. The file might be empty, corrupted, or contain unsupported image formats."
+        else:
+             msg = "No text extracted. This file appears to be empty or an image/scanned PDF."
+        logger.error("Ingestion failed for %s: %s", file_path, msg)
+        return {"error": msg}
+
+    full_text_preview = " ".join(preview).replace("\n", " ")
+    logger.debug("Text preview: %s...", full_text_preview)
+
+    stale_ids = list(existing_ids - current_ids)
+    if stale_ids:
+        logger.info("Removing %d stale chunks from Qdrant", len(stale_ids))
+        client.delete(collection_name=COLLECTION_NAME, points_selector=models.PointIdsList(points=stale_ids))
+        if keyword_index is not None:
+            keyword_index.remove(stale_ids)
+
+    manifest.upsert(folder_name, source, file_hash, len(current_ids), ocr_used=used_ocr)
+    invalidate_folder(folder_name)
+
+    try:
+        post_count = client.count(collection_name=COLLECTION_NAME).count
+    except Exception:
+        post_count = 0
+
+    logger.info(
+        "Ingested %s: %d new, %d unchanged, %d removed chunks",
+        file_path, stats["added"], len(current_ids) - stats["added"], len(stale_ids),
+    )
+
+    return {
+        "num_chunks": len(current_ids),
+        "status": "Ingested (OCR)" if used_ocr else "Ingested",
+        "total_vectors": post_count,
+        "ocr_used": used_ocr,
+        "ocr_pages": state.get("ocr_pages", 0),
+        "chunks_added": stats["added"],
+        "chunks_removed": len(stale_ids)
+    }
+
+def ingest_file(file_path: str, folder_name: str = "default", progress_callback=None, streaming=None, source=None):
+    """
+    Ingest one file into a folder. `source` is the name the chunks are indexed under
+    (defaults to file_path); uploads pass a stable name so a re-upload stored at a
+    different path still replaces the earlier version.
+    """
+    try:
+        result = _ingest_file(
+            file_path, folder_name, progress_callback=progress_callback, streaming=streaming, source=source
+        )
+    except IngestionCancelled:
+        INGEST_FILES.inc(result="cancelled")
+        raise
+    except Exception:
+        INGEST_FILES.inc(result="failed")
+        raise
+    if "error" in result:
+        INGEST_FILES.inc(result="failed")
+    else:
+        INGEST_FILES.inc(result="unchanged" if result.get("status") == "Unchanged" else "ingested")
+    return result
+
+def _ingest_file(file_path, folder_name, progress_callback=None, streaming=None, source=None):
+    source = source or file_path
+    logger.info("Starting ingestion for %s", file_path, extra={"folder": folder_name})
+    if not os.path.exists(file_path):
+        logger.error("File not found at %s", file_path)
+        return {"error": "File not found"}
+
+    # 0. Skip files whose exact bytes are already indexed in this folder
+    file_hash = hash_file(file_path)
+    manifest = get_manifest()
+    client = get_qdrant_client()
+    unchanged = check_unchanged(client, manifest, source, folder_name, file_hash)
+    if unchanged:
+        return unchanged
+
+    if STREAMING_INGEST if streaming is None else streaming:
+        return ingest_file_streaming(
+            file_path, folder_name, file_hash, progress_callback=progress_callback, source=source
+        )
+
+    # 1. Load: text-layer pages directly, pages that need it through OCR
+    state = {}
+    try:
+        docs = list(iter_page_documents(file_path, progress_callback=progress_callback, state=state))
+        logger.info("Loaded %d pages (%d via OCR)", len(docs), state["ocr_pages"])
+    except IngestionCancelled:
+        raise
+    except Exception as e:
+        logger.warning("Load failed: %s", e)
+        docs = []
+    used_ocr = state.get("used_ocr", False)
 
     if not docs:
         if used_ocr:
@@ -118,46 +587,58 @@ def ingest_file(file_path: str, folder_name: str = "default", progress_callback=
         else:
              msg = "No text extracted. This file appears to be empty or an image/scanned PDF."
              
-        print(f"--- [INGEST] FAILURE: {msg} ---")
+        logger.error("Ingestion failed for %s: %s", file_path, msg)
         return {"error": msg}
 
-    full_text_preview = " ".join([d.page_content[:100] for d in docs[:3]])
-    print(f"--- [INGEST] Text Preview: {full_text_preview.replace('\\n', ' ')}... ---")
+    full_text_preview = " ".join([d.page_content[:100] for d in docs[:3]]).replace("\n", " ")
+    logger.debug("Text preview: %s...", full_text_preview)
     
     # 1.5 Add Metadata
     for doc in docs:
         doc.metadata["folder"] = folder_name
-        doc.metadata["ocr_processed"] = used_ocr
+        doc.metadata["source"] = doc.metadata["file_path"] = source
+        doc.metadata.setdefault("ocr_processed", False)
     
     # 2. Split
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=500,
-        chunk_overlap=100
-    )
-    splits = text_splitter.split_documents(docs)
-    print(f"--- [INGEST] Split into {len(splits)} chunks ---")
-    
-    # 3. Embeddings
-    embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
-    
-    # Use Singleton Client
-    client = get_qdrant_client()
-    
-    # Check pre-ingest count
-    try:
-        pre_count = client.count(collection_name=COLLECTION_NAME).count
-    except Exception:
-        pre_count = 0
+    text_splitter = get_text_splitter()
+    with INGEST_STAGE_SECONDS.time(stage="split"):
+        splits = text_splitter.split_documents(docs)
+    logger.info("Split into %d chunks", len(splits))
 
-    # Using the modern QdrantVectorStore
-    qdrant = QdrantVectorStore(
-        client=client,
-        embedding=embeddings,
-        collection_name=COLLECTION_NAME,
-    )
+    # 2.5 Deterministic IDs from chunk content, so re-ingestion is idempotent
+    current_ids = set()
+    assigned = assign_chunk_ids(splits, folder_name, source, current_ids)
+
+    existing_ids = get_existing_point_ids(client, folder_name, source)
+    new_docs = [doc for pid, doc in assigned if pid not in existing_ids]
+    new_ids = [pid for pid, _ in assigned if pid not in existing_ids]
+    stale_ids = list(existing_ids - current_ids)
+    logger.info("%d new, %d unchanged, %d removed chunks", len(new_ids), len(current_ids) - len(new_ids), len(stale_ids))
     
-    print(f"--- [INGEST] Adding {len(splits)} documents to Qdrant ---")
-    qdrant.add_documents(splits)
+    # 3. Embeddings (shared model, length-sorted batches)
+    if new_docs:
+        with INGEST_STAGE_SECONDS.time(stage="embed"):
+            vectors = get_embedding_engine().embed([doc.page_content for doc in new_docs])
+        logger.info("Adding %d documents to Qdrant", len(new_docs))
+        writer = BulkWriter(get_bulk_qdrant_client(), COLLECTION_NAME)
+        try:
+            writer.add([chunk_to_point(pid, doc, vec) for pid, doc, vec in zip(new_ids, new_docs, vectors)])
+            writer.flush()
+        except BaseException:
+            writer.close()
+            rollback_points(client, new_ids)
+            raise
+    keyword_index = get_keyword_index()
+    if keyword_index is not None:
+        keyword_index.add(folder_name, source, [(pid, doc.page_content) for pid, doc in zip(new_ids, new_docs)])
+    if stale_ids:
+        logger.info("Removing %d stale chunks from Qdrant", len(stale_ids))
+        client.delete(collection_name=COLLECTION_NAME, points_selector=models.PointIdsList(points=stale_ids))
+        if keyword_index is not None:
+            keyword_index.remove(stale_ids)
+
+    manifest.upsert(folder_name, source, file_hash, len(current_ids), ocr_used=used_ocr)
+    invalidate_folder(folder_name)
     
     # Check post-ingest count
     try:
@@ -167,11 +648,14 @@ def ingest_file(file_path: str, folder_name: str = "default", progress_callback=
     
     status_msg = "Ingested (OCR)" if used_ocr else "Ingested"
 
-    print(f"--- [INGEST] Success! Documents added to Qdrant. ---")
+    logger.info("Ingested %s", file_path)
     
     return {
-        "num_chunks": len(splits), 
+        "num_chunks": len(current_ids), 
         "status": status_msg, 
         "total_vectors": post_count,
-        "ocr_used": used_ocr
+        "ocr_used": used_ocr,
+        "ocr_pages": state.get("ocr_pages", 0),
+        "chunks_added": len(new_ids),
+        "chunks_removed": len(stale_ids)
     }
@@ -0,0 +1,352 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from log_config import get_logger
+
+logger = get_logger("jobs")
+
+# Configuration
+# "sqlite" is shared by every process on the host; "memory" is a single-process
+# stand-in with the same semantics as a Redis hash + EXPIRE.
+JOB_STORE_BACKEND = os.environ.get("JOB_STORE_BACKEND", "sqlite")
+JOB_STORE_PATH = os.environ.get("JOB_STORE_PATH", "jobs.db")
+# Finished and abandoned jobs are forgotten this long after their last update
+JOB_TTL_SECONDS = int(os.environ.get("JOB_TTL_SECONDS", 24 * 60 * 60))
+# Expired rows are swept at most this often, piggybacking on writes
+JOB_EVICT_INTERVAL = int(os.environ.get("JOB_EVICT_INTERVAL", 60))
+
+JOB_FIELDS = ("folder", "status", "progress", "current_page", "total_pages",
+              "cancel_requested", "submitted_at", "started_at", "finished_at")
+FILE_FIELDS = ("status", "error", "details")
+
+
+class JobStore:
+    """
+    Minimal interface for job status storage. A job is a dict of JOB_FIELDS plus a
+    "files" list; every file has filename, path and FILE_FIELDS. Implementations must
+    make each method atomic and expire jobs JOB_TTL_SECONDS after their last update.
+    """
+
+    def create(self, job_id, folder, files):
+        raise NotImplementedError
+
+    def get(self, job_id):
+        raise NotImplementedError
+
+    def update(self, job_id, **fields):
+        raise NotImplementedError
+
+    def update_file(self, job_id, index, **fields):
+        raise NotImplementedError
+
+    def set_progress(self, job_id, current_page, total_pages):
+        return self.update(
+            job_id,
+            current_page=current_page,
+            total_pages=total_pages,
+            progress=int((current_page / total_pages) * 100) if total_pages else 0,
+        )
+
+    def start(self, job_id):
+        """
+        Atomically move a queued job that has no pending cancel to "processing".
+        Returns False if it was cancelled, already started, or is unknown.
+        """
+        raise NotImplementedError
+
+    def request_cancel(self, job_id):
+        """Flag a job for cancellation. Returns the job's status, or None if unknown/finished."""
+        raise NotImplementedError
+
+    def is_cancel_requested(self, job_id):
+        job = self.get(job_id)
+        return bool(job and job.get("cancel_requested"))
+
+    def delete(self, job_id):
+        raise NotImplementedError
+
+    def evict_expired(self):
+        raise NotImplementedError
+
+
+def _new_job(job_id, folder, files, now):
+    return {
+        "job_id": job_id,
+        "folder": folder,
+        "status": "queued",
+        "progress": 0,
+        "current_page": 0,
+        "total_pages": 0,
+        "cancel_requested": False,
+        "submitted_at": now,
+        "started_at": None,
+        "finished_at": None,
+        "files": [
+            {"filename": f["filename"], "path": f["path"], "status": "queued", "error": None, "details": None}
+            for f in files
+        ],
+    }
+
+
+class MemoryJobStore(JobStore):
+    def __init__(self, ttl=JOB_TTL_SECONDS):
+        self.ttl = ttl
+        self._jobs = {}
+        self._expires = {}
+        self._lock = threading.Lock()
+        self._last_evict = 0.0
+
+    def _touch(self, job_id, now):
+        self._expires[job_id] = now + self.ttl
+        if now - self._last_evict > JOB_EVICT_INTERVAL:
+            self._evict(now)
+
+    def _evict(self, now):
+        self._last_evict = now
+        for job_id in [j for j, exp in self._expires.items() if exp <= now]:
+            self._jobs.pop(job_id, None)
+            self._expires.pop(job_id, None)
+
+    def create(self, job_id, folder, files):
+        now = time.time()
+        with self._lock:
+            self._jobs[job_id] = _new_job(job_id, folder, files, now)
+            self._touch(job_id, now)
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or self._expires.get(job_id, 0) <= time.time():
+                return None
+            return json.loads(json.dumps(job))
+
+    def update(self, job_id, **fields):
+        unknown = set(fields) - set(JOB_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown job fields: {sorted(unknown)}")
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return False
+            job.update(fields)
+            self._touch(job_id, time.time())
+            return True
+
+    def update_file(self, job_id, index, **fields):
+        unknown = set(fields) - set(FILE_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown file fields: {sorted(unknown)}")
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return False
+            job["files"][index].update(fields)
+            self._touch(job_id, time.time())
+            return True
+
+    def start(self, job_id):
+        now = time.time()
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job["status"] != "queued" or job["cancel_requested"]:
+                return False
+            job["status"] = "processing"
+            job["started_at"] = now
+            self._touch(job_id, now)
+            return True
+
+    def request_cancel(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job["status"] not in ("queued", "processing"):
+                return None
+            job["cancel_requested"] = True
+            self._touch(job_id, time.time())
+            return job["status"]
+
+    def delete(self, job_id):
+        with self._lock:
+            self._jobs.pop(job_id, None)
+            self._expires.pop(job_id, None)
+
+    def evict_expired(self):
+        with self._lock:
+            self._evict(time.time())
+
+
+class SQLiteJobStore(JobStore):
+    """
+    Job store in a local SQLite file (WAL mode), shared by every uvicorn worker on the host.
+    Progress updates are single-row UPDATEs; reads never block writers.
+    """
+
+    def __init__(self, path=JOB_STORE_PATH, ttl=JOB_TTL_SECONDS):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+        self._last_evict = 0.0
+        conn = self._conn()
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                folder TEXT,
+                status TEXT,
+                progress INTEGER DEFAULT 0,
+                current_page INTEGER DEFAULT 0,
+                total_pages INTEGER DEFAULT 0,
+                cancel_requested INTEGER DEFAULT 0,
+                submitted_at REAL,
+                started_at REAL,
+                finished_at REAL,
+                expires_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS jobs_expires_at ON jobs (expires_at);
+            CREATE TABLE IF NOT EXISTS job_files (
+                job_id TEXT,
+                idx INTEGER,
+                filename TEXT,
+                path TEXT,
+                status TEXT,
+                error TEXT,
+                details TEXT,
+                PRIMARY KEY (job_id, idx)
+            );
+        """)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _maybe_evict(self, now):
+        if now - self._last_evict > JOB_EVICT_INTERVAL:
+            self._last_evict = now
+            self.evict_expired()
+
+    def create(self, job_id, folder, files):
+        now = time.time()
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM job_files WHERE job_id = ?", (job_id,))
+            conn.execute(
+                "INSERT OR REPLACE INTO jobs (job_id, folder, status, submitted_at, expires_at) VALUES (?, ?, 'queued', ?, ?)",
+                (job_id, folder, now, now + self.ttl),
+            )
+            conn.executemany(
+                "INSERT INTO job_files (job_id, idx, filename, path, status) VALUES (?, ?, ?, ?, 'queued')",
+                [(job_id, i, f["filename"], f["path"]) for i, f in enumerate(files)],
+            )
+        self._maybe_evict(now)
+
+    def get(self, job_id):
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT * FROM jobs WHERE job_id = ? AND expires_at > ?", (job_id, time.time())
+        ).fetchone()
+        if row is None:
+            return None
+        job = {k: row[k] for k in row.keys() if k != "expires_at"}
+        job["cancel_requested"] = bool(job["cancel_requested"])
+        job["files"] = [
+            {
+                "filename": f["filename"],
+                "path": f["path"],
+                "status": f["status"],
+                "error": f["error"],
+                "details": json.loads(f["details"]) if f["details"] else None,
+            }
+            for f in conn.execute("SELECT * FROM job_files WHERE job_id = ? ORDER BY idx", (job_id,))
+        ]
+        return job
+
+    def update(self, job_id, **fields):
+        unknown = set(fields) - set(JOB_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown job fields: {sorted(unknown)}")
+        now = time.time()
+        assignments = ", ".join(f"{k} = ?" for k in fields)
+        cur = self._conn().execute(
+            f"UPDATE jobs SET {assignments}, expires_at = ? WHERE job_id = ?",
+            (*fields.values(), now + self.ttl, job_id),
+        )
+        self._maybe_evict(now)
+        return cur.rowcount > 0
+
+    def update_file(self, job_id, index, **fields):
+        unknown = set(fields) - set(FILE_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown file fields: {sorted(unknown)}")
+        if "details" in fields and fields["details"] is not None:
+            fields["details"] = json.dumps(fields["details"])
+        assignments = ", ".join(f"{k} = ?" for k in fields)
+        cur = self._conn().execute(
+            f"UPDATE job_files SET {assignments} WHERE job_id = ? AND idx = ?",
+            (*fields.values(), job_id, index),
+        )
+        return cur.rowcount > 0
+
+    def start(self, job_id):
+        now = time.time()
+        cur = self._conn().execute(
+            "UPDATE jobs SET status = 'processing', started_at = ?, expires_at = ? "
+            "WHERE job_id = ? AND status = 'queued' AND cancel_requested = 0 AND expires_at > ?",
+            (now, now + self.ttl, job_id, now),
+        )
+        return cur.rowcount > 0
+
+    def request_cancel(self, job_id):
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT status FROM jobs WHERE job_id = ? AND status IN ('queued', 'processing')", (job_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE job_id = ?", (job_id,))
+            return row["status"]
+
+    def is_cancel_requested(self, job_id):
+        row = self._conn().execute("SELECT cancel_requested FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return bool(row and row["cancel_requested"])
+
+    def delete(self, job_id):
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM job_files WHERE job_id = ?", (job_id,))
+            conn.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+
+    def evict_expired(self):
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "DELETE FROM job_files WHERE job_id IN (SELECT job_id FROM jobs WHERE expires_at <= ?)", (time.time(),)
+            )
+            conn.execute("DELETE FROM jobs WHERE expires_at <= ?", (time.time(),))
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_job_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if JOB_STORE_BACKEND == "memory":
+                    _store = MemoryJobStore()
+                else:
+                    logger.info("Using SQLite job store at %s", JOB_STORE_PATH)
+                    _store = SQLiteJobStore()
+    return _store
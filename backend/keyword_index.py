@@ -0,0 +1,336 @@
+import os
+import re
+import math
+import sqlite3
+import threading
+from collections import Counter
+from log_config import get_logger
+
+logger = get_logger("keyword")
+
+# Configuration
+KEYWORD_INDEX_ENABLED = os.environ.get("KEYWORD_INDEX_ENABLED", "1") == "1"
+KEYWORD_INDEX_PATH = os.environ.get("KEYWORD_INDEX_PATH", "keyword_index.db")
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Terms found in more than this fraction of a large corpus carry almost no signal
+# and are skipped rather than scored. Document frequencies come from term_stats, so
+# a skipped term's posting list is never read.
+MAX_DF_RATIO = 0.5
+MIN_DOCS_FOR_DF_CUTOFF = 100
+
+# Identifiers are kept whole (e.g. "inv-2024-001", "info@company.com", "02-17-2025")
+# and also split into their alphanumeric parts so partial matches still score.
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:[@._/\-][a-z0-9]+)*")
+SPLIT_RE = re.compile(r"[@._/\-]")
+STOPWORDS = frozenset("""
+a an and are as at be by for from has have in is it its of on or that the this to was
+were what when where which who whom whose why how with does do did can could should
+would will me my our your their there please tell give show find
+""".split())
+
+
+def tokenize(text):
+    tokens = []
+    for match in TOKEN_RE.finditer(text.lower()):
+        token = match.group()
+        if token in STOPWORDS:
+            continue
+        tokens.append(token)
+        if not token.isalnum():
+            tokens.extend(p for p in SPLIT_RE.split(token) if p and p not in STOPWORDS)
+    return tokens
+
+
+# Identifier-shaped words: emails, codes mixing letters and digits ("INV2024",
+# "inv-2024-001", "v1.2"), numbers joined by - / _ ("02-17-2025", "2024/01/05") and
+# snake_case names. Plain numbers, decimals, arithmetic ("2+2"), quantities and
+# ordinals ("5kg", "2nd") and hyphenated words ("well-known") are prose, not lookups.
+EMAIL_RE = re.compile(r"[^@\s]+@[^@\s]+\.[a-z]{2,}", re.IGNORECASE)
+CODE_RE = re.compile(r"[a-z0-9]+(?:[._/\-][a-z0-9]+)*", re.IGNORECASE)
+JOINED_NUMBER_RE = re.compile(r"\d+(?:[/_\-]\d+)+")
+SNAKE_RE = re.compile(r"[a-z]+(?:_[a-z0-9]+)+", re.IGNORECASE)
+QUANTITY_RE = re.compile(r"\d+(?:\.\d+)?[a-z]{1,3}")
+
+
+def is_identifier(word):
+    word = word.strip(",;:!?.()[]\"'")
+    if EMAIL_RE.fullmatch(word) or JOINED_NUMBER_RE.fullmatch(word) or SNAKE_RE.fullmatch(word):
+        return True
+    if QUANTITY_RE.fullmatch(word):
+        return False
+    return bool(CODE_RE.fullmatch(word)) and any(ch.isdigit() for ch in word) and any(ch.isalpha() for ch in word)
+
+
+def is_identifier_query(question):
+    """Short queries (at most 3 words) containing an identifier rather than prose."""
+    words = question.strip().rstrip("?").split()
+    return 0 < len(words) <= 3 and any(is_identifier(w) for w in words)
+
+
+class KeywordIndex:
+    """
+    BM25 inverted index over ingested chunks, keyed by the same point IDs as Qdrant.
+    Catches exact values (invoice numbers, emails, dates) that dense MiniLM retrieval
+    tends to miss, and answers identifier lookups without embedding the query.
+    Backed by SQLite so every API worker and the ingestion workers share it.
+    """
+
+    def __init__(self, path=KEYWORD_INDEX_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._conn().executescript("""
+            CREATE TABLE IF NOT EXISTS chunks (
+                point_id TEXT PRIMARY KEY,
+                folder TEXT,
+                source TEXT,
+                length INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS chunks_folder_source ON chunks (folder, source);
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT,
+                point_id TEXT,
+                tf INTEGER,
+                PRIMARY KEY (term, point_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS postings_point ON postings (point_id);
+            CREATE TABLE IF NOT EXISTS folder_stats (
+                folder TEXT PRIMARY KEY,
+                num_chunks INTEGER,
+                total_length INTEGER
+            );
+            -- Per-folder document frequency of each term, kept in step with postings
+            CREATE TABLE IF NOT EXISTS term_stats (
+                folder TEXT,
+                term TEXT,
+                df INTEGER,
+                PRIMARY KEY (folder, term)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS term_stats_term ON term_stats (term);
+        """)
+        self._backfill_term_stats()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _backfill_term_stats(self):
+        """One-off: derive term_stats for indexes built before the table existed."""
+        conn = self._conn()
+        if conn.execute("SELECT 1 FROM term_stats LIMIT 1").fetchone() or self.is_empty():
+            return
+        logger.info("Building keyword document frequencies from existing postings")
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO term_stats (folder, term, df) "
+                "SELECT c.folder, p.term, COUNT(*) FROM postings p JOIN chunks c ON c.point_id = p.point_id "
+                "GROUP BY c.folder, p.term"
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def add(self, folder, source, chunks):
+        """Index [(point_id, text)]; re-adding a point replaces its postings."""
+        chunks = [(str(pid), text) for pid, text in chunks]
+        if not chunks:
+            return
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._remove(conn, [pid for pid, _ in chunks])
+            total_length = 0
+            df = Counter()
+            for pid, text in chunks:
+                counts = Counter(tokenize(text))
+                length = sum(counts.values())
+                total_length += length
+                df.update(counts.keys())
+                conn.execute(
+                    "INSERT INTO chunks (point_id, folder, source, length) VALUES (?, ?, ?, ?)",
+                    (pid, folder, source, length),
+                )
+                conn.executemany(
+                    "INSERT INTO postings (term, point_id, tf) VALUES (?, ?, ?)",
+                    [(term, pid, tf) for term, tf in counts.items()],
+                )
+            conn.execute(
+                "INSERT INTO folder_stats (folder, num_chunks, total_length) VALUES (?, ?, ?) "
+                "ON CONFLICT(folder) DO UPDATE SET num_chunks = num_chunks + excluded.num_chunks, "
+                "total_length = total_length + excluded.total_length",
+                (folder, len(chunks), total_length),
+            )
+            conn.executemany(
+                "INSERT INTO term_stats (folder, term, df) VALUES (?, ?, ?) "
+                "ON CONFLICT(folder, term) DO UPDATE SET df = df + excluded.df",
+                [(folder, term, n) for term, n in df.items()],
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _remove(self, conn, point_ids):
+        for i in range(0, len(point_ids), 500):
+            batch = point_ids[i:i + 500]
+            marks = ",".join("?" * len(batch))
+            rows = conn.execute(
+                f"SELECT folder, COUNT(*), SUM(length) FROM chunks WHERE point_id IN ({marks}) GROUP BY folder",
+                batch,
+            ).fetchall()
+            for folder, count, length in rows:
+                conn.execute(
+                    "UPDATE folder_stats SET num_chunks = num_chunks - ?, total_length = total_length - ? WHERE folder = ?",
+                    (count, length or 0, folder),
+                )
+            conn.executemany(
+                "UPDATE term_stats SET df = df - ? WHERE folder = ? AND term = ?",
+                [
+                    (count, folder, term)
+                    for folder, term, count in conn.execute(
+                        f"SELECT c.folder, p.term, COUNT(*) FROM postings p JOIN chunks c ON c.point_id = p.point_id "
+                        f"WHERE p.point_id IN ({marks}) GROUP BY c.folder, p.term",
+                        batch,
+                    ).fetchall()
+                ],
+            )
+            conn.execute(f"DELETE FROM postings WHERE point_id IN ({marks})", batch)
+            conn.execute(f"DELETE FROM chunks WHERE point_id IN ({marks})", batch)
+
+    def remove(self, point_ids):
+        point_ids = [str(pid) for pid in point_ids]
+        if not point_ids:
+            return
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._remove(conn, point_ids)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def remove_folder(self, folder):
+        ids = [row[0] for row in self._conn().execute("SELECT point_id FROM chunks WHERE folder = ?", (folder,))]
+        self.remove(ids)
+        self._conn().execute("DELETE FROM folder_stats WHERE folder = ?", (folder,))
+        self._conn().execute("DELETE FROM term_stats WHERE folder = ?", (folder,))
+
+    def is_empty(self):
+        return self._conn().execute("SELECT 1 FROM chunks LIMIT 1").fetchone() is None
+
+    def search(self, query, folder=None, k=10):
+        """BM25 top-k as [(point_id, score)], optionally restricted to one folder."""
+        terms = sorted(set(tokenize(query)))
+        if not terms:
+            return []
+        conn = self._conn()
+        if folder:
+            row = conn.execute(
+                "SELECT num_chunks, total_length FROM folder_stats WHERE folder = ?", (folder,)
+            ).fetchone()
+        else:
+            row = conn.execute("SELECT SUM(num_chunks), SUM(total_length) FROM folder_stats").fetchone()
+        num_docs, total_length = (row or (0, 0))
+        if not num_docs:
+            return []
+        avg_length = (total_length or 0) / num_docs or 1.0
+
+        # Document frequencies first, so over-common terms never reach the posting scan
+        marks = ",".join("?" * len(terms))
+        if folder:
+            df = dict(conn.execute(
+                f"SELECT term, df FROM term_stats WHERE folder = ? AND term IN ({marks})", [folder] + terms
+            ).fetchall())
+        else:
+            df = dict(conn.execute(
+                f"SELECT term, SUM(df) FROM term_stats WHERE term IN ({marks}) GROUP BY term", terms
+            ).fetchall())
+        terms = [
+            t for t in terms
+            if df.get(t, 0) > 0 and not (num_docs >= MIN_DOCS_FOR_DF_CUTOFF and df[t] > MAX_DF_RATIO * num_docs)
+        ]
+        if not terms:
+            return []
+
+        marks = ",".join("?" * len(terms))
+        if folder:
+            rows = conn.execute(
+                f"SELECT p.term, p.point_id, p.tf, c.length FROM postings p JOIN chunks c ON c.point_id = p.point_id "
+                f"WHERE p.term IN ({marks}) AND c.folder = ?",
+                terms + [folder],
+            ).fetchall()
+        else:
+            rows = conn.execute(
+                f"SELECT p.term, p.point_id, p.tf, c.length FROM postings p JOIN chunks c ON c.point_id = p.point_id "
+                f"WHERE p.term IN ({marks})",
+                terms,
+            ).fetchall()
+
+        scores = {}
+        for term, pid, tf, length in rows:
+            n = df[term]
+            idf = math.log(1 + (num_docs - n + 0.5) / (n + 0.5))
+            norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length)
+            scores[pid] = scores.get(pid, 0.0) + idf * tf * (BM25_K1 + 1) / norm
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+    def stats(self):
+        conn = self._conn()
+        chunks, length = conn.execute("SELECT SUM(num_chunks), SUM(total_length) FROM folder_stats").fetchone()
+        terms = conn.execute("SELECT COUNT(DISTINCT term) FROM postings").fetchone()[0]
+        return {"chunks": chunks or 0, "tokens": length or 0, "terms": terms}
+
+
+def rebuild_from_qdrant(client, collection_name, batch_size=1000):
+    """Index every point already in Qdrant (collections ingested before the keyword index existed)."""
+    index = get_keyword_index()
+    if index is None:
+        return 0
+    total = 0
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=collection_name,
+            limit=batch_size,
+            offset=offset,
+            with_payload=True,
+            with_vectors=False,
+        )
+        by_source = {}
+        for p in points:
+            payload = p.payload or {}
+            metadata = payload.get("metadata") or {}
+            key = (metadata.get("folder"), metadata.get("source"))
+            by_source.setdefault(key, []).append((p.id, payload.get("page_content", "")))
+        for (folder, source), chunks in by_source.items():
+            index.add(folder, source, chunks)
+        total += len(points)
+        if offset is None:
+            break
+    logger.info("Rebuilt keyword index from %d points", total)
+    return total
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_keyword_index():
+    """Shared keyword index, or None when disabled."""
+    global _index
+    if not KEYWORD_INDEX_ENABLED:
+        return None
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = KeywordIndex()
+    return _index
@@ -0,0 +1,439 @@
+"""
+Load test: drive the real API (main.app) at increasing request rates against a fake Ollama.
+
+By default the API is started in-process with uvicorn on a scratch directory (own Qdrant,
+keyword index, job store, uploads and folders.json) and the fake Ollama server answers
+generations with a configurable time to first token, per-token latency and concurrency
+cap. Requests arrive open-loop (Poisson) at each rate step in the configured mix of
+/query/, /query/stream and /upload/; the API's /metrics gauges are sampled while the
+step runs to show where requests queue.
+
+For every step the report has achieved throughput, error rate, latency percentiles per
+request kind and peak queue depths. The first step that misses the offered rate, breaks
+the error budget or the p99 SLO is reported as the saturation point.
+
+Run from the backend directory:
+    python loadtest.py --rates 1,2,4,8 --duration 30 --mix query=0.7,stream=0.2,upload=0.1
+    python loadtest.py --url http://127.0.0.1:8000 ...   # an API started separately
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import asyncio
+import argparse
+import tempfile
+import threading
+
+import httpx
+
+from fake_ollama import serve_fake_ollama
+# Only modules that read no store configuration: isolate() must run before the backend is imported
+from benchmark import isolate, rate
+
+FOLDER = "loadtest"
+KINDS = ("query", "stream", "upload")
+SEED_PDFS = ["synthetic_data_1000.pdf"]
+SAMPLE_INTERVAL = 0.5
+# /metrics gauges sampled during each step
+SAMPLED_GAUGES = ("llm_queue_depth", "llm_inflight", "ingest_queue_depth")
+QUESTIONS = [
+    "What is the invoice number for customer {n}?",
+    "What is the amount due on invoice LT-{n:06d}?",
+    "Which email address is listed for Load Test Customer {n}?",
+    "What is the due date for order {n}?",
+    "Who is the customer on invoice {n}?",
+]
+UPLOAD_TEMPLATE = (
+    "Invoice Number: LT-{n:06d}\n"
+    "Customer: Load Test Customer {n}\n"
+    "Email: customer{n}@example.com\n"
+    "Amount Due: ${amount:.2f}\n"
+    "Due Date: 2026-{month:02d}-15\n"
+)
+
+
+def percentile(samples, q):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * q))]
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        kind, _, weight = part.partition("=")
+        kind = kind.strip()
+        if kind not in KINDS:
+            raise ValueError(f"Unknown request kind '{kind}' (expected one of {KINDS})")
+        mix[kind] = float(weight)
+    total = sum(mix.values())
+    if total <= 0:
+        raise ValueError("Request mix weights must add up to more than zero")
+    return {kind: weight / total for kind, weight in mix.items()}
+
+
+def parse_gauges(text):
+    values = {}
+    for line in text.splitlines():
+        name, _, value = line.partition(" ")
+        if name in SAMPLED_GAUGES:
+            values[name] = float(value)
+    return values
+
+
+def start_api(port):
+    """Serve main.app with uvicorn on a background thread; returns the server once it accepts requests."""
+    import uvicorn
+    from main import app
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", lifespan="on"))
+    threading.Thread(target=server.run, name="loadtest-api", daemon=True).start()
+    deadline = time.time() + 120
+    while not server.started:
+        if time.time() > deadline:
+            raise RuntimeError("API did not start within 120s")
+        time.sleep(0.1)
+    return server
+
+
+def free_port():
+    import socket
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class Recorder:
+    def __init__(self):
+        self.results = []  # (kind, outcome, latency_ms, ttft_ms)
+        self.inflight = 0
+        self.peak_inflight = 0
+        self.job_ids = []
+
+    def started(self):
+        self.inflight += 1
+        self.peak_inflight = max(self.peak_inflight, self.inflight)
+
+    def finished(self, kind, outcome, latency_ms, ttft_ms=None):
+        self.inflight -= 1
+        self.results.append((kind, outcome, latency_ms, ttft_ms))
+
+
+async def send_query(client, n, recorder):
+    question = QUESTIONS[n % len(QUESTIONS)].format(n=n)
+    start = time.perf_counter()
+    try:
+        response = await client.post("/query/", json={"question": question, "folder": FOLDER})
+        outcome = str(response.status_code)
+    except httpx.TimeoutException:
+        outcome = "timeout"
+    except httpx.HTTPError as e:
+        outcome = type(e).__name__
+    recorder.finished("query", outcome, (time.perf_counter() - start) * 1000)
+
+
+async def send_stream(client, n, recorder):
+    question = QUESTIONS[n % len(QUESTIONS)].format(n=n)
+    start = time.perf_counter()
+    ttft = None
+    try:
+        async with client.stream("POST", "/query/stream", json={"question": question, "folder": FOLDER}) as response:
+            outcome = str(response.status_code)
+            async for line in response.aiter_lines():
+                if ttft is None and line.startswith("event: token"):
+                    ttft = (time.perf_counter() - start) * 1000
+                elif line.startswith("event: error"):
+                    outcome = "stream_error"
+    except httpx.TimeoutException:
+        outcome = "timeout"
+    except httpx.HTTPError as e:
+        outcome = type(e).__name__
+    recorder.finished("stream", outcome, (time.perf_counter() - start) * 1000, ttft)
+
+
+async def send_upload(client, n, recorder, upload_file=None):
+    if upload_file:
+        with open(upload_file, "rb") as f:
+            content = f.read()
+        # A new name per request so the manifest does not short-circuit it as unchanged
+        name = f"load_{n}_{os.path.basename(upload_file)}"
+    else:
+        rng = random.Random(n)
+        content = "\n".join(
+            UPLOAD_TEMPLATE.format(n=n * 100 + i, amount=rng.uniform(10, 5000), month=rng.randint(1, 12))
+            for i in range(20)
+        ).encode("utf-8")
+        name = f"load_{n}.txt"
+    start = time.perf_counter()
+    try:
+        response = await client.post("/upload/", data={"folder": FOLDER}, files={"files": (name, content)})
+        outcome = str(response.status_code)
+        if response.status_code == 202:
+            recorder.job_ids.append(response.json().get("job_id"))
+    except httpx.TimeoutException:
+        outcome = "timeout"
+    except httpx.HTTPError as e:
+        outcome = type(e).__name__
+    recorder.finished("upload", outcome, (time.perf_counter() - start) * 1000)
+
+
+async def sample_gauges(client, stop, samples):
+    while not stop.is_set():
+        try:
+            response = await client.get("/metrics")
+            samples.append(parse_gauges(response.text))
+        except httpx.HTTPError:
+            pass
+        try:
+            await asyncio.wait_for(stop.wait(), SAMPLE_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def run_step(client, offered_rate, duration, mix, seed, upload_file):
+    """Open-loop arrivals at offered_rate req/s for duration seconds, then wait for stragglers."""
+    rng = random.Random(seed)
+    kinds, weights = zip(*mix.items())
+    recorder = Recorder()
+    samples = []
+    stop = asyncio.Event()
+    sampler = asyncio.create_task(sample_gauges(client, stop, samples))
+
+    tasks = []
+    start = time.perf_counter()
+    next_at = start
+    n = seed * 1_000_000
+    while True:
+        next_at += rng.expovariate(offered_rate)
+        if next_at - start >= duration:
+            break
+        await asyncio.sleep(max(0.0, next_at - time.perf_counter()))
+        kind = rng.choices(kinds, weights)[0]
+        n += 1
+        recorder.started()
+        if kind == "query":
+            tasks.append(asyncio.create_task(send_query(client, n, recorder)))
+        elif kind == "stream":
+            tasks.append(asyncio.create_task(send_stream(client, n, recorder)))
+        else:
+            tasks.append(asyncio.create_task(send_upload(client, n, recorder, upload_file)))
+    backlog = recorder.inflight
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await sampler
+
+    return summarize_step(offered_rate, duration, elapsed, recorder, backlog, samples), recorder.job_ids
+
+
+def summarize_step(offered_rate, duration, elapsed, recorder, backlog, samples):
+    ok = [r for r in recorder.results if r[1] in ("200", "202")]
+    by_kind = {}
+    for kind in KINDS:
+        rows = [r for r in recorder.results if r[0] == kind]
+        if not rows:
+            continue
+        latencies = [r[2] for r in rows if r[1] in ("200", "202")]
+        errors = {}
+        for r in rows:
+            if r[1] not in ("200", "202"):
+                errors[r[1]] = errors.get(r[1], 0) + 1
+        entry = {"requests": len(rows), "ok": len(latencies), "errors": errors}
+        if latencies:
+            entry.update(
+                p50_ms=round(percentile(latencies, 0.50), 1),
+                p95_ms=round(percentile(latencies, 0.95), 1),
+                p99_ms=round(percentile(latencies, 0.99), 1),
+            )
+        ttfts = [r[3] for r in rows if r[3] is not None]
+        if ttfts:
+            entry.update(ttft_p50_ms=round(percentile(ttfts, 0.50), 1), ttft_p99_ms=round(percentile(ttfts, 0.99), 1))
+        by_kind[kind] = entry
+
+    gauges = {}
+    for name in SAMPLED_GAUGES:
+        values = [s[name] for s in samples if name in s]
+        if values:
+            gauges[name] = {"max": max(values), "mean": round(sum(values) / len(values), 2)}
+
+    total = len(recorder.results)
+    all_latencies = [r[2] for r in ok]
+    return {
+        "offered_rps": offered_rate,
+        "sent": total,
+        "sent_rps": rate(total, duration),
+        # Completions over the whole step including the drain: falls behind the offered rate once queues build
+        "achieved_rps": rate(len(ok), elapsed),
+        "drain_seconds": round(max(0.0, elapsed - duration), 2),
+        "error_rate": round((total - len(ok)) / total, 4) if total else 0.0,
+        "p99_ms": round(percentile(all_latencies, 0.99), 1) if all_latencies else None,
+        "backlog_at_end": backlog,
+        "peak_client_inflight": recorder.peak_inflight,
+        "server_gauges": gauges,
+        "kinds": by_kind,
+        "upload_jobs": len(recorder.job_ids),
+    }
+
+
+def saturated(step, slo_ms, max_error_rate):
+    reasons = []
+    if step["sent"] and (step["achieved_rps"] or 0) < 0.9 * step["sent_rps"]:
+        reasons.append(f"{step['achieved_rps']} ok/s for {step['sent_rps']} req/s sent")
+    if step["error_rate"] > max_error_rate:
+        reasons.append(f"error rate {step['error_rate']:.1%}")
+    if step["p99_ms"] is not None and step["p99_ms"] > slo_ms:
+        reasons.append(f"p99 {step['p99_ms']:.0f} ms > SLO {slo_ms:.0f} ms")
+    return reasons
+
+
+async def wait_for_jobs(client, job_ids, timeout):
+    """Poll upload jobs until they settle; returns {status: count}."""
+    deadline = time.time() + timeout
+    statuses = {}
+    pending = list(job_ids)
+    while pending and time.time() < deadline:
+        still = []
+        for job_id in pending:
+            status = (await client.get(f"/upload-status/{job_id}")).json().get("status")
+            if status in ("queued", "processing"):
+                still.append(job_id)
+            else:
+                statuses[status] = statuses.get(status, 0) + 1
+        pending = still
+        if pending:
+            await asyncio.sleep(1)
+    if pending:
+        statuses["unfinished"] = len(pending)
+    return statuses
+
+
+async def seed(client, pdfs, timeout):
+    files = []
+    for path in pdfs:
+        with open(path, "rb") as f:
+            files.append(("files", (os.path.basename(path), f.read())))
+    start = time.perf_counter()
+    response = await client.post("/upload/", data={"folder": FOLDER}, files=files)
+    response.raise_for_status()
+    statuses = await wait_for_jobs(client, [response.json()["job_id"]], timeout)
+    print(f"--- [LOAD] Seeded {len(pdfs)} file(s) in {time.perf_counter() - start:.1f}s: {statuses} ---")
+
+
+def print_step(step, reasons):
+    kinds = " | ".join(
+        f"{kind} p50 {entry.get('p50_ms', '-')} p99 {entry.get('p99_ms', '-')} ms" for kind, entry in step["kinds"].items()
+    )
+    gauges = ", ".join(f"{name} max {g['max']:.0f}" for name, g in step["server_gauges"].items())
+    print(
+        f"--- [LOAD] {step['offered_rps']:>6.2f} rps offered -> {step['achieved_rps']} ok/s, "
+        f"errors {step['error_rate']:.1%}, backlog {step['backlog_at_end']}, drain {step['drain_seconds']}s ---"
+    )
+    print(f"           {kinds}")
+    if gauges:
+        print(f"           {gauges}")
+    if reasons:
+        print(f"           SATURATED: {'; '.join(reasons)}")
+
+
+async def run(args, base_url):
+    mix = parse_mix(args.mix)
+    rates = [float(r) for r in args.rates.split(",")]
+    timeout = httpx.Timeout(args.timeout, connect=10)
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=100)
+    report = {"config": vars(args), "mix": mix, "steps": [], "saturation_rps": None}
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        if args.seed:
+            await seed(client, args.seed, args.seed_timeout)
+        for i, offered in enumerate(rates, start=1):
+            step, job_ids = await run_step(client, offered, args.duration, mix, i, args.upload_file)
+            if job_ids:
+                # Let ingestion settle so the next step starts from an idle queue
+                step["upload_results"] = await wait_for_jobs(client, job_ids, args.timeout)
+            reasons = saturated(step, args.slo_ms, args.max_error_rate)
+            step["saturated"] = reasons
+            report["steps"].append(step)
+            print_step(step, reasons)
+            if reasons and report["saturation_rps"] is None:
+                report["saturation_rps"] = offered
+                if not args.keep_going:
+                    break
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the API with a fake Ollama")
+    parser.add_argument("--url", help="API base URL; by default main.app is started in-process")
+    parser.add_argument("--rates", default="1,2,4,8,16", help="comma-separated request rates (req/s), one step each")
+    parser.add_argument("--duration", type=float, default=30, help="seconds of arrivals per step")
+    parser.add_argument("--mix", default="query=0.7,stream=0.2,upload=0.1", help="request kind weights")
+    parser.add_argument("--upload-file", help="file sent by upload requests (default: a small generated .txt)")
+    parser.add_argument("--seed", nargs="*", default=SEED_PDFS, help="files ingested before the first step (pass --seed alone to skip)")
+    parser.add_argument("--seed-timeout", type=float, default=1800)
+    parser.add_argument("--timeout", type=float, default=120, help="per-request timeout in seconds")
+    parser.add_argument("--slo-ms", type=float, default=10000, help="p99 latency above this counts as saturated")
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--keep-going", action="store_true", help="run every rate step even after saturation")
+    parser.add_argument("--llm-ttft-ms", type=float, default=300)
+    parser.add_argument("--llm-token-ms", type=float, default=25)
+    parser.add_argument("--llm-tokens", type=int, default=40)
+    parser.add_argument("--llm-parallel", type=int, default=2, help="concurrent generations the fake model serves")
+    parser.add_argument("--output", default="loadtest_results.json")
+    parser.add_argument("--keep", action="store_true", help="keep the scratch directory")
+    args = parser.parse_args()
+
+    fake, config = serve_fake_ollama(
+        0, ttft_ms=args.llm_ttft_ms, token_ms=args.llm_token_ms, tokens=args.llm_tokens, parallel=args.llm_parallel
+    )
+    ollama_url = f"http://127.0.0.1:{fake.server_address[1]}"
+    # Resolve every path before the in-process mode changes the working directory
+    args.output = os.path.abspath(args.output)
+    args.seed = [os.path.abspath(p) for p in args.seed]
+    if args.upload_file:
+        args.upload_file = os.path.abspath(args.upload_file)
+
+    workdir = None
+    api = None
+    original_cwd = os.getcwd()
+    if args.url:
+        base_url = args.url
+        print(f"--- [LOAD] Targeting {base_url}; start it with OLLAMA_BASE_URL={ollama_url} ---")
+    else:
+        workdir = tempfile.mkdtemp(prefix="ocr_load_")
+        isolate(workdir, ollama_url)
+        os.environ["JOB_STORE_PATH"] = os.path.join(workdir, "jobs.db")
+        # main.py keeps uploads/ and folders.json relative to the working directory
+        os.chdir(workdir)
+        port = free_port()
+        api = start_api(port)
+        base_url = f"http://127.0.0.1:{port}"
+        print(f"--- [LOAD] API on {base_url}, fake Ollama on {ollama_url}, scratch {workdir} ---")
+
+    try:
+        report = asyncio.run(run(args, base_url))
+        report["fake_ollama"] = {
+            "requests": config.requests,
+            "peak_active": config.peak_active,
+            "cancelled": config.cancelled,
+        }
+        if report["saturation_rps"] is None:
+            print(f"--- [LOAD] Not saturated up to {report['steps'][-1]['offered_rps'] if report['steps'] else 0} rps ---")
+        else:
+            print(f"--- [LOAD] Saturated at {report['saturation_rps']} rps ---")
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, default=str)
+        print(f"--- [LOAD] Report written to {args.output} ---")
+    finally:
+        if api is not None:
+            api.should_exit = True
+        fake.shutdown()
+        os.chdir(original_cwd)
+        if workdir and not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
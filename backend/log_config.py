@@ -0,0 +1,104 @@
+import os
+import sys
+import json
+import queue
+import atexit
+import logging
+import threading
+import logging.handlers
+
+# Configuration
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+# "text" for humans, "json" for log shippers
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "text").lower()
+# Opt-in key/value dump of every retrieved chunk (needs LOG_LEVEL=DEBUG as well)
+LOG_CHUNKS = os.environ.get("LOG_CHUNKS", "0") == "1"
+
+ROOT_LOGGER = "app"
+_RESERVED = set(logging.LogRecord("", 0, "", 0, "", (), None).__dict__) | {"message", "asctime"}
+
+_listener = None
+_setup_lock = threading.Lock()
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that hands the record over untouched. The stock handler formats the
+    message on the calling thread; here %-args are only rendered by the listener thread,
+    so a request thread pays for little more than a queue put.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+class StructuredFormatter(logging.Formatter):
+    """`time level [logger] message key=value ...`, or one JSON object per line."""
+
+    def __init__(self, fmt=LOG_FORMAT):
+        super().__init__("%(asctime)s %(levelname)s [%(name)s] %(message)s")
+        self.json = fmt == "json"
+
+    def _fields(self, record):
+        return {k: v for k, v in record.__dict__.items() if k not in _RESERVED and not k.startswith("_")}
+
+    def format(self, record):
+        fields = self._fields(record)
+        if self.json:
+            body = {
+                "ts": self.formatTime(record),
+                "level": record.levelname,
+                "logger": record.name,
+                "message": record.getMessage(),
+                **fields,
+            }
+            if record.exc_info:
+                body["exc_info"] = self.formatException(record.exc_info)
+            return json.dumps(body, default=str)
+        line = super().format(record)
+        if fields:
+            line += " " + " ".join(f"{k}={v}" for k, v in fields.items())
+        return line
+
+
+def setup_logging():
+    """Route every `app.*` logger through one queue drained by a background listener thread."""
+    global _listener
+    if _listener is not None:
+        return
+    with _setup_lock:
+        if _listener is not None:
+            return
+        log_queue = queue.SimpleQueue()
+        stream = logging.StreamHandler(sys.stdout)
+        stream.setFormatter(StructuredFormatter())
+        _listener = logging.handlers.QueueListener(log_queue, stream, respect_handler_level=False)
+        _listener.start()
+        atexit.register(_listener.stop)
+
+        root = logging.getLogger(ROOT_LOGGER)
+        root.setLevel(LOG_LEVEL)
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(_DeferredQueueHandler(log_queue))
+        root.propagate = False
+
+
+def _reset_after_fork():
+    """A forked child (OCR pool worker) inherits the queue but not the listener thread draining it."""
+    global _listener, _setup_lock
+    if _listener is None:
+        return
+    _listener = None
+    _setup_lock = threading.Lock()
+    setup_logging()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_logger(name):
+    """Leveled logger for a module, e.g. get_logger("rag") -> app.rag."""
+    setup_logging()
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
@@ -5,57 +5,106 @@ warnings.filterwarnings("ignore", category=UserWarning, module="langchain")
 
 from fastapi import FastAPI, UploadFile, File, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import StreamingResponse, PlainTextResponse
+from pydantic import BaseModel, Field
 from typing import List
 import os
-import shutil
+import re
 import time
+import shutil
+import uuid
+import threading
 
 import json
 from fastapi import Form
-from ingestion import ingest_file
-from rag import query_rag
+from rag import aquery_rag, astream_rag, invalidate_rag_chain, get_rag_chain, get_query_batcher, get_generation_scheduler
+from ingest_queue import ingestion_queue, QueueFull, JobTooLarge, MAX_JOB_BYTES, job_upload_dir
 
-from database import get_qdrant_client
+from database import get_qdrant_client, vector_store_health, collection_config
+from embedding_registry import get_embedding_stats
+from manifest import get_manifest
+from ocr_cache import get_ocr_cache
+from query_cache import invalidate_folder, get_cache_stats, embedding_cache, answer_cache
+from keyword_index import get_keyword_index, rebuild_from_qdrant
+from reranker import get_reranker, preload_reranker
+from generation_scheduler import DEFAULT_PRIORITY, LOWEST_PRIORITY
+from context import prompt_stats
+from log_config import get_logger
+from metrics import HTTP_REQUEST_SECONDS, register_collector, render as render_metrics
 from qdrant_client.http import models
 
 app = FastAPI(title="Local RAG API")
-
-# Global state for tracking upload progress
-upload_stats = {}
+logger = get_logger("api")
 
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
     start_time = time.time()
-    print(f"--- [DEBUG] INCOMING REQUEST: {request.method} {request.url.path} ---")
+    logger.debug("Incoming request %s %s", request.method, request.url.path)
     response = await call_next(request)
     process_time = time.time() - start_time
-    print(f"--- [DEBUG] COMPLETED REQUEST: {request.method} {request.url.path} | STATUS: {response.status_code} | TIME: {process_time:.4f}s ---")
+    # Label by route template, not raw path, so job IDs don't explode the series count
+    route = getattr(request.scope.get("route"), "path", "unmatched")
+    HTTP_REQUEST_SECONDS.observe(process_time, method=request.method, route=route, status=response.status_code)
+    logger.info(
+        "%s %s -> %d in %.4fs", request.method, request.url.path, response.status_code, process_time
+    )
     return response
 
 # Configuration matching other files
 COLLECTION_NAME = "local_documents"
 VECTOR_SIZE = 384 # all-MiniLM-L6-v2
+PAYLOAD_INDEX_FIELDS = ["metadata.folder", "metadata.source"]
 
 @app.on_event("startup")
 def startup_event():
-    print("--- [STARTUP] Checking Qdrant Collection ---")
+    logger.info("Checking Qdrant collection")
     try:
         client = get_qdrant_client()
         collections = client.get_collections()
         exists = any(c.name == COLLECTION_NAME for c in collections.collections)
         
         if not exists:
-            print(f"--- [STARTUP] Collection '{COLLECTION_NAME}' not found. Creating... ---")
+            logger.info("Collection '%s' not found; creating", COLLECTION_NAME)
             client.create_collection(
                 collection_name=COLLECTION_NAME,
-                vectors_config=models.VectorParams(size=VECTOR_SIZE, distance=models.Distance.COSINE),
+                **collection_config(VECTOR_SIZE),
             )
-            print(f"--- [STARTUP] Collection '{COLLECTION_NAME}' created successfully. ---")
+            logger.info("Collection '%s' created", COLLECTION_NAME)
         else:
-            print(f"--- [STARTUP] Collection '{COLLECTION_NAME}' already exists. ---")
+            logger.info("Collection '%s' already exists", COLLECTION_NAME)
+
+        # Keyword indexes so folder/source filters (retrieval, listing, deletes, dedup) avoid full scans
+        for field in PAYLOAD_INDEX_FIELDS:
+            client.create_payload_index(
+                collection_name=COLLECTION_NAME,
+                field_name=field,
+                field_schema=models.PayloadSchemaType.KEYWORD,
+            )
+        logger.info("Payload indexes ensured on %s", PAYLOAD_INDEX_FIELDS)
+
+        # One-off: build the keyword index for chunks ingested before it existed
+        keyword_index = get_keyword_index()
+        if keyword_index is not None and keyword_index.is_empty() and client.count(collection_name=COLLECTION_NAME).count:
+            logger.info("Keyword index empty; rebuilding from Qdrant in the background")
+            threading.Thread(
+                target=rebuild_from_qdrant, args=(client, COLLECTION_NAME), name="keyword-rebuild", daemon=True
+            ).start()
     except Exception as e:
-        print(f"--- [STARTUP] Error checking/creating collection: {e} ---")
+        logger.error("Error checking/creating collection: %s", e, exc_info=True)
+
+    # Load the embedding model and build the shared vector store/chain now rather than on
+    # the first query; per-folder retrievers are then cheap to add from a worker thread
+    try:
+        get_rag_chain("All")
+    except Exception as e:
+        logger.error("Could not prepare the RAG chain: %s", e, exc_info=True)
+    preload_reranker()
+
+    ingestion_queue.start()
+
+@app.on_event("shutdown")
+def shutdown_event():
+    ingestion_queue.stop()
 
 
 
@@ -106,64 +155,82 @@ def list_folders():
 @app.post("/folders")
 def create_folder(request: CreateFolderRequest):
     save_folder(request.folder_name)
+    invalidate_rag_chain(request.folder_name)
     return {"status": "created", "folder": request.folder_name}
 
-@app.get("/folders/{folder_name}/files")
-def list_folder_files(folder_name: str):
-    print(f"--- [API] Listing files for folder: {folder_name} ---")
-    try:
-        client = get_qdrant_client()
-        # Scroll through points with a filter to find unique filenames
-        # Note: metadata schema matches rag.py (metadata.folder)
-        limit = 100
-        offset = None
-        unique_files = set()
-        
-        # Simple implementation: scroll a reasonable number of points
-        scroll_filter = models.Filter(
-            must=[
-                models.FieldCondition(
-                    key="metadata.folder",
-                    match={"value": folder_name}
-                )
-            ]
-        )
-        
-        points, next_page_offset = client.scroll(
+def folder_filter(folder_name):
+    # Note: metadata schema matches rag.py (metadata.folder)
+    return models.Filter(
+        must=[
+            models.FieldCondition(
+                key="metadata.folder",
+                match=models.MatchValue(value=folder_name)
+            )
+        ]
+    )
+
+def backfill_manifest(client, folder_name):
+    """
+    One-off full scan for folders ingested before the manifest existed.
+    Pages through every chunk (payload limited to the source) and records each file
+    the manifest does not know yet, then marks the folder as done.
+    """
+    manifest = get_manifest()
+    counts = {}
+    offset = None
+    while True:
+        points, offset = client.scroll(
             collection_name=COLLECTION_NAME,
-            scroll_filter=scroll_filter,
-            limit=limit,
-            with_payload=True,
+            scroll_filter=folder_filter(folder_name),
+            limit=1000,
+            offset=offset,
+            with_payload=models.PayloadSelectorInclude(include=["metadata.source"]),
             with_vectors=False
         )
-        
         for p in points:
-            if p.payload and "source" in p.payload:
-                unique_files.add(os.path.basename(p.payload["source"]))
-                
-        return {"files": list(unique_files)}
+            source = (p.payload or {}).get("metadata", {}).get("source")
+            if source:
+                counts[source] = counts.get(source, 0) + 1
+        if offset is None:
+            break
+    missing = {source: n for source, n in counts.items() if manifest.get(folder_name, source) is None}
+    for source, num_chunks in missing.items():
+        manifest.upsert(folder_name, source, None, num_chunks)
+    manifest.mark_backfilled(folder_name)
+    logger.info("Backfilled manifest for folder %s: %d files", folder_name, len(missing))
+
+@app.get("/folders/{folder_name}/files")
+def list_folder_files(folder_name: str):
+    logger.debug("Listing files for folder %s", folder_name)
+    try:
+        manifest = get_manifest()
+        # Not has_folder(): one new upload into a pre-manifest folder would hide its older files
+        if not manifest.is_backfilled(folder_name):
+            backfill_manifest(get_qdrant_client(), folder_name)
+        files = manifest.list_files(folder_name)
+        return {"files": sorted({f["filename"] for f in files})}
     except Exception as e:
-        print(f"--- [API] Error listing files: {e} ---")
+        logger.error("Error listing files: %s", e, exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.delete("/folders/{folder_name}")
 def delete_folder(folder_name: str):
-    print(f"--- [API] Deleting folder: {folder_name} ---")
+    logger.info("Deleting folder %s", folder_name)
     try:
         client = get_qdrant_client()
         # 1. Delete vectors from Qdrant
         client.delete(
             collection_name=COLLECTION_NAME,
-            points_selector=models.Filter(
-                must=[
-                    models.FieldCondition(
-                        key="metadata.folder",
-                        match={"value": folder_name}
-                    )
-                ]
-            )
+            points_selector=folder_filter(folder_name)
         )
         
+        get_manifest().delete_folder(folder_name)
+        keyword_index = get_keyword_index()
+        if keyword_index is not None:
+            keyword_index.remove_folder(folder_name)
+        invalidate_folder(folder_name)
+        invalidate_rag_chain(folder_name)
+
         # 2. Remove from folders.json
         folders = get_folders()
         if folder_name in folders:
@@ -173,108 +240,161 @@ def delete_folder(folder_name: str):
         
         return {"status": "deleted", "folder": folder_name}
     except Exception as e:
-        print(f"--- [API] Error deleting folder: {e} ---")
+        logger.error("Error deleting folder: %s", e, exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
+JOB_ID_RE = re.compile(r"[A-Za-z0-9_-]{1,128}")
+
 class QueryRequest(BaseModel):
     question: str
     folder: str = "All"
+    # Lower is served first by the generation scheduler; clients can only deprioritise themselves
+    priority: int = Field(DEFAULT_PRIORITY, ge=DEFAULT_PRIORITY, le=LOWEST_PRIORITY)
 
-@app.post("/upload/")
+@app.post("/upload/", status_code=202)
 def upload_file(
     files: List[UploadFile] = File(...),
     folder: str = Form("default"),
     job_id: str = Form(None)
 ):
-    print(f"--- [API] Received Upload Request for {len(files)} files in folder: {folder} (Job: {job_id}) ---")
-    
-    if job_id:
-        upload_stats[job_id] = {"status": "processing", "progress": 0, "total_pages": 0, "current_page": 0}
+    job_id = job_id or f"job_{uuid.uuid4().hex}"
+    # job_id names the upload directory: no path tricks, and no reuse of a live job's files
+    if not JOB_ID_RE.fullmatch(job_id):
+        raise HTTPException(status_code=400, detail="job_id may only contain letters, digits, '-' and '_'")
+    if ingestion_queue.get_status(job_id) is not None:
+        raise HTTPException(status_code=409, detail=f"Job {job_id} already exists")
+    logger.info("Upload request: %d files", len(files), extra={"folder": folder, "job_id": job_id})
+
+    # Backpressure: refuse before spending time and disk on the upload
+    if ingestion_queue.is_full():
+        raise HTTPException(status_code=503, detail="Ingestion queue is full. Retry later.", headers={"Retry-After": "5"})
     
-    upload_dir = "uploads"
+    # Per-job directory: another upload with the same file name cannot overwrite these files
+    upload_dir = job_upload_dir(job_id)
     os.makedirs(upload_dir, exist_ok=True)
     
     # Ensure folder exists
     save_folder(folder)
     
-    results = []
-    
-    for file in files:
-        try:
-            file_path = os.path.join(upload_dir, file.filename)
+    saved = []
+    job_bytes = 0
+    try:
+        for file in files:
+            filename = os.path.basename(file.filename)
+            file_path = os.path.join(upload_dir, filename)
             with open(file_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
-            
-            print(f"--- [API] Processing {file.filename} ---")
-            
-            # Progress callback for ingestion
-            def progress_callback(current, total):
-                if job_id:
-                    upload_stats[job_id]["current_page"] = current
-                    upload_stats[job_id]["total_pages"] = total
-                    upload_stats[job_id]["progress"] = int((current / total) * 100)
-                    print(f"--- [API] Job {job_id} Progress: {current}/{total} ---")
-
-            # Trigger ingestion
-            ingest_result = ingest_file(file_path, folder_name=folder, progress_callback=progress_callback)
-            
-            status = "success"
-            error = None
-            if "error" in ingest_result:
-                status = "failed"
-                error = ingest_result["error"]
-                print(f"--- [API] Error ingesting {file.filename}: {error} ---")
-            else:
-                print(f"--- [API] Successfully ingested {file.filename} ---")
-                
-            results.append({
-                "filename": file.filename,
-                "status": status,
-                "details": ingest_result,
-                "error": error
-            })
-            
-        except Exception as e:
-            print(f"--- [API] Exception processing {file.filename}: {e} ---")
-            results.append({
-                "filename": file.filename,
-                "status": "error",
-                "error": str(e)
-            })
-
-    # Return 200 OK with detailed results for client to parse
-    print(f"--- [API] Upload Process Completed. Results: {len(results)} files processed ---")
-    for r in results:
-        print(f"  - {r['filename']}: {r['status']} {'(' + r['error'] + ')' if r['error'] else ''}")
-    
-    if job_id:
-        upload_stats[job_id]["status"] = "completed"
-    
-    return {"status": "completed", "results": results}
+                saved.append({"filename": filename, "path": file_path})
+                while True:
+                    block = file.file.read(1024 * 1024)
+                    if not block:
+                        break
+                    job_bytes += len(block)
+                    if job_bytes > MAX_JOB_BYTES:
+                        raise JobTooLarge(f"Upload exceeds the per-job limit of {MAX_JOB_BYTES // (1024 * 1024)} MB")
+                    buffer.write(block)
+        status = ingestion_queue.submit(job_id, folder, saved)
+    except (JobTooLarge, QueueFull) as e:
+        shutil.rmtree(upload_dir, ignore_errors=True)
+        logger.warning("Rejected job %s: %s", job_id, e)
+        if isinstance(e, JobTooLarge):
+            raise HTTPException(status_code=413, detail=str(e))
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+
+    return status
 
 @app.get("/upload-status/{job_id}")
 def get_upload_status(job_id: str):
-    if job_id not in upload_stats:
+    status = ingestion_queue.get_status(job_id)
+    if status is None:
         return {"error": "Job ID not found"}
-    return upload_stats[job_id]
+    return status
+
+@app.post("/upload/{job_id}/cancel")
+def cancel_upload(job_id: str):
+    if not ingestion_queue.cancel(job_id):
+        raise HTTPException(status_code=404, detail="Job not found or already finished")
+    return {"status": "cancelling", "job_id": job_id}
 
 @app.post("/query/")
-def query_index(request: QueryRequest):
-    print(f"--- [API] Received Query Request: {request.question} (Folder: {request.folder}) ---")
+async def query_index(request: QueryRequest):
+    logger.debug("Query request: %s", request.question, extra={"folder": request.folder})
     try:
         # Trigger RAG
-        answer = query_rag(request.question, folder_name=request.folder)
-        print(f"--- [API] Query Success ---")
+        answer = await aquery_rag(request.question, folder_name=request.folder, priority=request.priority)
         return {"answer": answer}
     except Exception as e:
-        print(f"--- [API] Query Error: {e} ---")
-        import traceback
-        traceback.print_exc()
+        logger.error("Query error: %s", e, exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/query/stream")
+async def query_stream(request: QueryRequest, http_request: Request):
+    """
+    Server-Sent Events: a "retrieval" event with chunk metadata, "token" events as the
+    model generates, then "done" with TTFT and total latency.
+    """
+    logger.debug("Streaming query request: %s", request.question, extra={"folder": request.folder})
+
+    async def event_stream():
+        events = astream_rag(request.question, folder_name=request.folder, priority=request.priority)
+        try:
+            async for event, data in events:
+                if await http_request.is_disconnected():
+                    logger.info("Client disconnected, cancelling generation")
+                    break
+                yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+        finally:
+            # Closing the generator aborts the in-flight Ollama request
+            await events.aclose()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/health")
+def health():
+    db = vector_store_health()
+    if not db["ok"]:
+        raise HTTPException(status_code=503, detail=db)
+    return {"status": "ok", "vector_store": db}
+
+def collect_service_metrics():
+    """Scrape-time values for /metrics that other components already track."""
+    caches = {"embedding": embedding_cache.stats(), "answer": answer_cache.stats()}
+    ocr_cache = get_ocr_cache()
+    if ocr_cache is not None:
+        caches["ocr"] = ocr_cache.stats()
+    scheduler = get_generation_scheduler().stats()
+    batcher = get_query_batcher().stats()
+    return [
+        ("cache_hits_total", "counter", "Cache hits by cache.",
+         [({"cache": name}, st["hits"]) for name, st in caches.items()]),
+        ("cache_misses_total", "counter", "Cache misses by cache.",
+         [({"cache": name}, st["misses"]) for name, st in caches.items()]),
+        ("ingest_queue_depth", "gauge", "Ingestion jobs waiting for a worker.",
+         [({}, ingestion_queue.depth())]),
+        ("llm_queue_depth", "gauge", "Generations waiting for an LLM slot.",
+         [({}, scheduler["queued"])]),
+        ("llm_inflight", "gauge", "Generations currently running.",
+         [({}, scheduler["inflight"])]),
+        ("llm_generations_total", "counter", "Generations by result.",
+         [({"result": r}, scheduler[r]) for r in ("completed", "failed", "cancelled", "deduplicated")]),
+        ("query_embedding_batches_total", "counter", "Micro-batched query embedding passes.",
+         [({}, batcher["batches"])]),
+        ("query_embedding_items_total", "counter", "Questions embedded through the micro-batcher.",
+         [({}, batcher["items"])]),
+    ]
+
+register_collector(collect_service_metrics)
+
+@app.get("/metrics")
+def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 @app.get("/debug/collection/")
 def debug_collection():
-    print("--- [DEBUG] Inspecting Collection ---")
+    logger.debug("Inspecting collection")
     try:
         client = get_qdrant_client()
         count = client.count(collection_name=COLLECTION_NAME).count
@@ -294,6 +414,41 @@ def debug_collection():
     except Exception as e:
         return {"error": str(e)}
 
+@app.get("/debug/embeddings/")
+def debug_embeddings():
+    return {"models": get_embedding_stats()}
+
+@app.get("/debug/ocr-cache/")
+def debug_ocr_cache():
+    cache = get_ocr_cache()
+    if cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **cache.stats()}
+
+@app.get("/debug/query-cache/")
+def debug_query_cache():
+    return {**get_cache_stats(), "embedding_batcher": get_query_batcher().stats()}
+
+@app.get("/debug/keyword-index/")
+def debug_keyword_index():
+    keyword_index = get_keyword_index()
+    if keyword_index is None:
+        return {"enabled": False}
+    return {"enabled": True, **keyword_index.stats()}
+
+@app.get("/debug/reranker/")
+def debug_reranker():
+    reranker = get_reranker()
+    return reranker.stats() if reranker is not None else {"enabled": False}
+
+@app.get("/debug/context/")
+def debug_context():
+    return prompt_stats.stats()
+
+@app.get("/debug/scheduler/")
+def debug_scheduler():
+    return get_generation_scheduler().stats()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
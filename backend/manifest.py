@@ -0,0 +1,98 @@
+import os
+import time
+import sqlite3
+import threading
+
+# Configuration
+MANIFEST_PATH = os.environ.get("MANIFEST_PATH", "manifest.db")
+
+
+class FileManifest:
+    """
+    Record of every file ingested into each folder: its content hash and how many
+    chunks it produced. Lets ingestion skip unchanged re-uploads without touching
+    the vector store. Backed by SQLite so every API worker sees the same state.
+    """
+
+    def __init__(self, path=MANIFEST_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._conn().executescript("""
+            CREATE TABLE IF NOT EXISTS files (
+                folder TEXT,
+                source TEXT,
+                filename TEXT,
+                file_hash TEXT,
+                num_chunks INTEGER,
+                ocr_used INTEGER,
+                ingested_at REAL,
+                PRIMARY KEY (folder, source)
+            );
+            -- Folders whose pre-manifest chunks have been scanned into `files`
+            CREATE TABLE IF NOT EXISTS backfilled_folders (
+                folder TEXT PRIMARY KEY,
+                backfilled_at REAL
+            );
+        """)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, folder, source):
+        row = self._conn().execute(
+            "SELECT * FROM files WHERE folder = ? AND source = ?", (folder, source)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def upsert(self, folder, source, file_hash, num_chunks, ocr_used=False):
+        self._conn().execute(
+            "INSERT OR REPLACE INTO files (folder, source, filename, file_hash, num_chunks, ocr_used, ingested_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (folder, source, os.path.basename(source), file_hash, num_chunks, int(ocr_used), time.time()),
+        )
+
+    def list_files(self, folder):
+        return [
+            dict(row)
+            for row in self._conn().execute(
+                "SELECT * FROM files WHERE folder = ? ORDER BY filename", (folder,)
+            )
+        ]
+
+    def has_folder(self, folder):
+        row = self._conn().execute("SELECT 1 FROM files WHERE folder = ? LIMIT 1", (folder,)).fetchone()
+        return row is not None
+
+    def is_backfilled(self, folder):
+        row = self._conn().execute("SELECT 1 FROM backfilled_folders WHERE folder = ?", (folder,)).fetchone()
+        return row is not None
+
+    def mark_backfilled(self, folder):
+        self._conn().execute(
+            "INSERT OR REPLACE INTO backfilled_folders (folder, backfilled_at) VALUES (?, ?)", (folder, time.time())
+        )
+
+    def delete(self, folder, source):
+        self._conn().execute("DELETE FROM files WHERE folder = ? AND source = ?", (folder, source))
+
+    def delete_folder(self, folder):
+        self._conn().execute("DELETE FROM files WHERE folder = ?", (folder,))
+
+
+_manifest = None
+_manifest_lock = threading.Lock()
+
+
+def get_manifest():
+    global _manifest
+    if _manifest is None:
+        with _manifest_lock:
+            if _manifest is None:
+                _manifest = FileManifest()
+    return _manifest
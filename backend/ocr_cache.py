@@ -0,0 +1,196 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+# Configuration
+OCR_CACHE_ENABLED = os.environ.get("OCR_CACHE_ENABLED", "1") == "1"
+OCR_CACHE_PATH = os.environ.get("OCR_CACHE_PATH", "ocr_cache.db")
+# Total size of cached OCR results before least-recently-used entries are evicted
+OCR_CACHE_MAX_BYTES = int(os.environ.get("OCR_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+# Eviction trims the cache down to this fraction of the limit so it does not run on every insert
+OCR_CACHE_EVICT_TO = 0.9
+# Hit/miss counters are flushed to the shared database every N lookups
+STATS_FLUSH_EVERY = 50
+
+
+def _engine_config_digest(package):
+    """Hash of the engine's bundled config.yaml (model choice, det/rec/cls params) and model files."""
+    package_dir = os.path.dirname(package.__file__)
+    digest = hashlib.sha256()
+    config_path = os.path.join(package_dir, "config.yaml")
+    if os.path.exists(config_path):
+        with open(config_path, "rb") as f:
+            digest.update(f.read())
+    models_dir = os.path.join(package_dir, "models")
+    if os.path.isdir(models_dir):
+        for name in sorted(os.listdir(models_dir)):
+            digest.update(f"{name}:{os.path.getsize(os.path.join(models_dir, name))}".encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def engine_fingerprint():
+    """
+    Identifies the OCR engine build and settings (version, bundled config/models, thread
+    count); results from a differently configured engine are never reused.
+    """
+    # Imported here: ocr_pool imports this module
+    from ocr_pool import OCR_THREADS_PER_WORKER
+
+    try:
+        import rapidocr_onnxruntime
+        version = getattr(rapidocr_onnxruntime, "__version__", "unknown")
+        config = _engine_config_digest(rapidocr_onnxruntime)
+    except ImportError:
+        version = config = "missing"
+    return f"rapidocr_onnxruntime={version};config={config};threads={OCR_THREADS_PER_WORKER}"
+
+
+def _to_json(value):
+    # RapidOCR boxes/scores can be numpy types
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    return float(value)
+
+
+class OCRCache:
+    """
+    Persistent cache of OCR results keyed by sha256(image bytes + engine fingerprint).
+    Values are the recognised lines as [box, text, score]. Shared by the parent and
+    every OCR worker process through one SQLite file.
+    """
+
+    def __init__(self, path=OCR_CACHE_PATH, max_bytes=OCR_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.fingerprint = engine_fingerprint().encode("utf-8")
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._conn().executescript("""
+            CREATE TABLE IF NOT EXISTS ocr_results (
+                key TEXT PRIMARY KEY,
+                lines TEXT,
+                size INTEGER,
+                last_access REAL
+            );
+            CREATE INDEX IF NOT EXISTS ocr_results_last_access ON ocr_results (last_access);
+            CREATE TABLE IF NOT EXISTS ocr_stats (
+                id INTEGER PRIMARY KEY CHECK (id = 0),
+                hits INTEGER,
+                misses INTEGER,
+                total_bytes INTEGER
+            );
+            INSERT OR IGNORE INTO ocr_stats (id, hits, misses, total_bytes) VALUES (0, 0, 0, 0);
+        """)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def key(self, image_bytes):
+        digest = hashlib.sha256(image_bytes)
+        digest.update(self.fingerprint)
+        return digest.hexdigest()
+
+    def get(self, key):
+        conn = self._conn()
+        row = conn.execute("SELECT lines FROM ocr_results WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self._count(hit=False)
+            return None
+        conn.execute("UPDATE ocr_results SET last_access = ? WHERE key = ?", (time.time(), key))
+        self._count(hit=True)
+        return json.loads(row[0])
+
+    def put(self, key, lines):
+        payload = json.dumps(lines or [], default=_to_json)
+        size = len(payload)
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            old = conn.execute("SELECT size FROM ocr_results WHERE key = ?", (key,)).fetchone()
+            conn.execute(
+                "INSERT OR REPLACE INTO ocr_results (key, lines, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, payload, size, time.time()),
+            )
+            conn.execute(
+                "UPDATE ocr_stats SET total_bytes = total_bytes + ? WHERE id = 0",
+                (size - (old[0] if old else 0),),
+            )
+            total = conn.execute("SELECT total_bytes FROM ocr_stats WHERE id = 0").fetchone()[0]
+            if total > self.max_bytes:
+                self._evict(conn, total)
+
+    def _evict(self, conn, total):
+        # Drop least-recently-used entries until we are comfortably under the limit
+        target = int(self.max_bytes * OCR_CACHE_EVICT_TO)
+        freed = 0
+        evicted = []
+        for key, size in conn.execute("SELECT key, size FROM ocr_results ORDER BY last_access"):
+            if total - freed <= target:
+                break
+            evicted.append((key,))
+            freed += size
+        conn.executemany("DELETE FROM ocr_results WHERE key = ?", evicted)
+        conn.execute("UPDATE ocr_stats SET total_bytes = total_bytes - ? WHERE id = 0", (freed,))
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self._hits += 1
+            else:
+                self._misses += 1
+            pending = self._hits + self._misses
+        if pending >= STATS_FLUSH_EVERY:
+            self.flush_stats()
+
+    def flush_stats(self):
+        with self._lock:
+            hits, misses = self._hits, self._misses
+            self._hits = self._misses = 0
+        if hits or misses:
+            self._conn().execute(
+                "UPDATE ocr_stats SET hits = hits + ?, misses = misses + ? WHERE id = 0", (hits, misses)
+            )
+
+    def stats(self):
+        self.flush_stats()
+        conn = self._conn()
+        hits, misses, total_bytes = conn.execute("SELECT hits, misses, total_bytes FROM ocr_stats WHERE id = 0").fetchone()
+        entries = conn.execute("SELECT COUNT(*) FROM ocr_results").fetchone()[0]
+        lookups = hits + misses
+        return {
+            "entries": entries,
+            "bytes": total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+_cache = None
+_cache_pid = None
+_cache_lock = threading.Lock()
+
+
+def get_ocr_cache():
+    """Per-process cache handle (SQLite connections must not cross a fork). None when disabled."""
+    global _cache, _cache_pid
+    if not OCR_CACHE_ENABLED:
+        return None
+    if _cache is None or _cache_pid != os.getpid():
+        with _cache_lock:
+            if _cache is None or _cache_pid != os.getpid():
+                _cache = OCRCache()
+                _cache_pid = os.getpid()
+    return _cache
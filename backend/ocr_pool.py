@@ -0,0 +1,206 @@
+import os
+import time
+import atexit
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from ocr_cache import get_ocr_cache
+from metrics import INGEST_STAGE_SECONDS
+from log_config import get_logger
+
+logger = get_logger("ocr")
+
+# Configuration
+# Number of OCR worker processes. Each worker holds its own RapidOCR instance.
+OCR_WORKERS = int(os.environ.get("OCR_WORKERS", os.cpu_count() or 1))
+# Pages handed to a worker per task. Small enough to balance load, large enough
+# to amortise the cost of shipping results back to the parent.
+OCR_CHUNK_SIZE = int(os.environ.get("OCR_CHUNK_SIZE", 4))
+# ONNX Runtime threads per worker. With one process per core, letting every
+# worker spin up a full intra-op thread pool oversubscribes the machine.
+OCR_THREADS_PER_WORKER = int(os.environ.get("OCR_THREADS_PER_WORKER", 1))
+
+# Per-process state (lives inside each worker, or in the parent for serial mode)
+_ocr = None
+_ocr_lock = threading.Lock()
+
+# Parent-side pool singleton
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def create_ocr_engine(threads=None):
+    from rapidocr_onnxruntime import RapidOCR
+
+    if threads and threads > 0:
+        try:
+            return RapidOCR(intra_op_num_threads=threads, inter_op_num_threads=1)
+        except TypeError:
+            # Older rapidocr releases do not accept thread overrides
+            pass
+    return RapidOCR()
+
+
+def _init_worker(threads):
+    global _ocr
+    # Keep native thread pools (OpenMP / BLAS) from fighting over cores
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    _ocr = create_ocr_engine(threads)
+
+
+def _open_reader(file_path):
+    """
+    A fresh reader per task. Uploads reuse file names, so a reader cached by path could
+    serve pages of a replaced file, and in the parent it would be shared between the
+    ingestion threads.
+    """
+    from pypdf import PdfReader
+    return PdfReader(file_path)
+
+
+def _get_engine(threads=None):
+    global _ocr
+    if _ocr is None:
+        with _ocr_lock:
+            if _ocr is None:
+                _ocr = create_ocr_engine(threads)
+    return _ocr
+
+
+def recognise_image(ocr, image_bytes, cache=None):
+    """OCR one image, serving repeated images (logos, stamps, re-uploads) from the cache."""
+    if cache is None:
+        result, _ = ocr(image_bytes)
+        return result
+    key = cache.key(image_bytes)
+    result = cache.get(key)
+    if result is None:
+        result, _ = ocr(image_bytes)
+        cache.put(key, result)
+    return result
+
+
+def ocr_page(ocr, page, page_index):
+    """Run OCR over every embedded image of a single pypdf page."""
+    page_text = ""
+    cache = get_ocr_cache()
+    try:
+        # Extract images from the page
+        images = page.images
+        if images:
+            logger.debug("Processing page %d (%d images)", page_index + 1, len(images))
+            for img in images:
+                try:
+                    result = recognise_image(ocr, img.data, cache)
+                    if result:
+                        for line in result:
+                            if line and len(line) >= 2:
+                                text_content = line[1]
+                                # Add a newline after each extracted block to prevent too much squishing
+                                page_text += text_content + "\n"
+                except Exception as img_e:
+                    logger.warning("Failed to process an image on page %d: %s", page_index + 1, img_e)
+    except Exception as page_e:
+        logger.warning("Failed to extract images from page %d: %s", page_index + 1, page_e)
+    return page_text
+
+
+def _ocr_page_chunk(file_path, page_indices):
+    """Worker task: OCR a chunk of pages and return [(page_index, text, seconds), ...]."""
+    ocr = _get_engine(OCR_THREADS_PER_WORKER)
+    reader = _open_reader(file_path)
+    results = []
+    for i in page_indices:
+        start = time.perf_counter()
+        text = ocr_page(ocr, reader.pages[i], i)
+        results.append((i, text, time.perf_counter() - start))
+    cache = get_ocr_cache()
+    if cache is not None:
+        cache.flush_stats()
+    return results
+
+
+def get_ocr_pool(workers=None):
+    """Return the shared OCR process pool, (re)creating it if the size changed."""
+    global _pool, _pool_workers
+    workers = workers or OCR_WORKERS
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False, cancel_futures=True)
+            logger.info("Starting OCR pool with %d workers", workers)
+            _pool = ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=_init_worker,
+                initargs=(OCR_THREADS_PER_WORKER,),
+            )
+            _pool_workers = workers
+        return _pool
+
+
+def shutdown_ocr_pool():
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+            _pool_workers = 0
+
+
+atexit.register(shutdown_ocr_pool)
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def iter_ocr_pages(file_path, num_pages, workers=None, chunk_size=None, progress_callback=None, pages=None):
+    """
+    Yield (page_index, text) for every page (or only for `pages`, a sorted list of
+    page indices), in page order.
+
+    With more than one worker the pages are split into chunks and OCR'd in the
+    shared process pool; a page is yielded as soon as it and every page before
+    it have finished. progress_callback(done, total) fires as pages complete.
+    """
+    workers = workers or OCR_WORKERS
+    chunk_size = chunk_size or OCR_CHUNK_SIZE
+    page_indices = list(pages) if pages is not None else list(range(num_pages))
+    total = len(page_indices)
+
+    # Serial path: not worth spinning up processes for tiny documents
+    if workers <= 1 or total <= chunk_size:
+        ocr = _get_engine()
+        reader = _open_reader(file_path)
+        for done, i in enumerate(page_indices, start=1):
+            if progress_callback:
+                progress_callback(done, total)
+            with INGEST_STAGE_SECONDS.time(stage="ocr_page"):
+                text = ocr_page(ocr, reader.pages[i], i)
+            yield i, text
+        return
+
+    pool = get_ocr_pool(workers)
+    futures = [pool.submit(_ocr_page_chunk, file_path, chunk) for chunk in _chunks(page_indices, chunk_size)]
+
+    finished = {}
+    next_pos = 0
+    done = 0
+    try:
+        for future in as_completed(futures):
+            for i, text, seconds in future.result():
+                # Timed in the worker; recorded here because metrics live in the API process
+                INGEST_STAGE_SECONDS.observe(seconds, stage="ocr_page")
+                finished[i] = text
+                done += 1
+                if progress_callback:
+                    progress_callback(done, total)
+            # Release every page that is now contiguous with what was already yielded
+            while next_pos < total and page_indices[next_pos] in finished:
+                i = page_indices[next_pos]
+                yield i, finished.pop(i)
+                next_pos += 1
+    finally:
+        for future in futures:
+            future.cancel()
@@ -0,0 +1,76 @@
+import os
+import asyncio
+
+# Configuration
+# How long the first question in a batch waits for company
+QUERY_BATCH_WINDOW_MS = float(os.environ.get("QUERY_BATCH_WINDOW_MS", 5))
+# Flush immediately once this many questions are waiting
+QUERY_BATCH_MAX_SIZE = int(os.environ.get("QUERY_BATCH_MAX_SIZE", 32))
+
+
+class MicroBatcher:
+    """
+    Collects items submitted from concurrent coroutines and runs them through
+    fn(list_of_items) -> list_of_results in one call on `executor`.
+
+    A batch is flushed when it reaches max_batch items or window_ms after its first
+    item arrived, whichever comes first. Identical items in a batch are computed once.
+    """
+
+    def __init__(self, fn, executor=None, max_batch=QUERY_BATCH_MAX_SIZE, window_ms=QUERY_BATCH_WINDOW_MS):
+        self.fn = fn
+        self.executor = executor
+        self.max_batch = max_batch
+        self.window = window_ms / 1000
+        self._pending = []
+        self._timer = None
+        # The loop only holds weak references to tasks; keep in-flight batches alive
+        self._tasks = set()
+        self.batches = 0
+        self.items = 0
+
+    async def submit(self, item):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch):
+        unique = list(dict.fromkeys(item for item, _ in batch))
+        self.batches += 1
+        self.items += len(batch)
+        try:
+            loop = asyncio.get_running_loop()
+            results = await loop.run_in_executor(self.executor, self.fn, unique)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        by_item = dict(zip(unique, results))
+        for item, future in batch:
+            if not future.done():
+                future.set_result(by_item[item])
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "max_batch": self.max_batch,
+            "window_ms": self.window * 1000,
+        }
@@ -0,0 +1,95 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from log_config import get_logger
+
+logger = get_logger("cache")
+
+# Configuration
+EMBEDDING_CACHE_SIZE = int(os.environ.get("EMBEDDING_CACHE_SIZE", 4096))
+EMBEDDING_CACHE_TTL = int(os.environ.get("EMBEDDING_CACHE_TTL", 24 * 60 * 60))
+ANSWER_CACHE_SIZE = int(os.environ.get("ANSWER_CACHE_SIZE", 1024))
+ANSWER_CACHE_TTL = int(os.environ.get("ANSWER_CACHE_TTL", 60 * 60))
+
+
+class LRUCache:
+    """Thread-safe LRU cache with a per-entry TTL."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, predicate):
+        """Drop every entry whose key matches predicate(key). Returns the number removed."""
+        with self._lock:
+            stale = [k for k in self._data if predicate(k)]
+            for k in stale:
+                del self._data[k]
+            return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+def normalize_question(question):
+    # MiniLM is uncased, so case and whitespace differences do not change the embedding
+    return " ".join(question.casefold().split())
+
+
+# Level 1: normalised question -> query embedding
+embedding_cache = LRUCache(EMBEDDING_CACHE_SIZE, EMBEDDING_CACHE_TTL)
+# Level 2: (question, folder, retrieved chunk IDs, model, prompt version) -> answer
+answer_cache = LRUCache(ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL)
+
+
+def answer_key(question, folder_name, chunk_ids, model_name, prompt_version):
+    return (normalize_question(question), folder_name or "All", tuple(chunk_ids), model_name, prompt_version)
+
+
+def invalidate_folder(folder_name):
+    """Forget cached answers that could have been drawn from this folder."""
+    removed = answer_cache.invalidate(lambda key: key[1] in (folder_name, "All"))
+    if removed:
+        logger.info("Invalidated %d cached answers for folder: %s", removed, folder_name)
+    return removed
+
+
+def get_cache_stats():
+    return {"embeddings": embedding_cache.stats(), "answers": answer_cache.stats()}
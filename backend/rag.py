@@ -1,56 +1,97 @@
 import os
+import re
 import time
+import logging
+import asyncio
+import functools
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from langchain_community.llms import Ollama
-from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain_qdrant import QdrantVectorStore
 from qdrant_client.http import models
 from langchain_core.prompts import PromptTemplate
 from langchain_core.runnables import RunnablePassthrough
 from langchain_core.output_parsers import StrOutputParser
-from database import get_qdrant_client
+from langchain_core.documents import Document
+from database import get_qdrant_client, get_async_qdrant_client
+from embedding_registry import get_embeddings
+from query_cache import embedding_cache, answer_cache, answer_key, normalize_question
+from query_batcher import MicroBatcher
+from generation_scheduler import GenerationScheduler, DEFAULT_PRIORITY
+from keyword_index import get_keyword_index, is_identifier_query
+from reranker import get_reranker, RERANK_CANDIDATES
+from context import assemble_context, count_tokens, prompt_stats
+import hashlib
+from log_config import get_logger, LOG_CHUNKS
+from metrics import RAG_STAGE_SECONDS, RAG_QUERIES, RAG_PROMPT_TOKENS
+
+logger = get_logger("rag")
 
 # Configuration
 COLLECTION_NAME = "local_documents"
 OLLAMA_MODEL = "llama3.2:1b"
+OLLAMA_BASE_URL = os.environ.get("OLLAMA_BASE_URL", "http://localhost:11434")
+# Bump whenever the prompt template changes so cached answers are not reused
+PROMPT_VERSION = "1"
+# Async query path: dedicated executors for CPU-bound embedding and blocking
+# Qdrant calls. Concurrent generations are capped by the generation scheduler.
+EMBED_THREADS = int(os.environ.get("EMBED_THREADS", 2))
+SEARCH_THREADS = int(os.environ.get("SEARCH_THREADS", 8))
+# Chunks passed to the LLM (after fusion and reranking)
+RETRIEVAL_K = 3
+# Hybrid retrieval: dense and BM25 candidates per query, fused with reciprocal rank fusion
+HYBRID_SEARCH = os.environ.get("HYBRID_SEARCH", "1") == "1"
+HYBRID_CANDIDATES = int(os.environ.get("HYBRID_CANDIDATES", 10))
+# Prepared per-folder retrievers kept; the folder comes from the client, so this is an LRU
+RETRIEVER_CACHE_SIZE = int(os.environ.get("RETRIEVER_CACHE_SIZE", 64))
+RRF_K = 60
+
+OOM_MESSAGE = (
+    "I apologize, but I cannot answer your question right now because the AI model "
+    "is too large for the available system memory. \n\n"
+    "Please try switching to a smaller model or close other applications to free up RAM."
+)
 
-# Global Model Singletons (Initializes only ONCE on startup)
-print("--- [RAG] Initializing Embeddings & LLM (Wait for it...) ---")
-embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
+# Global LLM Singleton (Initializes only ONCE on startup)
+# Embeddings come from the shared registry and are loaded lazily on first query.
+logger.info("Initializing LLM model=%s base_url=%s", OLLAMA_MODEL, OLLAMA_BASE_URL)
 llm = Ollama(
     model=OLLAMA_MODEL,
+    base_url=OLLAMA_BASE_URL,
     temperature=0,
     num_predict=64,
     top_p=0.9
 )
-print("--- [RAG] Models Loaded and Ready ---")
+logger.info("LLM ready")
 
-def get_rag_chain(folder_name: str = None):
-    # 2. Vector Store - Use Singleton
-    client = get_qdrant_client()
-    vector_store = QdrantVectorStore(
-        client=client, 
-        collection_name=COLLECTION_NAME, 
-        embedding=embeddings
-    )
-    
-    search_kwargs = {"k": 3}
-    if folder_name and folder_name != "All":
-        print(f"--- [RAG] Filtering by folder: {folder_name} ---")
-        # Use Qdrant's Filter model for better compatibility with langchain-qdrant
-        search_kwargs["filter"] = models.Filter(
-            must=[
-                models.FieldCondition(
-                    key="metadata.folder", 
-                    match=models.MatchValue(value=folder_name)
-                )
-            ]
-        )
-    
-    # Increase k for better context
-    retriever = vector_store.as_retriever(search_kwargs=search_kwargs)
-    
-    # 4. Prompt
-    template = """You are a STRICT document-grounded assistant.
+embed_executor = ThreadPoolExecutor(max_workers=EMBED_THREADS, thread_name_prefix="rag-embed")
+search_executor = ThreadPoolExecutor(max_workers=SEARCH_THREADS, thread_name_prefix="rag-search")
+_query_batcher = None
+_generation_scheduler = None
+
+def get_query_batcher():
+    """Micro-batcher that folds concurrent query embeddings into one forward pass."""
+    global _query_batcher
+    if _query_batcher is None:
+        _query_batcher = MicroBatcher(lambda texts: get_embeddings().embed_documents(texts), executor=embed_executor)
+    return _query_batcher
+
+def get_generation_scheduler():
+    """Admission control for Ollama: priorities, per-folder fairness, in-flight cap, dedup."""
+    global _generation_scheduler
+    if _generation_scheduler is None:
+        _generation_scheduler = GenerationScheduler()
+    return _generation_scheduler
+
+def generation_key(context_str: str, question: str):
+    # Identical rendered prompts against the same model share one generation
+    digest = hashlib.sha256()
+    for part in (OLLAMA_MODEL, PROMPT_VERSION, context_str, "\x00", question):
+        digest.update(part.encode("utf-8"))
+    return digest.hexdigest()
+
+PROMPT_TEMPLATE = """You are a STRICT document-grounded assistant.
 
 Your knowledge is LIMITED to the provided CONTEXT only.
 The CONTEXT may contain OCR text and may include noise.
@@ -106,116 +147,537 @@ CONTEXT:
 USER QUESTION:
 {question}
 """
+
+# Prepared objects: built once per process / per folder filter and reused by every query
+_vector_store = None
+_rag_chain = None
+_retrievers = OrderedDict()  # folder key -> retriever, least recently used first
+_prepared_lock = threading.Lock()
+
+def new_vector_store():
+    # 2. Vector Store - Use Singleton client
+    return QdrantVectorStore(
+        client=get_qdrant_client(), 
+        collection_name=COLLECTION_NAME, 
+        embedding=get_embeddings()
+    )
+
+def get_vector_store():
+    global _vector_store
+    if _vector_store is None:
+        _vector_store = new_vector_store()
+    return _vector_store
+
+def build_retriever(vector_store, folder_name: str = None):
+    search_kwargs = {"k": RETRIEVAL_K}
+    if folder_name and folder_name != "All":
+        # Use Qdrant's Filter model for better compatibility with langchain-qdrant
+        search_kwargs["filter"] = models.Filter(
+            must=[
+                models.FieldCondition(
+                    key="metadata.folder", 
+                    match=models.MatchValue(value=folder_name)
+                )
+            ]
+        )
     
-    prompt = PromptTemplate.from_template(template)
-    
-    # 5. Chain with LCEL
-    def format_docs(docs):
-        return "\n\n".join(doc.page_content for doc in docs)
+    # Increase k for better context
+    return vector_store.as_retriever(search_kwargs=search_kwargs)
+
+def build_chain():
+    # 4. Prompt
+    prompt = PromptTemplate.from_template(PROMPT_TEMPLATE)
 
-    rag_chain = (
+    # 5. Chain with LCEL
+    return (
         {"context": RunnablePassthrough(), "question": RunnablePassthrough()} 
         | prompt
         | llm
         | StrOutputParser()
     )
-    
-    return retriever, rag_chain
+
+def build_rag_chain(folder_name: str = None):
+    """Build the retriever and chain from scratch (what every query used to pay for)."""
+    return build_retriever(new_vector_store(), folder_name), build_chain()
+
+def _cached_retriever(key):
+    """Prepared retriever for a folder key, marked most recently used; None if not cached."""
+    try:
+        # Lock-free on the hot path: single OrderedDict operations are atomic under the GIL
+        _retrievers.move_to_end(key)
+        return _retrievers[key]
+    except KeyError:
+        return None
+
+def get_rag_chain(folder_name: str = None):
+    """Return the prepared (retriever, chain) for a folder filter, building it on first use."""
+    global _rag_chain
+    key = folder_name if folder_name and folder_name != "All" else "All"
+    retriever = _cached_retriever(key)
+    if retriever is None or _rag_chain is None:
+        with _prepared_lock:
+            if _rag_chain is None:
+                _rag_chain = build_chain()
+            retriever = _cached_retriever(key)
+            if retriever is None:
+                logger.info("Preparing retriever for folder %s", key)
+                retriever = build_retriever(get_vector_store(), folder_name)
+                _retrievers[key] = retriever
+                while len(_retrievers) > RETRIEVER_CACHE_SIZE:
+                    _retrievers.popitem(last=False)
+    return retriever, _rag_chain
+
+async def aget_rag_chain(folder_name: str = None):
+    """
+    get_rag_chain for the event loop. A cold build loads the embedding model and talks to
+    Qdrant under _prepared_lock, so it runs on a worker thread instead of stalling the loop.
+    """
+    key = folder_name if folder_name and folder_name != "All" else "All"
+    retriever = _cached_retriever(key)
+    if retriever is not None and _rag_chain is not None:
+        return retriever, _rag_chain
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(search_executor, get_rag_chain, folder_name)
+
+def invalidate_rag_chain(folder_name: str = None):
+    """Drop prepared retrievers (one folder, or all of them when folder_name is None)."""
+    global _vector_store, _rag_chain
+    with _prepared_lock:
+        if folder_name is None:
+            _retrievers.clear()
+            _vector_store = None
+            _rag_chain = None
+        else:
+            _retrievers.pop(folder_name, None)
+
+def embed_question(question: str):
+    """Query embedding, served from the LRU cache for repeated questions."""
+    key = normalize_question(question)
+    vector = embedding_cache.get(key)
+    if vector is None:
+        with RAG_STAGE_SECONDS.time(stage="embed"):
+            vector = get_embeddings().embed_query(key)
+        embedding_cache.put(key, vector)
+    else:
+        logger.debug("Query embedding cache hit")
+    return vector
+
+def build_context(docs, question: str):
+    """Assembled CONTEXT string plus the full prompt size (prefill tokens), recorded per request."""
+    with RAG_STAGE_SECONDS.time(stage="context"):
+        context_str, stats = assemble_context(docs)
+        prompt_tokens = count_tokens(PROMPT_TEMPLATE.format(context=context_str, question=question))
+    prompt_stats.record(prompt_tokens, stats["truncated"])
+    RAG_PROMPT_TOKENS.observe(prompt_tokens)
+    stats["prompt_tokens"] = prompt_tokens
+    logger.info(
+        "Context: %d/%d chunks, %d tokens (%d overlap chars removed, truncated=%s); prompt %d tokens",
+        stats["chunks_used"], stats["chunks_in"], stats["context_tokens"],
+        stats["overlap_chars_removed"], stats["truncated"], prompt_tokens,
+    )
+    return context_str, stats
+
+_FIELD_RE = re.compile(r'(\b[A-Za-z\s]+:\s*|\b[A-Z][a-z]+(?:\s+[A-Z][a-z]+)*\b|\b[A-Z]+(?:\s+[A-Z]+)*\b)')
+
+class ChunkDump:
+    """
+    Key: Value rendering of retrieved chunks for debugging. Only built when str() is
+    called, i.e. on the log listener thread and only if the record is emitted.
+    """
+
+    def __init__(self, docs):
+        self.docs = docs
+
+    def __str__(self):
+        out = []
+        for i, doc in enumerate(self.docs):
+            out.append("═" * 70)
+            out.append(f"CHUNK {i+1} FULL DATA")
+            out.append("═" * 70)
+            # Full raw text, with line breaks injected before anything that looks like a
+            # label ("Name:"), a Title Case phrase or an UPPERCASE phrase
+            formatted_text = _FIELD_RE.sub(r'\n\1', doc.page_content.strip())
+            for line in formatted_text.split('\n'):
+                line = line.strip()
+                if not line:
+                    continue
+                if ':' in line:
+                    key, value = line.split(':', 1)
+                    out.append(f"{key.strip().ljust(25)} : {value.strip()}")
+                else:
+                    out.append(line)
+        return "\n".join(out)
+
+def log_chunks(docs):
+    """Opt-in chunk dump (LOG_CHUNKS=1 and LOG_LEVEL=DEBUG); free otherwise."""
+    if LOG_CHUNKS and logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Retrieved chunks:\n%s", ChunkDump(docs))
+
+def keyword_search(question: str, folder_name: str = None):
+    """BM25 point IDs for the question, best first (empty when hybrid search is off)."""
+    keyword_index = get_keyword_index() if HYBRID_SEARCH else None
+    if keyword_index is None:
+        return []
+    folder = folder_name if folder_name and folder_name != "All" else None
+    with RAG_STAGE_SECONDS.time(stage="keyword"):
+        return [pid for pid, _ in keyword_index.search(question, folder=folder, k=HYBRID_CANDIDATES)]
+
+def fuse_rrf(*rankings, k=RRF_K):
+    """Reciprocal rank fusion of ranked ID lists."""
+    scores = {}
+    for ranking in rankings:
+        for rank, pid in enumerate(ranking):
+            scores[pid] = scores.get(pid, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
+
+def fetch_documents(point_ids):
+    if not point_ids:
+        return []
+    points = get_qdrant_client().retrieve(collection_name=COLLECTION_NAME, ids=point_ids, with_payload=True)
+    return [point_to_document(p) for p in points]
+
+def doc_id(doc):
+    return str(doc.metadata.get("_id"))
+
+def hybrid_top_ids(dense_docs, sparse_ids, limit=RETRIEVAL_K):
+    """Top `limit` point IDs by RRF over the dense and sparse rankings."""
+    return fuse_rrf([doc_id(doc) for doc in dense_docs], sparse_ids)[:limit]
+
+def missing_ids(ids, docs):
+    have = {doc_id(doc) for doc in docs}
+    return [pid for pid in ids if pid not in have]
+
+def order_documents(ids, *doc_lists):
+    by_id = {}
+    for docs in doc_lists:
+        for doc in docs:
+            by_id.setdefault(doc_id(doc), doc)
+    return [by_id[pid] for pid in ids if pid in by_id]
+
+def candidate_count(sparse_ids):
+    """How many chunks to pull from retrieval before reranking/fusion narrows them to RETRIEVAL_K."""
+    k = RETRIEVAL_K
+    if sparse_ids:
+        k = max(k, HYBRID_CANDIDATES)
+    if get_reranker() is not None:
+        k = max(k, RERANK_CANDIDATES)
+    return k
+
+def rerank_documents(question: str, docs):
+    """Cross-encoder rerank down to RETRIEVAL_K; [] when nothing clears the score threshold."""
+    reranker = get_reranker()
+    if reranker is None or not docs:
+        return docs[:RETRIEVAL_K]
+    with RAG_STAGE_SECONDS.time(stage="rerank"):
+        return reranker.rerank(question, docs, top_k=RETRIEVAL_K)
+
+def retrieve(question: str, folder_name: str = None):
+    """Embed (cached), search, fuse with BM25 hits and rerank. Returns (docs, answer_cache_key)."""
+    retriever, _ = get_rag_chain(folder_name)
+    sparse_ids = keyword_search(question, folder_name)
+    k = candidate_count(sparse_ids)
+    if sparse_ids and is_identifier_query(question):
+        # Identifier lookup: the inverted index answers it without embedding the query
+        logger.info("Identifier fast path: %d keyword hits", len(sparse_ids))
+        top = sparse_ids[:k]
+        docs = order_documents(top, fetch_documents(top))
+    else:
+        query_vector = embed_question(question)
+        search_kwargs = dict(retriever.search_kwargs, k=k)
+        with RAG_STAGE_SECONDS.time(stage="search"):
+            docs = retriever.vectorstore.similarity_search_by_vector(query_vector, **search_kwargs)
+            if sparse_ids:
+                top = hybrid_top_ids(docs, sparse_ids, limit=k)
+                docs = order_documents(top, docs, fetch_documents(missing_ids(top, docs)))
+    docs = rerank_documents(question, docs)
+    cache_key = answer_key(
+        question, folder_name, [doc.metadata.get("_id") for doc in docs], OLLAMA_MODEL, PROMPT_VERSION
+    )
+    return docs, cache_key
+
+async def aembed_question(question: str):
+    key = normalize_question(question)
+    vector = embedding_cache.get(key)
+    if vector is None:
+        with RAG_STAGE_SECONDS.time(stage="embed"):
+            vector = await get_query_batcher().submit(key)
+        embedding_cache.put(key, vector)
+    return vector
+
+def point_to_document(point):
+    # Mirror QdrantVectorStore's payload -> Document mapping
+    payload = point.payload or {}
+    metadata = dict(payload.get("metadata") or {})
+    metadata["_id"] = point.id
+    metadata["_collection_name"] = COLLECTION_NAME
+    return Document(page_content=payload.get("page_content", ""), metadata=metadata)
+
+async def afetch_documents(point_ids):
+    if not point_ids:
+        return []
+    aclient = get_async_qdrant_client()
+    if aclient is None:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(search_executor, fetch_documents, point_ids)
+    points = await aclient.retrieve(collection_name=COLLECTION_NAME, ids=point_ids, with_payload=True)
+    return [point_to_document(p) for p in points]
+
+async def aretrieve(question: str, folder_name: str = None):
+    """Non-blocking retrieve(): embedding on the embed executor, search on the async client if configured."""
+    retriever, _ = await aget_rag_chain(folder_name)
+    loop = asyncio.get_running_loop()
+    sparse_ids = await loop.run_in_executor(search_executor, keyword_search, question, folder_name)
+    k = candidate_count(sparse_ids)
+    if sparse_ids and is_identifier_query(question):
+        logger.info("Identifier fast path: %d keyword hits", len(sparse_ids))
+        top = sparse_ids[:k]
+        docs = order_documents(top, await afetch_documents(top))
+    else:
+        search_kwargs = dict(retriever.search_kwargs, k=k)
+        query_vector = await aembed_question(question)
+
+        search_start = time.perf_counter()
+        aclient = get_async_qdrant_client()
+        if aclient is not None:
+            points = await aclient.search(
+                collection_name=COLLECTION_NAME,
+                query_vector=query_vector,
+                query_filter=search_kwargs.get("filter"),
+                limit=k,
+                with_payload=True,
+            )
+            docs = [point_to_document(p) for p in points]
+        else:
+            docs = await loop.run_in_executor(
+                search_executor,
+                functools.partial(retriever.vectorstore.similarity_search_by_vector, query_vector, **search_kwargs),
+            )
+        if sparse_ids:
+            top = hybrid_top_ids(docs, sparse_ids, limit=k)
+            docs = order_documents(top, docs, await afetch_documents(missing_ids(top, docs)))
+        RAG_STAGE_SECONDS.observe(time.perf_counter() - search_start, stage="search")
+
+    # Cross-encoder scoring is CPU-bound: run it beside the query embeddings
+    docs = await loop.run_in_executor(embed_executor, rerank_documents, question, docs)
+    cache_key = answer_key(
+        question, folder_name, [doc.metadata.get("_id") for doc in docs], OLLAMA_MODEL, PROMPT_VERSION
+    )
+    return docs, cache_key
+
+async def agenerate(chain, inputs):
+    """
+    Run the chain to completion. Streams internally so prefill (time to first token)
+    and decode are timed separately; the result is the same as chain.ainvoke.
+    """
+    start = time.perf_counter()
+    first = None
+    parts = []
+    async for token in chain.astream(inputs):
+        if first is None:
+            first = time.perf_counter()
+            RAG_STAGE_SECONDS.observe(first - start, stage="llm_prefill")
+        parts.append(token)
+    end = time.perf_counter()
+    if first is not None:
+        RAG_STAGE_SECONDS.observe(end - first, stage="llm_decode")
+    RAG_STAGE_SECONDS.observe(end - start, stage="llm")
+    return "".join(parts)
+
+async def aquery_rag(question: str, folder_name: str = None, priority: int = DEFAULT_PRIORITY):
+    """Async query_rag: no threadpool thread is held while waiting on Qdrant or Ollama."""
+    logger.info("Query received: %s", question, extra={"folder": folder_name})
+    start_time = time.time()
+
+    try:
+        docs, cache_key = await aretrieve(question, folder_name)
+        logger.info("Retrieved %d chunks", len(docs))
+    except Exception as e:
+        logger.error("Retrieval failed: %s", e, exc_info=True)
+        RAG_QUERIES.inc(outcome="error")
+        return "Error accessing document database."
+
+    if not docs:
+        logger.info("No relevant documents found; skipping generation")
+        RAG_QUERIES.inc(outcome="no_docs")
+        return "Data not found in document."
+
+    cached = answer_cache.get(cache_key)
+    if cached is not None:
+        logger.info("Answer cache hit in %.3fs", time.time() - start_time)
+        RAG_QUERIES.inc(outcome="cached")
+        RAG_STAGE_SECONDS.observe(time.time() - start_time, stage="total")
+        return cached
+
+    log_chunks(docs)
+    context_str, _ = build_context(docs, question)
+    _, chain = await aget_rag_chain(folder_name)
+
+    inputs = {"context": context_str, "question": question}
+    try:
+        result = await get_generation_scheduler().submit(
+            generation_key(context_str, question),
+            lambda: agenerate(chain, inputs),
+            tenant=folder_name or "All",
+            priority=priority,
+        )
+    except Exception as e:
+        error_msg = str(e)
+        if "model requires more system memory" in error_msg:
+             logger.error("Ollama out of memory: %s", error_msg)
+             RAG_QUERIES.inc(outcome="oom")
+             return OOM_MESSAGE
+        RAG_QUERIES.inc(outcome="error")
+        raise e
+
+    answer_cache.put(cache_key, result)
+    RAG_QUERIES.inc(outcome="answered")
+    RAG_STAGE_SECONDS.observe(time.time() - start_time, stage="total")
+    logger.info("Answer generated in %.2fs: %s", time.time() - start_time, result)
+    return result
+
+def describe_chunks(docs):
+    return [
+        {
+            "id": doc.metadata.get("_id"),
+            "source": os.path.basename(doc.metadata.get("source", "")),
+            "page": doc.metadata.get("page"),
+            "folder": doc.metadata.get("folder"),
+        }
+        for doc in docs
+    ]
+
+async def astream_rag(question: str, folder_name: str = None, priority: int = DEFAULT_PRIORITY):
+    """
+    Streaming variant of query_rag. Yields (event, data) pairs: one "retrieval" event with
+    the chunk metadata, then "token" events as the LLM produces them, then "done" with
+    timings. Closing the generator (client disconnect) cancels the Ollama request.
+    """
+    start_time = time.perf_counter()
+    logger.info("Streaming query received: %s", question, extra={"folder": folder_name})
+
+    try:
+        docs, cache_key = await aretrieve(question, folder_name)
+    except Exception as e:
+        logger.error("Retrieval failed: %s", e, exc_info=True)
+        RAG_QUERIES.inc(outcome="error")
+        yield "error", {"message": "Error accessing document database."}
+        return
+
+    retrieval_ms = (time.perf_counter() - start_time) * 1000
+    yield "retrieval", {"chunks": describe_chunks(docs), "retrieval_ms": round(retrieval_ms, 1)}
+
+    if not docs:
+        RAG_QUERIES.inc(outcome="no_docs")
+        yield "token", {"text": "Data not found in document."}
+        yield "done", {"ttft_ms": None, "total_ms": round(retrieval_ms, 1), "cached": False}
+        return
+
+    cached = answer_cache.get(cache_key)
+    if cached is not None:
+        total_ms = (time.perf_counter() - start_time) * 1000
+        RAG_QUERIES.inc(outcome="cached")
+        RAG_STAGE_SECONDS.observe(total_ms / 1000, stage="total")
+        yield "token", {"text": cached}
+        yield "done", {"ttft_ms": round(total_ms, 1), "total_ms": round(total_ms, 1), "cached": True}
+        return
+
+    _, chain = await aget_rag_chain(folder_name)
+    context_str, context_stats = build_context(docs, question)
+    parts = []
+    ttft_ms = None
+    completed = False
+    failed = False
+    try:
+        async with get_generation_scheduler().slot(tenant=folder_name or "All", priority=priority):
+            llm_start = time.perf_counter()
+            async for token in chain.astream({"context": context_str, "question": question}):
+                if ttft_ms is None:
+                    first_token = time.perf_counter()
+                    RAG_STAGE_SECONDS.observe(first_token - llm_start, stage="llm_prefill")
+                    ttft_ms = (first_token - start_time) * 1000
+                    logger.info("Time to first token: %.0f ms", ttft_ms)
+                parts.append(token)
+                yield "token", {"text": token}
+        completed = True
+        llm_end = time.perf_counter()
+        if ttft_ms is not None:
+            RAG_STAGE_SECONDS.observe(llm_end - first_token, stage="llm_decode")
+        RAG_STAGE_SECONDS.observe(llm_end - llm_start, stage="llm")
+    except Exception as e:
+        logger.error("Streaming generation failed: %s", e, exc_info=True)
+        RAG_QUERIES.inc(outcome="error")
+        failed = True
+        yield "error", {"message": str(e)}
+        return
+    finally:
+        if not completed and not failed:
+            RAG_QUERIES.inc(outcome="abandoned")
+            logger.info("Stream abandoned after %d tokens; generation cancelled", len(parts))
+
+    total_ms = (time.perf_counter() - start_time) * 1000
+    answer = "".join(parts)
+    answer_cache.put(cache_key, answer)
+    RAG_QUERIES.inc(outcome="answered")
+    RAG_STAGE_SECONDS.observe(total_ms / 1000, stage="total")
+    logger.info("Streamed answer in %.0f ms (TTFT %.0f ms)", total_ms, ttft_ms or 0)
+    yield "done", {
+        "ttft_ms": round(ttft_ms, 1) if ttft_ms else None,
+        "total_ms": round(total_ms, 1),
+        "cached": False,
+        "prompt_tokens": context_stats["prompt_tokens"],
+    }
 
 def query_rag(question: str, folder_name: str = None):
-    print("\n" + "🚀 " + "="*50)
-    print(f"--- [RAG] NEW USER QUERY RECEIVED ---")
-    print(f"--- [QUESTION]: {question}")
-    print("="*50)
-    
+    logger.info("Query received: %s", question, extra={"folder": folder_name})
+
     start_time = time.time()
     
     # STEP 1: RETRIEVAL
-    print(f"\n🔍 [STEP 1/4]: Searching document database for relevant sections...")
-    
-    retriever, chain = get_rag_chain(folder_name)
+    logger.debug("Step 1/2: searching document database")
+
+    _, chain = get_rag_chain(folder_name)
     
     try:
-        docs = retriever.invoke(question)
-        print(f"--- [RAG] Retrieved {len(docs)} chunks ---")
+        docs, cache_key = retrieve(question, folder_name)
+        logger.info("Retrieved %d chunks", len(docs))
         
         if not docs:
-            print(f"❌ [RAG] No documents found. Aborting generation.")
+            logger.info("No relevant documents found; skipping generation")
             return "Data not found in document."
-            
-        import re
-        # Print the fully retrieved data to the terminal in Key: Value format
-        for i, doc in enumerate(docs):
-            print(f"\n" + "═"*70)
-            print(f"📄 [RAG] CHUNK {i+1} FULL DATA")
-            print("═"*70)
-            
-            # To guarantee NO data is lost, we print the FULL raw text but add line breaks 
-            # before known labels and headers so it resembles a key-value layout.
-            import re
-            text = doc.page_content.strip()
-            
-            # Identify likely fields generically. Instead of hardcoding "Date" or "Phone",
-            # we look for:
-            # 1. Any word(s) ending in a colon (e.g. "Name:")
-            # 2. Or any sequence of Title Case words (e.g. "Invoice Number")
-            # 3. Or any sequence of UPPERCASE words (e.g. "TOTAL AMOUNT")
-            # and inject newlines before them to create a dynamic list format for ANY document.
-            formatted_text = re.sub(
-                r'(\b[A-Za-z\s]+:\s*|\b[A-Z][a-z]+(?:\s+[A-Z][a-z]+)*\b|\b[A-Z]+(?:\s+[A-Z]+)*\b)', 
-                r'\n\1', 
-                text
-            )
-            
-            # Clean and print every single piece of data
-            lines = [line.strip() for line in formatted_text.split('\n') if line.strip()]
-            
-            for line in lines:
-                # If there's a natural split like 'Phone: 123', make it neat
-                if ':' in line:
-                    parts = line.split(':', 1)
-                    print(f"{parts[0].strip().ljust(25)} : {parts[1].strip()}")
-                else:
-                    # Otherwise print the whole phrase cleanly
-                    print(line)
-                
-                print() # Keep the empty gap between lines
-            
-            print("═"*70 + "\n")
-        context_str = "\n\n".join(doc.page_content for doc in docs)
+
+        # Same question over the same retrieved chunks -> same answer
+        cached = answer_cache.get(cache_key)
+        if cached is not None:
+            logger.info("Answer cache hit in %.3fs", time.time() - start_time)
+            return cached
+
+        log_chunks(docs)
+        context_str, _ = build_context(docs, question)
         
     except Exception as e:
-        print(f"❌ [RAG ERROR] Retrieval failed: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.error("Retrieval failed: %s", e, exc_info=True)
         return "Error accessing document database."
 
     # STEP 2: GENERATION
-    print(f"🧠 [STEP 2/4]: Found relevant info. Thinking & formulating response...")
-    
+    logger.debug("Step 2/2: generating answer")
+
     try:
         # Pass context and question explicitly
-        result = chain.invoke({"context": context_str, "question": question})
+        with RAG_STAGE_SECONDS.time(stage="llm"):
+            result = chain.invoke({"context": context_str, "question": question})
     except Exception as e:
         error_msg = str(e)
         if "model requires more system memory" in error_msg:
-             print(f"❌ [RAG ERROR]: OOM Error: {error_msg}")
-             return (
-                 "I apologize, but I cannot answer your question right now because the AI model "
-                 "is too large for the available system memory. \n\n"
-                 "Please try switching to a smaller model or close other applications to free up RAM."
-             )
+             logger.error("Ollama out of memory: %s", error_msg)
+             return OOM_MESSAGE
         raise e
     
     end_time = time.time()
     total_time = end_time - start_time
     
-    # STEP 3 & 4: SUCCESS
-    print(f"✨ [STEP 3/4]: Response formulated successfully.")
-    print(f"📝 [STEP 4/4]: Final Answer generated in {total_time:.2f}s.")
-    
-    print("\n" + "🤖 " + "-"*50)
-    print(f"--- [RAG] BOT REPLY ---")
-    print(f"{result}")
-    print("-"*50 + "\n")
+    answer_cache.put(cache_key, result)
+    RAG_QUERIES.inc(outcome="answered")
+    RAG_STAGE_SECONDS.observe(total_time, stage="total")
+
+    logger.info("Answer generated in %.2fs: %s", total_time, result)
     return result
@@ -0,0 +1,141 @@
+import os
+import time
+import threading
+from embedding_registry import EMBEDDING_DEVICE
+from context import count_tokens, CONTEXT_TOKEN_BUDGET
+from log_config import get_logger
+
+logger = get_logger("rerank")
+
+# Configuration
+# Off by default: the cross-encoder is a separate HF download. When enabled it is
+# loaded at startup (preload_reranker), never on the first query.
+RERANK_ENABLED = os.environ.get("RERANK_ENABLED", "0") == "1"
+RERANK_MODEL = os.environ.get("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+# Candidates fetched from retrieval and scored per query
+RERANK_CANDIDATES = int(os.environ.get("RERANK_CANDIDATES", 20))
+# (question, chunk) pairs per cross-encoder forward pass
+RERANK_BATCH_SIZE = int(os.environ.get("RERANK_BATCH_SIZE", 16))
+# Chunks scoring below this (ms-marco logits; clearly unrelated text is around -10)
+# are dropped. If none survive, the LLM is not called at all.
+RERANK_MIN_SCORE = float(os.environ.get("RERANK_MIN_SCORE", -7.0))
+# Upper bound on context tokens kept after reranking
+RERANK_TOKEN_BUDGET = int(os.environ.get("RERANK_TOKEN_BUDGET", CONTEXT_TOKEN_BUDGET))
+RERANK_MAX_LENGTH = 512
+
+
+class Reranker:
+    """
+    Cross-encoder reranking of retrieval candidates. Scores every (question, chunk)
+    pair jointly, which is far more precise than the bi-encoder ANN ranking, then
+    keeps the best chunks that fit the token budget.
+    """
+
+    def __init__(self, model_name=RERANK_MODEL, device=EMBEDDING_DEVICE, batch_size=RERANK_BATCH_SIZE):
+        self.model_name = model_name
+        self.device = device
+        self.batch_size = batch_size
+        self._model = None
+        self._lock = threading.Lock()
+        self.queries = 0
+        self.pairs_scored = 0
+        self.total_ms = 0.0
+        self.all_below_threshold = 0
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    from sentence_transformers import CrossEncoder
+                    logger.info("Loading cross-encoder '%s' on %s", self.model_name, self.device)
+                    start = time.perf_counter()
+                    self._model = CrossEncoder(self.model_name, device=self.device, max_length=RERANK_MAX_LENGTH)
+                    logger.info("Cross-encoder ready in %.2fs", time.perf_counter() - start)
+        return self._model
+
+    def score(self, question, texts):
+        if not texts:
+            return []
+        scores = self.model.predict(
+            [(question, text) for text in texts], batch_size=self.batch_size, show_progress_bar=False
+        )
+        return [float(s) for s in scores]
+
+    def rerank(self, question, docs, top_k, min_score=RERANK_MIN_SCORE, token_budget=RERANK_TOKEN_BUDGET):
+        """
+        Best `top_k` docs by cross-encoder score that clear `min_score` and fit in
+        `token_budget` (the best doc is always kept if it clears the threshold).
+        Returns [] when nothing is relevant enough to send to the LLM.
+        """
+        start = time.perf_counter()
+        scores = self.score(question, [doc.page_content for doc in docs])
+        ranked = sorted(zip(docs, scores), key=lambda pair: pair[1], reverse=True)
+
+        kept = []
+        used_tokens = 0
+        for doc, score in ranked:
+            if len(kept) >= top_k or score < min_score:
+                break
+            tokens = count_tokens(doc.page_content)
+            if kept and used_tokens + tokens > token_budget:
+                break
+            doc.metadata["rerank_score"] = score
+            kept.append(doc)
+            used_tokens += tokens
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.queries += 1
+        self.pairs_scored += len(docs)
+        self.total_ms += elapsed_ms
+        if docs and not kept:
+            self.all_below_threshold += 1
+        logger.debug(
+            "%d candidates -> %d kept (best %.2f, ~%d tokens) in %.0f ms",
+            len(docs), len(kept), ranked[0][1] if ranked else float("nan"), used_tokens, elapsed_ms,
+        )
+        return kept
+
+    def stats(self):
+        return {
+            "model": self.model_name,
+            "loaded": self._model is not None,
+            "queries": self.queries,
+            "pairs_scored": self.pairs_scored,
+            "avg_ms": round(self.total_ms / self.queries, 2) if self.queries else 0.0,
+            "all_below_threshold": self.all_below_threshold,
+            "min_score": RERANK_MIN_SCORE,
+            "token_budget": RERANK_TOKEN_BUDGET,
+        }
+
+
+_reranker = None
+_reranker_lock = threading.Lock()
+
+
+def get_reranker():
+    """Shared reranker, or None when disabled."""
+    global _reranker
+    if not RERANK_ENABLED:
+        return None
+    if _reranker is None:
+        with _reranker_lock:
+            if _reranker is None:
+                _reranker = Reranker()
+    return _reranker
+
+
+def preload_reranker():
+    """
+    Load the cross-encoder at startup. If it cannot be loaded (e.g. offline with no
+    cached model), log why and turn reranking off rather than failing every query.
+    """
+    global RERANK_ENABLED
+    reranker = get_reranker()
+    if reranker is None:
+        return
+    try:
+        reranker.model
+    except Exception as e:
+        RERANK_ENABLED = False
+        logger.error("Reranking disabled: could not load cross-encoder '%s': %s", reranker.model_name, e, exc_info=True)
@@ -2,6 +2,9 @@ import React, { useState } from 'react';
 import axios from 'axios';
 import { Upload, FileText, CheckCircle, AlertCircle, Loader2 } from 'lucide-react';
 
+// Consecutive failed status polls before the upload is reported as failed
+const MAX_POLL_FAILURES = 5;
+
 const FileUpload = ({ onUploadSuccess, activeFolder }) => {
     const [status, setStatus] = useState('idle'); // idle, uploading, success, error, partial
     const [message, setMessage] = useState('');
@@ -26,40 +29,9 @@ const FileUpload = ({ onUploadSuccess, activeFolder }) => {
             formData.append('folder', activeFolder || "default");
             formData.append('job_id', jobId);
 
-            // Start polling for OCR progress
-            const pollInterval = setInterval(async () => {
-                try {
-                    const res = await axios.get(`http://127.0.0.1:8000/upload-status/${jobId}`);
-                    if (res.data && res.data.status === 'processing') {
-                        setOcrProgress({
-                            current: res.data.current_page,
-                            total: res.data.total_pages,
-                            percent: res.data.progress
-                        });
-                        setMessage(`OCR Processing: Page ${res.data.current_page}/${res.data.total_pages} (${res.data.progress}%)`);
-                    } else if (res.data.status === 'completed') {
-                        clearInterval(pollInterval);
-                    }
-                } catch (err) {
-                    console.error("Polling error:", err);
-                }
-            }, 1000);
-
-            try {
-                const response = await axios.post('http://127.0.0.1:8000/upload/', formData, {
-                    headers: { 'Content-Type': 'multipart/form-data' },
-                    onUploadProgress: (progressEvent) => {
-                        const percentCompleted = Math.round((progressEvent.loaded * 100) / progressEvent.total);
-                        setProgress(percentCompleted);
-                        if (percentCompleted === 100) {
-                            setMessage("Upload complete. Waiting for OCR extraction...");
-                        }
-                    }
-                });
-
-                clearInterval(pollInterval);
-                const results = response.data.results;
-                const failures = results.filter(r => r.status === 'failed' || r.status === 'error');
+            // Settle the UI once the background job has finished
+            const finish = (results) => {
+                const failures = results.filter(r => r.status !== 'success');
                 const successes = results.filter(r => r.status === 'success');
 
                 if (failures.length === 0) {
@@ -76,6 +48,55 @@ const FileUpload = ({ onUploadSuccess, activeFolder }) => {
                 setDetails(results);
 
                 if (successes.length > 0 && onUploadSuccess) onUploadSuccess();
+            };
+
+            try {
+                await axios.post('http://127.0.0.1:8000/upload/', formData, {
+                    headers: { 'Content-Type': 'multipart/form-data' },
+                    onUploadProgress: (progressEvent) => {
+                        const percentCompleted = Math.round((progressEvent.loaded * 100) / progressEvent.total);
+                        setProgress(percentCompleted);
+                        if (percentCompleted === 100) {
+                            setMessage("Upload complete. Waiting for OCR extraction...");
+                        }
+                    }
+                });
+
+                // The server queued the job; poll until the ingestion workers are done
+                let pollFailures = 0;
+                const stopPolling = (errorMsg) => {
+                    clearInterval(pollInterval);
+                    setStatus('error');
+                    setMessage(errorMsg);
+                };
+                const pollInterval = setInterval(async () => {
+                    try {
+                        const res = await axios.get(`http://127.0.0.1:8000/upload-status/${jobId}`);
+                        pollFailures = 0;
+                        if (res.data && res.data.error) {
+                            // e.g. the job expired from the status store
+                            stopPolling(`Upload status unavailable: ${res.data.error}`);
+                        } else if (res.data && res.data.status === 'processing') {
+                            setOcrProgress({
+                                current: res.data.current_page,
+                                total: res.data.total_pages,
+                                percent: res.data.progress
+                            });
+                            setMessage(`OCR Processing: Page ${res.data.current_page}/${res.data.total_pages} (${res.data.progress}%)`);
+                        } else if (res.data && res.data.status === 'queued') {
+                            setMessage("Waiting for an ingestion worker...");
+                        } else if (res.data && res.data.files) {
+                            clearInterval(pollInterval);
+                            finish(res.data.files);
+                        }
+                    } catch (err) {
+                        console.error("Polling error:", err);
+                        pollFailures += 1;
+                        if (pollFailures >= MAX_POLL_FAILURES) {
+                            stopPolling(`Lost contact with the server: ${err.response?.data?.detail || err.message}`);
+                        }
+                    }
+                }, 1000);
 
             } catch (error) {
                 console.error(error);